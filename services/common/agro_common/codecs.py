@@ -0,0 +1,178 @@
+"""Kafka payload codecs shared by the ingestion API, the consumer and the simulator.
+
+Producers pick a codec per topic and name it in the ``codec`` message header.
+Messages without that header predate the codec layer and are read as JSON, so
+old messages still left in a topic stay readable.
+
+- ``json``    : stdlib JSON, ISO-8601 timestamps (legacy wire format).
+- ``orjson``  : same wire format as ``json``, encoded/decoded with orjson.
+- ``msgpack`` : compact positional layout (Avro style: the field order is fixed by
+  the schema, so field names are not sent) with epoch-millisecond timestamps.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+CODEC_HEADER = "codec"
+DEFAULT_CODEC = "json"
+
+Headers = List[Tuple[str, bytes]]
+
+# Positional layouts of the msgpack codec; the first array item is the schema tag.
+SENSOR_SCHEMA = ("sensor_id", "type", "value", "timestamp", "metadata")
+WEATHER_SCHEMA = ("station_id", "metric", "value", "units", "timestamp", "metadata")
+_SCHEMAS = {0: SENSOR_SCHEMA, 1: WEATHER_SCHEMA}
+
+
+class CodecError(ValueError):
+    """Raised when a payload cannot be encoded or decoded."""
+
+
+def _to_epoch_ms(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    return value
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message: Mapping[str, Any]) -> bytes:
+        return json.dumps(message, default=_json_default).encode("utf-8")
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise CodecError("orjson is not installed")
+
+    def encode(self, message: Mapping[str, Any]) -> bytes:
+        # OPT_NAIVE_UTC keeps naive utcnow() timestamps unambiguous on the wire.
+        return orjson.dumps(message, option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise CodecError("msgpack is not installed")
+
+    def encode(self, message: Mapping[str, Any]) -> bytes:
+        tag = 1 if "station_id" in message else 0
+        row = [tag]
+        for field in _SCHEMAS[tag]:
+            value = message.get(field)
+            row.append(_to_epoch_ms(value) if field == "timestamp" else value)
+        return msgpack.packb(row, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        row = msgpack.unpackb(data, raw=False)
+        schema = _SCHEMAS.get(row[0]) if isinstance(row, list) and row else None
+        if schema is None or len(row) != len(schema) + 1:
+            raise CodecError("Unknown msgpack payload layout")
+        message = dict(zip(schema, row[1:]))
+        if message["timestamp"] is None:
+            del message["timestamp"]
+        return message
+
+
+_FACTORIES = {
+    JsonCodec.name: JsonCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+_instances: Dict[str, Any] = {}
+
+
+def get_codec(name: str):
+    codec = _instances.get(name)
+    if codec is None:
+        factory = _FACTORIES.get(name)
+        if factory is None:
+            raise CodecError(f"Unknown codec '{name}' (expected one of {sorted(_FACTORIES)})")
+        codec = _instances[name] = factory()
+    return codec
+
+
+def parse_topic_codecs(raw: str) -> Dict[str, str]:
+    """Parse ``topic=codec,topic=codec`` (e.g. from KAFKA_TOPIC_CODECS)."""
+    mapping = {}
+    for entry in raw.split(","):
+        if "=" not in entry:
+            continue
+        topic, codec = (part.strip() for part in entry.split("=", 1))
+        if topic and codec:
+            get_codec(codec)
+            mapping[topic] = codec
+    return mapping
+
+
+class TopicCodecs:
+    """Chooses the codec of each topic and builds the matching message header."""
+
+    def __init__(self, topic_codecs: Optional[Mapping[str, str]] = None, default: str = DEFAULT_CODEC):
+        self._topic_codecs = dict(topic_codecs or {})
+        self._default = default
+        get_codec(default)
+
+    def codec_for(self, topic: str):
+        return get_codec(self._topic_codecs.get(topic, self._default))
+
+    def encode(self, topic: str, message: Mapping[str, Any]) -> Tuple[bytes, Headers]:
+        codec = self.codec_for(topic)
+        try:
+            return codec.encode(message), [(CODEC_HEADER, codec.name.encode("ascii"))]
+        except (TypeError, ValueError) as exc:
+            raise CodecError(f"Cannot encode message with {codec.name}: {exc}") from exc
+
+
+def codec_from_headers(headers: Optional[Sequence[Tuple[str, bytes]]]):
+    for key, value in headers or ():
+        if key == CODEC_HEADER:
+            try:
+                return get_codec(value.decode("ascii"))
+            except (AttributeError, UnicodeDecodeError) as exc:
+                raise CodecError(f"Invalid {CODEC_HEADER} header: {value!r}") from exc
+    return get_codec(DEFAULT_CODEC)
+
+
+def decode_message(data: bytes, headers: Optional[Sequence[Tuple[str, bytes]]] = None) -> Dict[str, Any]:
+    codec = codec_from_headers(headers)
+    try:
+        message = codec.decode(data)
+    except CodecError:
+        raise
+    except Exception as exc:  # noqa: BLE001 - each library raises its own error types
+        raise CodecError(f"Cannot decode {codec.name} payload: {exc}") from exc
+    if not isinstance(message, dict):
+        raise CodecError(f"Expected an object payload, got {type(message).__name__}")
+    return message
@@ -0,0 +1,316 @@
+"""Prometheus instrumentation shared by the AgroTrace Python services.
+
+Every service calls ``configure(<service name>)`` once. FastAPI services then call
+``instrument_fastapi(app)``, which serves ``/metrics``. The Kafka consumer, which
+has no HTTP server, uses ``serve(port)`` instead.
+
+The hot path is kept cheap enough to stay on in production:
+- the middleware is plain ASGI (no BaseHTTPMiddleware task/stream wrapping) and
+  labels requests by route template, so the series count stays bounded;
+- child metrics are resolved once per label set and cached;
+- dependency timing is one ``perf_counter`` pair and one histogram observe.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+HTTP_LATENCY = Histogram(
+    "agro_http_request_duration_seconds",
+    "HTTP handler latency.",
+    ["service", "method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+DEPENDENCY_LATENCY = Histogram(
+    "agro_dependency_duration_seconds",
+    "Latency of calls to DB, Kafka, MinIO and other services.",
+    ["service", "dependency", "operation", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+JOB_DURATION = Histogram(
+    "agro_job_duration_seconds",
+    "Duration of background jobs.",
+    ["service", "job_type", "status"],
+    buckets=_JOB_BUCKETS,
+)
+EVENT_LOOP_LAG = Gauge(
+    "agro_event_loop_lag_seconds",
+    "Delay between when the loop-lag probe was due and when it actually ran.",
+    ["service"],
+)
+POOL_CHECKOUT_WAIT = Gauge(
+    "agro_db_pool_checkout_wait_seconds",
+    "Time the last DB connection checkout waited for the pool.",
+    ["service", "pool"],
+)
+POOL_IN_USE = Gauge(
+    "agro_db_pool_connections_in_use",
+    "DB connections currently checked out of the pool.",
+    ["service", "pool"],
+)
+KAFKA_CONSUMER_LAG = Gauge(
+    "agro_kafka_consumer_lag",
+    "Messages between the consumer position and the partition high watermark.",
+    ["service", "topic", "partition"],
+)
+EVENTS = Counter(
+    "agro_events_total",
+    "Service-specific event counters (drops, spills, retries...).",
+    ["service", "event"],
+)
+
+_state: Dict[str, Any] = {"service": "unknown", "enabled": True}
+_dependency_children: Dict[Tuple[str, str, str], Any] = {}
+_http_children: Dict[Tuple[str, str, str], Any] = {}
+_function_gauges: Dict[str, Gauge] = {}
+
+
+def env_enabled(default: bool = True) -> bool:
+    raw = os.getenv("METRICS_ENABLED")
+    if raw is None:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def configure(service: str, enabled: Optional[bool] = None) -> None:
+    _state["service"] = service
+    _state["enabled"] = env_enabled() if enabled is None else enabled
+
+
+def service_name() -> str:
+    return _state["service"]
+
+
+def enabled() -> bool:
+    return _state["enabled"]
+
+
+def _dependency_child(dependency: str, operation: str, outcome: str):
+    key = (dependency, operation, outcome)
+    child = _dependency_children.get(key)
+    if child is None:
+        child = _dependency_children[key] = DEPENDENCY_LATENCY.labels(
+            _state["service"], dependency, operation, outcome
+        )
+    return child
+
+
+def observe_dependency(dependency: str, operation: str, seconds: float, ok: bool = True) -> None:
+    if _state["enabled"]:
+        _dependency_child(dependency, operation, "ok" if ok else "error").observe(seconds)
+
+
+class track:
+    """Times a dependency call; usable as ``with`` or ``async with``.
+
+        with track("minio", "put_object"):
+            client.put_object(...)
+    """
+
+    __slots__ = ("dependency", "operation", "_started")
+
+    def __init__(self, dependency: str, operation: str):
+        self.dependency = dependency
+        self.operation = operation
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_dependency(
+            self.dependency, self.operation, time.perf_counter() - self._started, ok=exc_type is None
+        )
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def observe_job(job_type: str, status: str, seconds: float) -> None:
+    if _state["enabled"]:
+        JOB_DURATION.labels(_state["service"], job_type, status).observe(seconds)
+
+
+def observe_pool_wait(pool: str, seconds: float) -> None:
+    if _state["enabled"]:
+        POOL_CHECKOUT_WAIT.labels(_state["service"], pool).set(seconds)
+
+
+def set_kafka_lag(topic: str, partition: int, lag: int) -> None:
+    if _state["enabled"]:
+        KAFKA_CONSUMER_LAG.labels(_state["service"], topic, str(partition)).set(lag)
+
+
+def count_event(event: str, amount: float = 1) -> None:
+    if _state["enabled"]:
+        EVENTS.labels(_state["service"], event).inc(amount)
+
+
+def gauge_function(name: str, documentation: str, fn: Callable[[], float]) -> None:
+    """Registers a gauge whose value is read from ``fn`` at scrape time (zero hot-path cost)."""
+    if not _state["enabled"]:
+        return
+    gauge = _function_gauges.get(name)
+    if gauge is None:
+        gauge = _function_gauges[name] = Gauge(name, documentation, ["service"])
+    gauge.labels(_state["service"]).set_function(fn)
+
+
+# --- Event loop lag -------------------------------------------------------------
+
+_loop_monitors: Dict[int, asyncio.Task] = {}
+
+
+async def _monitor_loop_lag(interval: float) -> None:
+    gauge = EVENT_LOOP_LAG.labels(_state["service"])
+    loop = asyncio.get_running_loop()
+    while True:
+        due = loop.time() + interval
+        await asyncio.sleep(interval)
+        gauge.set(max(loop.time() - due, 0.0))
+
+
+def start_loop_lag_monitor(interval: float = 0.5) -> None:
+    """Starts (once per running loop) a probe measuring how late the loop wakes up."""
+    if not _state["enabled"]:
+        return
+    loop = asyncio.get_running_loop()
+    task = _loop_monitors.get(id(loop))
+    if task is None or task.done():
+        _loop_monitors[id(loop)] = loop.create_task(_monitor_loop_lag(interval))
+
+
+# --- HTTP -------------------------------------------------------------------------
+
+
+METRICS_PATH = "/metrics"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording handler latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Scrapes are not recorded. /metrics is a plain route: it never sets
+        # scope["route"], so it can only be recognised by its path.
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        start_loop_lag_monitor()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            key = (scope["method"], template, status["code"])
+            child = _http_children.get(key)
+            if child is None:
+                child = _http_children[key] = HTTP_LATENCY.labels(
+                    _state["service"], scope["method"], template, str(status["code"])
+                )
+            child.observe(time.perf_counter() - started)
+
+
+async def metrics_endpoint(request):
+    from starlette.responses import Response
+
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_fastapi(app, service: Optional[str] = None, enabled: Optional[bool] = None) -> None:
+    """Adds the latency middleware and serves the Prometheus exposition at /metrics."""
+    if service is not None:
+        configure(service, enabled)
+    if not _state["enabled"]:
+        return
+    app.add_middleware(MetricsMiddleware)
+    app.add_route(METRICS_PATH, metrics_endpoint, include_in_schema=False)
+
+
+def serve(port: int) -> None:
+    """Standalone exposition for processes without an HTTP app (Kafka consumer)."""
+    if _state["enabled"]:
+        start_http_server(port)
+
+
+# --- SQLAlchemy ---------------------------------------------------------------------
+
+
+def instrument_sqlalchemy(engine, pool: str = "default") -> None:
+    """Times every statement and tracks pool checkout wait / connections in use.
+
+    Works with sync engines and AsyncEngine (listeners go on the sync core).
+    """
+    if not _state["enabled"]:
+        return
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    in_use = POOL_IN_USE.labels(_state["service"], pool)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("agro_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["agro_query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+        observe_dependency("db", operation, time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("agro_query_started") if context.connection else None
+        if stack:
+            observe_dependency("db", "ERROR", time.perf_counter() - stack.pop(), ok=False)
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        in_use.inc()
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        in_use.dec()
+
+    # Pool._do_get is where a checkout blocks when the pool is exhausted.
+    pool_impl = sync_engine.pool
+    do_get = pool_impl._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            observe_pool_wait(pool, time.perf_counter() - started)
+
+    pool_impl._do_get = timed_do_get
@@ -0,0 +1,107 @@
+"""Continuous aggregates (rollups) of the ingestion hypertables.
+
+The definitions are shared: the ingestion consumer creates the views and their
+refresh/retention policies from them (consumer/app/schema.py), and readers such as
+the pretraitement API call ``series_query`` with the resolution they need. It reads
+the coarsest rollup whose bucket divides that resolution and re-buckets it on the
+fly, so a dashboard asking for 6 h points over a month scans ~720 hourly rows per
+series instead of ~40 000 raw readings. Resolutions finer than the finest rollup
+(or not a multiple of 5 minutes) fall back to the raw hypertable.
+
+Every rollup row holds, per series and bucket: ``value_min``, ``value_max``,
+``value_avg`` and ``value_count``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Rollup:
+    view: str
+    bucket: timedelta
+    # The refresh policy recomputes [now - refresh_start, now - refresh_end] every
+    # `schedule`; readings arriving later than refresh_start are not folded in.
+    refresh_start: timedelta
+    refresh_end: timedelta
+    schedule: timedelta
+    # Rollup rows older than this are dropped (None: kept forever).
+    retention: Optional[timedelta]
+
+
+@dataclass(frozen=True)
+class Hypertable:
+    table: str
+    # Columns identifying a series; the rollups group on them.
+    keys: Tuple[str, ...]
+    # Compressed chunks are segmented by this column (one compressed batch per value).
+    segment_by: str
+    rollups: Tuple[Rollup, ...]
+
+
+def _rollups(table: str) -> Tuple[Rollup, ...]:
+    return (
+        Rollup(f"{table}_5m", timedelta(minutes=5), timedelta(hours=6), timedelta(minutes=5), timedelta(minutes=5), timedelta(days=180)),
+        Rollup(f"{table}_1h", timedelta(hours=1), timedelta(days=3), timedelta(hours=1), timedelta(minutes=30), timedelta(days=730)),
+        Rollup(f"{table}_1d", timedelta(days=1), timedelta(days=7), timedelta(days=1), timedelta(hours=6), None),
+    )
+
+
+SENSOR_READINGS = Hypertable("sensor_readings", ("sensor_id", "sensor_type"), "sensor_id", _rollups("sensor_readings"))
+WEATHER_READINGS = Hypertable("weather_readings", ("station_id", "metric"), "station_id", _rollups("weather_readings"))
+
+HYPERTABLES = (SENSOR_READINGS, WEATHER_READINGS)
+
+
+def choose_rollup(table: Hypertable, resolution: timedelta) -> Optional[Rollup]:
+    """Coarsest rollup whose buckets tile `resolution` exactly, or None for the raw table."""
+    fitting = [rollup for rollup in table.rollups if resolution % rollup.bucket == timedelta(0)]
+    return max(fitting, key=lambda rollup: rollup.bucket, default=None)
+
+
+def series_query(
+    table: Hypertable,
+    filters: Dict[str, Any],
+    start: datetime,
+    end: datetime,
+    resolution: timedelta,
+) -> Tuple[str, List[Any], str]:
+    """asyncpg query (SQL, arguments, source relation) of per-`resolution` aggregates.
+
+    `filters` maps series key columns to the required value. Rows come back as
+    (period, *table.keys, value_min, value_max, value_avg, value_count), ordered by
+    series then period, aggregating the data in [start, end).
+    """
+    unknown = set(filters) - set(table.keys)
+    if unknown:
+        raise ValueError(f"Unknown series key(s) for {table.table}: {sorted(unknown)}")
+    if resolution <= timedelta(0):
+        raise ValueError("resolution must be positive")
+
+    rollup = choose_rollup(table, resolution)
+    if rollup is None:
+        source, time_column = table.table, "observed_at"
+        aggregates = "min(value), max(value), avg(value), count(value)"
+    else:
+        # Weighted mean: an hourly average is not the mean of its 5-minute averages
+        # when their counts differ.
+        source, time_column = rollup.view, "bucket"
+        aggregates = (
+            "min(value_min), max(value_max),"
+            " sum(value_avg * value_count) / nullif(sum(value_count), 0), sum(value_count)::bigint"
+        )
+
+    args: List[Any] = [resolution, start, end]
+    conditions = [f"{time_column} >= $2", f"{time_column} < $3"]
+    for column, value in filters.items():
+        args.append(value)
+        conditions.append(f"{column} = ${len(args)}")
+    keys = ", ".join(table.keys)
+    sql = (
+        f"SELECT time_bucket($1::interval, {time_column}) AS period, {keys}, {aggregates}"
+        f" FROM {source} WHERE {' AND '.join(conditions)}"
+        f" GROUP BY period, {keys} ORDER BY {keys}, period"
+    )
+    return sql, args, source
@@ -0,0 +1,85 @@
+"""Restart loop shared by the multi-process supervisors (ingestion consumer, pretraitement jobs).
+
+A worker that dies is restarted. While it keeps dying shortly after starting (a
+database or broker down, a port already taken...) each restart waits twice as long
+as the previous one, and after too many such failures in a row the worker is given
+up instead of being respawned in a tight loop.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Set, Tuple
+
+
+@dataclass(frozen=True)
+class RestartPolicy:
+    # Wait before the first restart after a fast failure, doubled per consecutive one.
+    backoff_s: float = 1.0
+    backoff_max_s: float = 60.0
+    # A worker that stayed up this long restarts at once and resets its failure count.
+    min_uptime_s: float = 30.0
+    # Consecutive fast failures after which the worker is given up.
+    max_failures: int = 10
+
+    def delay(self, failures: int) -> float:
+        """Seconds to wait before restarting a worker after `failures` consecutive fast crashes."""
+        if failures <= 0:
+            return 0.0
+        return min(self.backoff_s * 2 ** (failures - 1), self.backoff_max_s)
+
+
+def supervise(
+    start: Callable[[int], object],
+    workers: int,
+    stop_event,
+    policy: RestartPolicy,
+    logger: logging.Logger,
+) -> Tuple[Dict[int, object], Set[int]]:
+    """Runs `start(worker_id)` processes for ids 0..workers-1 until `stop_event` is set.
+
+    Dead workers are restarted according to `policy`; once every worker has been given
+    up, `stop_event` is set. Returns the last process of each worker and the ids given up.
+    """
+    processes = {i: start(i) for i in range(workers)}
+    started_at = {i: time.monotonic() for i in processes}
+    failures = {i: 0 for i in processes}
+    restart_at: Dict[int, float] = {}  # worker_id -> monotonic time of its pending restart
+    abandoned: Set[int] = set()
+
+    while not stop_event.is_set():
+        for worker_id, process in list(processes.items()):
+            if worker_id in abandoned:
+                continue
+            if worker_id in restart_at:
+                if time.monotonic() >= restart_at[worker_id]:
+                    del restart_at[worker_id]
+                    processes[worker_id] = start(worker_id)
+                    started_at[worker_id] = time.monotonic()
+                continue
+            process.join(timeout=1 / workers)
+            if process.is_alive() or stop_event.is_set():
+                continue
+            # A worker that stayed up long enough starts a fresh series of restarts.
+            if time.monotonic() - started_at[worker_id] >= policy.min_uptime_s:
+                failures[worker_id] = 0
+            else:
+                failures[worker_id] += 1
+            if failures[worker_id] >= policy.max_failures:
+                logger.critical(
+                    "Worker %d exited with code %s after %d consecutive fast failures, giving up",
+                    worker_id, process.exitcode, failures[worker_id],
+                )
+                abandoned.add(worker_id)
+                continue
+            delay = policy.delay(failures[worker_id])
+            logger.error(
+                "Worker %d exited with code %s, restarting in %.1f s", worker_id, process.exitcode, delay
+            )
+            restart_at[worker_id] = time.monotonic() + delay
+        if len(abandoned) == workers:
+            logger.critical("All %d workers gave up, stopping", workers)
+            stop_event.set()
+        elif len(restart_at) + len(abandoned) == workers:
+            # Nothing to join: wait for the next restart instead of spinning.
+            stop_event.wait(0.1)
+    return processes, abandoned
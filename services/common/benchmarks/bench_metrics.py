@@ -0,0 +1,132 @@
+"""Hot-path overhead of agro_common.metrics.
+
+Measures the per-call cost of `track()` and the per-request cost the HTTP
+middleware adds to a trivial FastAPI route (in-process ASGI, no network). The
+plain and instrumented apps take turns over several rounds and the median round is
+reported, so drift in machine load does not land on one side only.
+
+    cd services/common
+    python benchmarks/bench_metrics.py --calls 200000 --requests 20000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from agro_common import metrics  # noqa: E402
+
+
+def per_call_ns(started: float, count: int) -> float:
+    return (time.perf_counter() - started) / count * 1e9
+
+
+def bench_track(calls: int) -> tuple:
+    started = time.perf_counter()
+    for _ in range(calls):
+        pass
+    baseline = per_call_ns(started, calls)
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        with metrics.track("db", "SELECT"):
+            pass
+    return baseline, per_call_ns(started, calls)
+
+
+def make_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/parcelle/{parcelle_id}")
+    async def parcelle(parcelle_id: int):
+        return {"parcelle_id": parcelle_id}
+
+    if instrumented:
+        metrics.instrument_fastapi(app)
+    return app
+
+
+async def call_asgi(app, path: str) -> None:
+    """One GET straight through the ASGI app, without an HTTP client in the way."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+class DirectClient:
+    def __init__(self, app):
+        self.app = app
+
+    async def get(self, path: str) -> None:
+        await call_asgi(self.app, path)
+
+    async def aclose(self) -> None:
+        pass
+
+
+async def bench_http(apps: dict, requests: int, rounds: int, direct: bool = False) -> dict:
+    """Median µs/request per app, the apps taking turns so drift hits them alike.
+
+    `direct` calls the ASGI apps without httpx, whose own cost otherwise dwarfs the
+    middleware's.
+    """
+    clients = {
+        name: DirectClient(app) if direct else httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        for name, app in apps.items()
+    }
+    samples = {name: [] for name in apps}
+    try:
+        for client in clients.values():
+            for i in range(200):
+                await client.get(f"/parcelle/{i}")
+        for _ in range(rounds):
+            for name, client in clients.items():
+                started = time.perf_counter()
+                for i in range(requests // rounds):
+                    await client.get(f"/parcelle/{i}")
+                samples[name].append((time.perf_counter() - started) / (requests // rounds) * 1e6)
+    finally:
+        for client in clients.values():
+            await client.aclose()
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--rounds", type=int, default=20, help="alternating rounds per app (median reported)")
+    args = parser.parse_args()
+
+    metrics.configure("bench", enabled=True)
+    baseline_ns, track_ns = bench_track(args.calls)
+    print(f"track()        : {track_ns - baseline_ns:8.0f} ns/call")
+
+    apps = {"plain": make_app(False), "metrics": make_app(True)}
+    for label, direct in (("HTTP", False), ("ASGI", True)):
+        medians = asyncio.run(bench_http(apps, args.requests, args.rounds, direct=direct))
+        plain_us, instrumented_us = medians["plain"], medians["metrics"]
+        overhead = instrumented_us - plain_us
+        print(f"{label} plain     : {plain_us:8.1f} µs/request")
+        print(f"{label} metrics   : {instrumented_us:8.1f} µs/request")
+        print(f"{label} overhead  : {overhead:8.1f} µs/request ({overhead / plain_us * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
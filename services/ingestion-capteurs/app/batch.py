@@ -0,0 +1,114 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from aiokafka import AIOKafkaProducer
+from aiokafka.partitioner import DefaultPartitioner
+from pydantic import ValidationError
+
+from . import kafka_producer as kafka
+from .config import TOPIC_MAP
+from .schemas import SensorData
+
+_partitioner = DefaultPartitioner()
+
+
+def to_message(payload: SensorData) -> Dict[str, Any]:
+    # The timestamp stays a datetime: each codec picks its own wire representation.
+    return payload.dict()
+
+
+def _rejected(index: int, errors: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"index": index, "status": "rejected", "errors": errors}
+
+
+def _validation_errors(exc: ValidationError) -> List[Dict[str, Any]]:
+    return [{"loc": list(err["loc"]), "msg": err["msg"]} for err in exc.errors()]
+
+
+def parse_json_array(body: bytes) -> List[Any]:
+    items = json.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("Le corps doit être un tableau JSON de lectures")
+    return items
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> List[Any]:
+    """Parse an NDJSON stream line by line; undecodable lines become ValueError items."""
+    items: List[Any] = []
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        items.extend(_decode_line(line) for line in lines if line.strip())
+    if pending.strip():
+        items.append(_decode_line(pending))
+    return items
+
+
+def _decode_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as exc:
+        return exc
+
+
+def validate_items(items: List[Any]) -> Tuple[Dict[str, List[Tuple[int, SensorData]]], Dict[int, Dict[str, Any]]]:
+    """Validate every item and group the valid ones by Kafka topic."""
+    by_topic: Dict[str, List[Tuple[int, SensorData]]] = defaultdict(list)
+    rejected: Dict[int, Dict[str, Any]] = {}
+    for index, item in enumerate(items):
+        if isinstance(item, ValueError):
+            rejected[index] = _rejected(index, [{"loc": [], "msg": f"JSON invalide: {item}"}])
+            continue
+        if not isinstance(item, dict):
+            rejected[index] = _rejected(index, [{"loc": [], "msg": "Objet JSON attendu"}])
+            continue
+        try:
+            reading = SensorData(**item)
+        except ValidationError as exc:
+            rejected[index] = _rejected(index, _validation_errors(exc))
+            continue
+        by_topic[TOPIC_MAP[reading.type]].append((index, reading))
+    return by_topic, rejected
+
+
+async def send_topic_batches(
+    producer: AIOKafkaProducer,
+    topic: str,
+    entries: List[Tuple[int, SensorData]],
+) -> Dict[int, Dict[str, Any]]:
+    """Send the readings of one topic with create_batch/send_batch, keyed by sensor_id.
+
+    Readings are routed with the producer's default partitioner so a given sensor
+    always lands on the same partition, in request order.
+    """
+    partitions = sorted(await producer.partitions_for(topic))
+    by_partition: Dict[int, List[Tuple[int, bytes, bytes]]] = defaultdict(list)
+    headers = None
+    for index, reading in entries:
+        key = reading.sensor_id.encode("utf-8")
+        value, headers = kafka.codecs.encode(topic, to_message(reading))
+        by_partition[_partitioner(key, partitions, partitions)].append((index, key, value))
+
+    pending = []
+    for partition, records in by_partition.items():
+        batch, indexes = producer.create_batch(), []
+        for index, key, value in records:
+            if batch.append(key=key, value=value, timestamp=None, headers=headers) is None:
+                pending.append((indexes, await kafka.send_batch(producer, batch, topic, partition)))
+                batch, indexes = producer.create_batch(), []
+                batch.append(key=key, value=value, timestamp=None, headers=headers)
+            indexes.append(index)
+        pending.append((indexes, await kafka.send_batch(producer, batch, topic, partition)))
+
+    results: Dict[int, Dict[str, Any]] = {}
+    outcomes = await asyncio.gather(*(fut for _, fut in pending), return_exceptions=True)
+    for (indexes, _), outcome in zip(pending, outcomes):
+        for index in indexes:
+            if isinstance(outcome, Exception):
+                results[index] = _rejected(index, [{"loc": [], "msg": f"Erreur Kafka: {outcome}"}])
+            else:
+                results[index] = {"index": index, "status": "accepted", "topic": topic}
+    return results
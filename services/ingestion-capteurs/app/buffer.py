@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Optional
+
+from . import kafka_producer as kafka
+from .spill import Record, SpillLog
+
+logger = logging.getLogger("DeliveryBuffer")
+
+
+class DeliveryBuffer:
+    """File bornée entre les handlers HTTP et Kafka, vidée par une tâche de fond.
+
+    - Les handlers appellent `offer()` : au-delà du seuil haut la lecture est refusée
+      et l'API répond 429 + Retry-After (back-pressure vers les passerelles).
+    - Si Kafka est injoignable, les messages attendent dans la file ou, si un
+      `SpillLog` est fourni, sont écrits sur disque puis rejoués dans l'ordre à la
+      reconnexion, avant les messages plus récents.
+    - Un message est compté en `dropped` seulement s'il ne peut être ni livré ni
+      débordé (plafond du spill atteint).
+    - À l'arrêt, la file est d'abord vidée vers Kafka pendant au plus `stop_timeout_s` ;
+      seul le reste est débordé ou perdu.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        high_watermark: float,
+        spill: Optional[SpillLog] = None,
+        stop_timeout_s: float = 10.0,
+    ):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._threshold = max(int(maxsize * high_watermark), 1)
+        self.spill = spill
+        self.stop_timeout_s = stop_timeout_s
+        self.dropped = 0
+        # Message retiré de la file mais pas encore remis au producteur.
+        self._current: Optional[Record] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reconnect: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def has_room(self, count: int = 1) -> bool:
+        return self._queue.qsize() + count <= self._threshold
+
+    def offer(self, topic: str, message: dict, key: Optional[bytes] = None) -> bool:
+        """Met un message en file ; False si la file a atteint son seuil haut."""
+        if not self.has_room():
+            return False
+        value, headers = kafka.codecs.encode(topic, message)
+        self._queue.put_nowait((topic, key, value, headers))
+        return True
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # La tâche de fond continue de livrer (et de se reconnecter) jusqu'à ce que
+            # la file soit vide ou que le délai soit écoulé.
+            try:
+                await asyncio.wait_for(self._queue.join(), self.stop_timeout_s)
+            except asyncio.TimeoutError:
+                pending = self.depth + (self._current is not None)
+                logger.warning(f"⚠️ {pending} messages non livrés après {self.stop_timeout_s:g} s d'arrêt")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Ce qui n'a pas pu être livré est débordé sur disque, ou perdu sans spill.
+        if self._current is not None:
+            self._spill_or_drop(self._current)
+            self._current = None
+        while not self._queue.empty():
+            self._spill_or_drop(self._queue.get_nowait())
+        if self.spill is not None:
+            self.spill.close()
+
+    def snapshot(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "queue_capacity": self._queue.maxsize,
+            "spill_pending_bytes": self.spill.pending_bytes if self.spill else 0,
+            "spilled_bytes_total": self.spill.spilled_bytes_total if self.spill else 0,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            record = self._current = await self._queue.get()
+            await self._deliver(record)
+            self._current = None
+            self._queue.task_done()
+
+    async def _deliver(self, record: Record) -> None:
+        while True:
+            producer = kafka.current_producer()
+            if producer is not None:
+                try:
+                    if self.spill is not None and self.spill.has_pending:
+                        await self._replay(producer)
+                    await self._send(producer, record)
+                    return
+                except Exception as e:
+                    logger.warning(f"⚠️ Kafka indisponible ({e}), reconnexion...")
+                    await kafka.stop_producer()
+            self._ensure_reconnect()
+            if self.spill is not None:
+                self._spill_or_drop(record)
+                return
+            # Sans spill, le message reste ici : la file se remplit et l'API renvoie 429.
+            await asyncio.sleep(1)
+
+    async def _send(self, producer, record: Record) -> None:
+        topic, key, value, headers = record
+        future = await kafka.send_encoded(producer, topic, value, key=key, headers=headers)
+
+        def on_done(fut: asyncio.Future) -> None:
+            if fut.cancelled() or fut.exception() is not None:
+                self._spill_or_drop(record)
+
+        future.add_done_callback(on_done)
+
+    async def _replay(self, producer) -> None:
+        for segment in self.spill.sealed_segments():
+            records = await asyncio.to_thread(lambda: list(SpillLog.read_segment(segment)))
+            logger.info(f"🔁 Rejeu de {len(records)} messages depuis {segment.name}")
+            futures = [
+                await kafka.send_encoded(producer, topic, value, key=key, headers=headers)
+                for topic, key, value, headers in records
+            ]
+            # Le segment n'est supprimé qu'une fois tous ses messages acquittés.
+            await asyncio.gather(*futures)
+            self.spill.remove(segment)
+
+    def _spill_or_drop(self, record: Record) -> None:
+        if self.spill is not None and self.spill.append(record):
+            return
+        self.dropped += 1
+
+    def _ensure_reconnect(self) -> None:
+        if self._reconnect is None or self._reconnect.done():
+            self._reconnect = asyncio.create_task(kafka.get_producer())
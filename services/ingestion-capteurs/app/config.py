@@ -1,5 +1,7 @@
 import os
 
+from agro_common.codecs import parse_topic_codecs
+
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
 
 TOPIC_MAP = {
@@ -9,8 +11,50 @@ TOPIC_MAP = {
     "meteo": "meteo.raw",
 }
 
+# Named AIOKafkaProducer tunings; pick one with KAFKA_PRODUCER_PROFILE.
+# "throughput" waits a little to fill large compressed batches, "latency" sends
+# right away. Both use idempotent delivery (acks=all, no duplicates on retry).
+PRODUCER_PROFILES = {
+    "throughput": {
+        "linger_ms": 20,
+        "max_batch_size": 256 * 1024,
+        "compression_type": "zstd",
+        "enable_idempotence": True,
+    },
+    "latency": {
+        "linger_ms": 0,
+        "max_batch_size": 16 * 1024,
+        "compression_type": "lz4",
+        "enable_idempotence": True,
+    },
+}
+KAFKA_PRODUCER_PROFILE = os.getenv("KAFKA_PRODUCER_PROFILE", "throughput")
+
+# Codec used per topic ("json", "orjson" or "msgpack"), e.g.
+# KAFKA_TOPIC_CODECS="capteurs.temperature=msgpack,meteo.raw=orjson".
+KAFKA_DEFAULT_CODEC = os.getenv("KAFKA_DEFAULT_CODEC", "json")
+KAFKA_TOPIC_CODECS = parse_topic_codecs(os.getenv("KAFKA_TOPIC_CODECS", ""))
+
 VALUE_BOUNDS = {
     "temperature": (-50.0, 80.0),
     "humidite": (0.0, 100.0),
     "luminosite": (0.0, 200000.0),
 }
+
+# Upper bound on the number of readings accepted by one POST /batch call.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+
+# File d'attente bornée entre les handlers HTTP et Kafka. Au-delà de
+# BUFFER_HIGH_WATERMARK (fraction de BUFFER_MAX_SIZE) l'API répond 429.
+BUFFER_MAX_SIZE = int(os.getenv("BUFFER_MAX_SIZE", "10000"))
+BUFFER_HIGH_WATERMARK = float(os.getenv("BUFFER_HIGH_WATERMARK", "0.9"))
+BUFFER_RETRY_AFTER_S = int(os.getenv("BUFFER_RETRY_AFTER_S", "2"))
+# À l'arrêt, délai laissé pour livrer la file à Kafka avant de la déborder ou la perdre.
+BUFFER_STOP_TIMEOUT_S = float(os.getenv("BUFFER_STOP_TIMEOUT_S", "10"))
+
+# Débordement sur disque quand Kafka est injoignable (segments append-only rejoués
+# à la reconnexion).
+SPILL_ENABLED = os.getenv("SPILL_ENABLED", "false").lower() in ("1", "true", "yes")
+SPILL_DIR = os.getenv("SPILL_DIR", "/var/lib/ingestion/spill")
+SPILL_MAX_BYTES = int(os.getenv("SPILL_MAX_BYTES", str(512 * 1024 * 1024)))
+SPILL_SEGMENT_BYTES = int(os.getenv("SPILL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
@@ -1,61 +1,185 @@
-import os
-import json
 import asyncio
 import logging
+import time
+from collections import deque
+from typing import Optional
+
 from aiokafka import AIOKafkaProducer
+from aiokafka.codec import has_lz4, has_zstd
+from agro_common import metrics as prom
+from agro_common.codecs import TopicCodecs
+
+from .config import (
+    KAFKA_BOOTSTRAP_SERVERS,
+    KAFKA_DEFAULT_CODEC,
+    KAFKA_PRODUCER_PROFILE,
+    KAFKA_TOPIC_CODECS,
+    PRODUCER_PROFILES,
+)
 
 # Configuration des logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("KafkaProducer")
 
-# Adresse de Kafka (définie dans docker-compose)
-KAFKA_SERVER = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+_COMPRESSION_AVAILABLE = {"lz4": has_lz4, "zstd": has_zstd}
+
+# Producteur unique du service (API + send_to_kafka)
+_producer: Optional[AIOKafkaProducer] = None
+_connect_lock = asyncio.Lock()
+codecs = TopicCodecs(KAFKA_TOPIC_CODECS, default=KAFKA_DEFAULT_CODEC)
+
+
+class ProducerMetrics:
+    """Latence de livraison (send -> ack broker) et taux de remplissage des lots."""
+
+    def __init__(self, window: int = 2048):
+        self.delivered = 0
+        self.failed = 0
+        self._latencies_ms = deque(maxlen=window)
+        self._fill_ratios = deque(maxlen=window)
+
+    def record_delivery(self, latency_ms: float, ok: bool) -> None:
+        if ok:
+            self.delivered += 1
+            self._latencies_ms.append(latency_ms)
+        else:
+            self.failed += 1
+
+    def record_batch(self, size_bytes: int, max_batch_size: int) -> None:
+        self._fill_ratios.append(min(size_bytes / max_batch_size, 1.0))
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)], 2)
+
+        fill = self._fill_ratios
+        return {
+            "profile": KAFKA_PRODUCER_PROFILE,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "delivery_latency_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "max": round(latencies[-1], 2) if latencies else None},
+            "batch_fill_ratio": round(sum(fill) / len(fill), 3) if fill else None,
+        }
+
+
+metrics = ProducerMetrics()
+
+
+def producer_settings(profile: str = KAFKA_PRODUCER_PROFILE) -> dict:
+    if profile not in PRODUCER_PROFILES:
+        raise ValueError(f"Profil producteur inconnu '{profile}' (attendu : {sorted(PRODUCER_PROFILES)})")
+    settings = dict(PRODUCER_PROFILES[profile])
+    compression = settings.get("compression_type")
+    available = _COMPRESSION_AVAILABLE.get(compression)
+    if available is not None and not available():
+        logger.warning(f"⚠️ Compression {compression} indisponible, envoi non compressé.")
+        settings["compression_type"] = None
+    return settings
+
+
+def create_producer(profile: str = KAFKA_PRODUCER_PROFILE) -> AIOKafkaProducer:
+    """Fabrique unique des producteurs Kafka du service.
+
+    Les valeurs sont déjà encodées par `codecs` (en-tête "codec"), donc pas de serializer.
+    """
+    return AIOKafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS, **producer_settings(profile))
+
+
+def max_batch_size(profile: str = KAFKA_PRODUCER_PROFILE) -> int:
+    return PRODUCER_PROFILES[profile]["max_batch_size"]
 
-# Variable globale pour stocker la connexion
-_producer = None
 
-async def get_producer():
+async def get_producer(attempts: int = 15, delay_s: float = 2.0) -> Optional[AIOKafkaProducer]:
     """
     Récupère ou crée une connexion Kafka avec un système de RÉESSAYE (Retry).
     """
     global _producer
-    
-    if _producer is None:
-        logger.info(f"🔌 Tentative de connexion à Kafka sur {KAFKA_SERVER}...")
-        
-        _producer = AIOKafkaProducer(
-            bootstrap_servers=KAFKA_SERVER,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8')
-        )
-        
-        # --- BOUCLE DE PATIENCE (RETRY LOOP) ---
-        # On essaie 15 fois (30 secondes) avant d'abandonner
-        for i in range(15):
-            try:
-                await _producer.start()
-                logger.info("✅ Kafka Connecté avec succès !")
-                return _producer # Connexion réussie, on retourne le producteur
-            except Exception as e:
-                logger.warning(f"⏳ Kafka n'est pas encore prêt (Essai {i+1}/15)... Erreur: {e}")
-                await asyncio.sleep(2)
-        
-        # Si on arrive ici, c'est l'échec total
-        logger.error("❌ ABANDON : Impossible de joindre Kafka après 30 secondes.")
-        _producer = None 
 
+    # Un seul essai de connexion à la fois (démarrage et reconnexions du buffer).
+    async with _connect_lock:
+        if _producer is None:
+            logger.info(f"🔌 Connexion à Kafka sur {KAFKA_BOOTSTRAP_SERVERS} (profil {KAFKA_PRODUCER_PROFILE})...")
+            candidate = create_producer()
+
+            # --- BOUCLE DE PATIENCE (RETRY LOOP) ---
+            for i in range(attempts):
+                try:
+                    await candidate.start()
+                    _producer = candidate
+                    logger.info("✅ Kafka Connecté avec succès !")
+                    return _producer
+                except Exception as e:
+                    logger.warning(f"⏳ Kafka n'est pas encore prêt (Essai {i+1}/{attempts})... Erreur: {e}")
+                    await asyncio.sleep(delay_s)
+
+            logger.error(f"❌ ABANDON : Impossible de joindre Kafka après {attempts * delay_s:.0f} secondes.")
+            await candidate.stop()
+
+    return _producer
+
+
+def current_producer() -> Optional[AIOKafkaProducer]:
     return _producer
 
+
+async def stop_producer() -> None:
+    global _producer
+    if _producer is not None:
+        await _producer.stop()
+        _producer = None
+
+
+def _track_delivery(future: asyncio.Future, started: float) -> None:
+    def done(fut: asyncio.Future) -> None:
+        ok = not fut.cancelled() and fut.exception() is None
+        elapsed = time.perf_counter() - started
+        metrics.record_delivery(elapsed * 1000, ok)
+        prom.observe_dependency("kafka", "produce", elapsed, ok=ok)
+
+    future.add_done_callback(done)
+
+
+async def send(producer: AIOKafkaProducer, topic: str, message: dict, key: Optional[bytes] = None) -> asyncio.Future:
+    """Encode et envoie un message sans attendre l'ack ; la latence est mesurée à la livraison."""
+    value, headers = codecs.encode(topic, message)
+    return await send_encoded(producer, topic, value, key=key, headers=headers)
+
+
+async def send_encoded(
+    producer: AIOKafkaProducer,
+    topic: str,
+    value: bytes,
+    key: Optional[bytes] = None,
+    headers=None,
+) -> asyncio.Future:
+    started = time.perf_counter()
+    future = await producer.send(topic, value, key=key, headers=headers)
+    _track_delivery(future, started)
+    return future
+
+
+async def send_batch(producer: AIOKafkaProducer, batch, topic: str, partition: int) -> asyncio.Future:
+    metrics.record_batch(batch.size(), max_batch_size())
+    started = time.perf_counter()
+    future = await producer.send_batch(batch, topic, partition=partition)
+    _track_delivery(future, started)
+    return future
+
+
 async def send_to_kafka(topic: str, message: dict):
     """Envoie un message en gérant les erreurs."""
     producer = await get_producer()
-    
+
     if producer:
         try:
-            await producer.send_and_wait(topic, message)
+            await (await send(producer, topic, message))
         except Exception as e:
             logger.error(f"⚠️ Erreur lors de l'envoi Kafka : {e}")
             # On force la reconnexion au prochain appel
-            global _producer
-            _producer = None
+            await stop_producer()
     else:
-        logger.error("🚫 Echec d'envoi : Pas de connexion Kafka.")
\ No newline at end of file
+        logger.error("🚫 Echec d'envoi : Pas de connexion Kafka.")
@@ -1,64 +1,122 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from contextlib import asynccontextmanager
 import asyncio
-import json
-import os
 import logging
-from aiokafka import AIOKafkaProducer
+from agro_common import metrics as prom
 from .schemas import SensorData
-from .config import TOPIC_MAP
+from .config import (
+    BATCH_MAX_ITEMS,
+    BUFFER_HIGH_WATERMARK,
+    BUFFER_MAX_SIZE,
+    BUFFER_RETRY_AFTER_S,
+    BUFFER_STOP_TIMEOUT_S,
+    SPILL_DIR,
+    SPILL_ENABLED,
+    SPILL_MAX_BYTES,
+    SPILL_SEGMENT_BYTES,
+    TOPIC_MAP,
+)
+from .batch import parse_json_array, parse_ndjson, send_topic_batches, to_message, validate_items
+from .buffer import DeliveryBuffer
+from .spill import SpillLog
+from . import kafka_producer as kafka
 
 # --- LOGS ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("IngestionAPI")
 
-# --- CONFIG ---
-KAFKA_SERVER = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
-producer = None
+buffer: DeliveryBuffer = None
 
 # --- DEMARRAGE ROBUSTE ---
-async def start_kafka():
-    global producer
-    logger.info(f"🔌 Connexion Kafka sur {KAFKA_SERVER}...")
-    temp_producer = AIOKafkaProducer(
-        bootstrap_servers=KAFKA_SERVER,
-        value_serializer=lambda v: json.dumps(v).encode('utf-8')
-    )
-    for i in range(15):
-        try:
-            await temp_producer.start()
-            producer = temp_producer
-            logger.info("✅ Kafka Connecté !")
-            return
-        except Exception:
-            logger.warning(f"⏳ Kafka non prêt (Essai {i+1})...")
-            await asyncio.sleep(2)
-    logger.error("❌ Kafka inaccessible.")
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    asyncio.create_task(start_kafka())
+    global buffer
+    spill = SpillLog(SPILL_DIR, SPILL_MAX_BYTES, SPILL_SEGMENT_BYTES) if SPILL_ENABLED else None
+    buffer = DeliveryBuffer(
+        BUFFER_MAX_SIZE, BUFFER_HIGH_WATERMARK, spill=spill, stop_timeout_s=BUFFER_STOP_TIMEOUT_S
+    )
+    buffer.start()
+    prom.gauge_function("agro_ingestion_buffer_depth", "Messages waiting in the delivery buffer.", lambda: buffer.depth)
+    prom.gauge_function(
+        "agro_ingestion_spill_pending_bytes",
+        "Bytes spilled to disk and not yet replayed.",
+        lambda: buffer.spill.pending_bytes if buffer.spill else 0,
+    )
+    # Connexion en tâche de fond (boucle de retry de kafka_producer.get_producer) ;
+    # en attendant, les lectures patientent dans le buffer.
+    asyncio.create_task(kafka.get_producer())
     yield
-    if producer: await producer.stop()
+    await buffer.stop()
+    await kafka.stop_producer()
+
+def _too_busy():
+    return HTTPException(
+        429,
+        "File d'envoi Kafka saturée, réessayer plus tard",
+        headers={"Retry-After": str(BUFFER_RETRY_AFTER_S)},
+    )
 
 app = FastAPI(lifespan=lifespan)
+prom.instrument_fastapi(app, "ingestion-api")
 
 @app.get("/")
 def health():
-    return {"status": "ok", "kafka": "connected" if producer else "waiting"}
+    return {"status": "ok", "kafka": "connected" if kafka.current_producer() else "waiting"}
+
+@app.get("/stats")
+def stats():
+    return {"producer": kafka.metrics.snapshot(), "buffer": buffer.snapshot()}
 
 @app.post("/")
 async def ingest(payload: SensorData):
     if payload.type not in TOPIC_MAP:
         raise HTTPException(400, "Type inconnu")
     
-    if not producer:
-        return {"status": "error", "detail": "Kafka pas encore prêt"}
+    # Le buffer absorbe les indisponibilités de Kafka ; 429 quand il est presque plein.
+    # Clé = capteur, comme /batch : ses lectures restent ordonnées sur une même partition.
+    if not buffer.offer(TOPIC_MAP[payload.type], to_message(payload), key=payload.sensor_id.encode("utf-8")):
+        raise _too_busy()
+    return {"status": "envoyé"}
 
+@app.post("/batch")
+async def ingest_batch(request: Request):
+    """Lot de lectures : tableau JSON ou flux NDJSON (application/x-ndjson)."""
+    content_type = request.headers.get("content-type", "")
     try:
-        msg = payload.dict()
-        msg["timestamp"] = payload.timestamp.isoformat()
-        await producer.send(TOPIC_MAP[payload.type], msg)
-        return {"status": "envoyé"}
-    except Exception as e:
-        return {"status": "error", "detail": str(e)}
\ No newline at end of file
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            items = await parse_ndjson(request.stream())
+        else:
+            items = parse_json_array(await request.body())
+    except ValueError as e:
+        raise HTTPException(400, f"Corps invalide : {e}")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"Lot trop grand ({len(items)} > {BATCH_MAX_ITEMS})")
+
+    by_topic, results = validate_items(items)
+    producer = kafka.current_producer()
+    if not producer:
+        # Kafka pas encore prêt : le lot passe par le buffer (rejeu à la connexion).
+        valid = sum(len(entries) for entries in by_topic.values())
+        if not buffer.has_room(valid):
+            raise _too_busy()
+        for topic, entries in by_topic.items():
+            for index, reading in entries:
+                buffer.offer(topic, to_message(reading), key=reading.sensor_id.encode("utf-8"))
+                results[index] = {"index": index, "status": "queued", "topic": topic}
+        by_topic = {}
+
+    for topic, entries in by_topic.items():
+        try:
+            results.update(await send_topic_batches(producer, topic, entries))
+        except Exception as e:
+            logger.error(f"⚠️ Envoi du lot {topic} échoué : {e}")
+            for index, _ in entries:
+                results[index] = {"index": index, "status": "rejected", "errors": [{"loc": [], "msg": str(e)}]}
+
+    accepted = sum(1 for r in results.values() if r["status"] in ("accepted", "queued"))
+    return {
+        "status": "envoyé" if accepted else "error",
+        "accepted": accepted,
+        "rejected": len(items) - accepted,
+        "results": [results[i] for i in range(len(items))],
+    }
\ No newline at end of file
@@ -0,0 +1,132 @@
+import logging
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("SpillLog")
+
+# (topic, key, value, headers) tel qu'envoyé à AIOKafkaProducer.send
+Record = Tuple[str, Optional[bytes], bytes, List[Tuple[str, bytes]]]
+
+_LEN = struct.Struct(">I")
+_NO_KEY = 0xFFFFFFFF
+
+
+def _pack_bytes(data: bytes) -> bytes:
+    return _LEN.pack(len(data)) + data
+
+
+def encode_record(record: Record) -> bytes:
+    topic, key, value, headers = record
+    body = [_pack_bytes(topic.encode("utf-8"))]
+    body.append(_LEN.pack(_NO_KEY) if key is None else _pack_bytes(key))
+    body.append(_LEN.pack(len(headers)))
+    for name, header_value in headers:
+        body.append(_pack_bytes(name.encode("utf-8")))
+        body.append(_pack_bytes(header_value))
+    body.append(_pack_bytes(value))
+    payload = b"".join(body)
+    return _LEN.pack(len(payload)) + payload
+
+
+def decode_record(payload: bytes) -> Record:
+    offset = 0
+
+    def read_len() -> int:
+        nonlocal offset
+        (length,) = _LEN.unpack_from(payload, offset)
+        offset += _LEN.size
+        return length
+
+    def read_bytes(length: int) -> bytes:
+        nonlocal offset
+        data = payload[offset:offset + length]
+        offset += length
+        return data
+
+    topic = read_bytes(read_len()).decode("utf-8")
+    key_len = read_len()
+    key = None if key_len == _NO_KEY else read_bytes(key_len)
+    headers = []
+    for _ in range(read_len()):
+        name = read_bytes(read_len()).decode("utf-8")
+        headers.append((name, read_bytes(read_len())))
+    value = read_bytes(read_len())
+    return topic, key, value, headers
+
+
+class SpillLog:
+    """Journal append-only de messages non livrés, découpé en segments.
+
+    Chaque enregistrement est préfixé par sa longueur ; un enregistrement tronqué
+    (arrêt brutal pendant l'écriture) en fin de segment est ignoré au rejeu.
+    Les segments sont rejoués du plus ancien au plus récent puis supprimés.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, segment_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.spilled_bytes_total = 0
+        self._active = None
+        self._active_path: Optional[Path] = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Segments laissés par une exécution précédente : rejoués à la prochaine connexion.
+        self.pending_bytes = sum(p.stat().st_size for p in self.segments())
+
+    def segments(self) -> List[Path]:
+        return sorted(self.directory.glob("segment-*.log"))
+
+    @property
+    def has_pending(self) -> bool:
+        return self.pending_bytes > 0
+
+    def append(self, record: Record) -> bool:
+        """Ajoute un message ; False si le plafond SPILL_MAX_BYTES est atteint."""
+        frame = encode_record(record)
+        if self.pending_bytes + len(frame) > self.max_bytes:
+            return False
+        if self._active is None or self._active.tell() + len(frame) > self.segment_bytes:
+            self._rotate()
+        self._active.write(frame)
+        self._active.flush()
+        self.pending_bytes += len(frame)
+        self.spilled_bytes_total += len(frame)
+        return True
+
+    def _rotate(self) -> None:
+        self.close()
+        self._active_path = self.directory / f"segment-{time.time_ns():020d}.log"
+        self._active = open(self._active_path, "ab")
+
+    def close(self) -> None:
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+            self._active_path = None
+
+    def sealed_segments(self) -> List[Path]:
+        # Le segment actif est scellé avant rejeu pour ne pas lire un fichier en cours d'écriture.
+        self.close()
+        return self.segments()
+
+    @staticmethod
+    def read_segment(path: Path) -> Iterator[Record]:
+        with open(path, "rb") as handle:
+            while True:
+                header = handle.read(_LEN.size)
+                if len(header) < _LEN.size:
+                    return
+                (length,) = _LEN.unpack(header)
+                payload = handle.read(length)
+                if len(payload) < length:
+                    logger.warning(f"⚠️ Enregistrement tronqué ignoré dans {path.name}")
+                    return
+                yield decode_record(payload)
+
+    def remove(self, path: Path) -> None:
+        size = path.stat().st_size
+        os.remove(path)
+        self.pending_bytes = max(self.pending_bytes - size, 0)
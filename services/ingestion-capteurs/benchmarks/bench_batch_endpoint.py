@@ -0,0 +1,66 @@
+"""Readings/s through POST / (one reading per request) vs POST /batch.
+
+Needs the ingestion API running on one uvicorn worker with Kafka reachable:
+
+    uvicorn app.main:app --workers 1 --port 8000
+    python benchmarks/bench_batch_endpoint.py --url http://localhost:8000 --readings 20000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+
+def make_readings(count: int) -> list[dict]:
+    return [
+        {"sensor_id": f"sensor-{i % 200}", "type": "temperature", "value": random.uniform(10, 35)}
+        for i in range(count)
+    ]
+
+
+async def bench_single(client: httpx.AsyncClient, readings: list[dict], concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(reading):
+        async with semaphore:
+            await client.post("/", json=reading)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(post(r) for r in readings))
+    return len(readings) / (time.perf_counter() - started)
+
+
+async def bench_batch(client: httpx.AsyncClient, readings: list[dict], batch_size: int, ndjson: bool) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(readings), batch_size):
+        chunk = readings[start:start + batch_size]
+        if ndjson:
+            body = "\n".join(json.dumps(r) for r in chunk)
+            response = await client.post("/batch", content=body, headers={"content-type": "application/x-ndjson"})
+        else:
+            response = await client.post("/batch", json=chunk)
+        response.raise_for_status()
+    return len(readings) / (time.perf_counter() - started)
+
+
+async def run(args) -> None:
+    readings = make_readings(args.readings)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        single = await bench_single(client, readings[: args.readings // 10], args.concurrency)
+        batch = await bench_batch(client, readings, args.batch_size, ndjson=False)
+        ndjson = await bench_batch(client, readings, args.batch_size, ndjson=True)
+    print(f"POST /        : {single:>10,.0f} readings/s")
+    print(f"POST /batch   : {batch:>10,.0f} readings/s (x{batch / single:.1f})")
+    print(f"POST /batch nd: {ndjson:>10,.0f} readings/s (x{ndjson / single:.1f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--readings", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""Per-message encode / decode / validate cost of each Kafka codec.
+
+    cd services/ingestion-capteurs
+    python benchmarks/bench_codecs.py --messages 100000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "consumer"))
+sys.path.insert(0, str(ROOT.parent / "common"))
+
+from agro_common.codecs import TopicCodecs, decode_message  # noqa: E402
+from app.schemas import SensorPayload  # noqa: E402
+
+CODECS = ("json", "orjson", "msgpack")
+TOPIC = "capteurs.temperature"
+
+
+def make_messages(count: int) -> list[dict]:
+    start = datetime.now(timezone.utc)
+    return [
+        {
+            "sensor_id": f"sensor-{i % 200}",
+            "type": "temperature",
+            "value": random.uniform(10, 35),
+            "timestamp": start + timedelta(seconds=i),
+            "metadata": {"parcel_id": f"P-{i % 20:03d}", "unit": "C"},
+        }
+        for i in range(count)
+    ]
+
+
+def per_message_us(started: float, count: int) -> float:
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def bench(codec: str, messages: list[dict]) -> dict:
+    codecs = TopicCodecs({TOPIC: codec})
+
+    started = time.perf_counter()
+    encoded = [codecs.encode(TOPIC, m) for m in messages]
+    encode_us = per_message_us(started, len(messages))
+
+    started = time.perf_counter()
+    decoded = [decode_message(value, headers) for value, headers in encoded]
+    decode_us = per_message_us(started, len(messages))
+
+    started = time.perf_counter()
+    for message in decoded:
+        SensorPayload(**message)
+    validate_us = per_message_us(started, len(messages))
+
+    return {
+        "bytes": sum(len(value) for value, _ in encoded) / len(encoded),
+        "encode": encode_us,
+        "decode": decode_us,
+        "validate": validate_us,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    print(f"{'codec':<8} | {'bytes/msg':>9} | {'encode µs':>9} | {'decode µs':>9} | {'validate µs':>11} | {'total µs':>8}")
+    for codec in CODECS:
+        r = bench(codec, messages)
+        total = r["encode"] + r["decode"] + r["validate"]
+        print(
+            f"{codec:<8} | {r['bytes']:>9.1f} | {r['encode']:>9.2f} | {r['decode']:>9.2f} "
+            f"| {r['validate']:>11.2f} | {total:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
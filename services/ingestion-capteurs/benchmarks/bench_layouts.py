@@ -0,0 +1,149 @@
+"""Table size, WAL volume and insert rate of the wide vs slim readings layouts.
+
+Writes the same readings through the COPY writer into each layout in turn, in
+consumer-sized batches, and reports rows/s, on-disk bytes per reading (table, TOAST
+and indexes, dimension and payload archive tables included) and WAL bytes per
+reading. Run against a throwaway local Postgres/TimescaleDB (the readings tables are
+dropped); without the timescaledb extension, plain tables are used:
+
+    cd services/ingestion-capteurs
+    DB_HOST=localhost DB_NAME=sensors_bench python benchmarks/bench_layouts.py --readings 200000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "consumer"))
+
+from sqlalchemy.sql import text  # noqa: E402
+
+from agro_common.rollups import HYPERTABLES  # noqa: E402
+from app.db import engine  # noqa: E402
+from app.schema import READINGS_VIEW, apply_schema, create_tables  # noqa: E402
+from app.schemas import SensorPayload  # noqa: E402
+from app.writer import CopyWriter  # noqa: E402
+
+SENSOR_TYPES = ("temperature", "humidite", "luminosite")
+TABLES = ("sensor_readings", "weather_readings", "sensors", "weather_stations", "sensor_payloads", "weather_payloads")
+
+
+def make_payloads(count: int, sensors: int) -> list[SensorPayload]:
+    """Readings as the simulator sends them: every sensor reports the three types each minute."""
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    payloads = []
+    for i in range(count):
+        sensor, tick = (i // 3) % sensors, i // (3 * sensors)
+        payloads.append(
+            SensorPayload(
+                sensor_id=f"field-{sensor:03d}-h1",
+                type=SENSOR_TYPES[i % 3],
+                value=random.uniform(0.0, 50.0),
+                timestamp=start + timedelta(minutes=tick),
+                metadata={
+                    "unit": "C",
+                    "parcel_id": f"P-{sensor % 20:03d}",
+                    "source": "station",
+                    "position": {"lat": 31.79, "lng": -7.09, "alt": 420},
+                    "quality_flag": "ok",
+                },
+            )
+        )
+    return payloads
+
+
+async def timescale_available() -> bool:
+    async with engine.connect() as conn:
+        return bool(await conn.scalar(text("SELECT count(*) FROM pg_available_extensions WHERE name = 'timescaledb'")))
+
+
+async def reset(layout: str, timescale: bool) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP VIEW IF EXISTS {READINGS_VIEW}"))
+        for table in HYPERTABLES:
+            for rollup in table.rollups:
+                await conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {rollup.view}"))
+        await conn.execute(text(f"DROP TABLE IF EXISTS {', '.join(TABLES)} CASCADE"))
+        if timescale:
+            await apply_schema(conn, layout)
+        else:
+            await create_tables(conn, layout)
+
+
+async def total_bytes(timescale: bool) -> int:
+    size = "hypertable_size(c.oid)" if timescale else "pg_total_relation_size(c.oid)"
+    async with engine.connect() as conn:
+        return await conn.scalar(
+            text(
+                f"SELECT coalesce(sum(coalesce({size}, pg_total_relation_size(c.oid))), 0)"
+                " FROM pg_class c WHERE c.relkind = 'r' AND c.relname = ANY(:tables)"
+            ),
+            {"tables": list(TABLES)},
+        )
+
+
+async def wal_lsn() -> str:
+    async with engine.connect() as conn:
+        return await conn.scalar(text("SELECT pg_current_wal_lsn()::text"))
+
+
+async def wal_since(lsn: str) -> int:
+    async with engine.connect() as conn:
+        return int(await conn.scalar(text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), CAST(:lsn AS text)::pg_lsn)"), {"lsn": lsn}))
+
+
+async def measure(layout: str, payloads, batch: int, sample_rate: float, timescale: bool) -> dict:
+    """The wide layout stores every raw payload; sample_rate only applies to the slim one."""
+    await reset(layout, timescale)
+    writer = CopyWriter(layout=layout, sample_rate=sample_rate)
+    await writer.start()
+    try:
+        lsn = await wal_lsn()
+        started = time.perf_counter()
+        for offset in range(0, len(payloads), batch):
+            await writer.write(payloads[offset:offset + batch], [])
+        elapsed = time.perf_counter() - started
+        wal = await wal_since(lsn)
+    finally:
+        await writer.close()
+    size = await total_bytes(timescale)
+    return {"rate": len(payloads) / elapsed, "size": size, "wal": wal}
+
+
+async def run(args) -> None:
+    timescale = await timescale_available()
+    payloads = make_payloads(args.readings, args.sensors)
+    print(
+        f"{len(payloads)} readings, {args.sensors} sensors, batches of {args.batch}, "
+        f"{'TimescaleDB hypertables' if timescale else 'plain PostgreSQL tables'}, "
+        f"slim payload sample rate {args.sample_rate}"
+    )
+    print(f"{'layout':>6} | {'rows/s':>9} | {'size MiB':>8} | {'B/row':>6} | {'WAL MiB':>8} | {'WAL B/row':>9}")
+    try:
+        results = {}
+        for layout in ("wide", "slim"):
+            results[layout] = r = await measure(layout, payloads, args.batch, args.sample_rate, timescale)
+            n = len(payloads)
+            print(
+                f"{layout:>6} | {r['rate']:>9,.0f} | {r['size'] / 2 ** 20:>8.1f} | {r['size'] / n:>6.0f} |"
+                f" {r['wal'] / 2 ** 20:>8.1f} | {r['wal'] / n:>9.0f}"
+            )
+        wide, slim = results["wide"], results["slim"]
+        print(
+            f"slim vs wide: x{slim['rate'] / wide['rate']:.1f} rows/s, "
+            f"/{wide['size'] / slim['size']:.1f} size, /{wide['wal'] / slim['wal']:.1f} WAL"
+        )
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readings", type=int, default=200_000)
+    parser.add_argument("--sensors", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=500, help="readings per write (CONSUMER_BATCH_MAX_RECORDS)")
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="RAW_PAYLOAD_SAMPLE_RATE of the slim run")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""Rows/s of the ORM writer vs the binary COPY writer.
+
+Run against a throwaway local Postgres/TimescaleDB (the tables are truncated):
+
+    cd services/ingestion-capteurs
+    DB_HOST=localhost DB_NAME=sensors_bench python benchmarks/bench_writer.py
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "consumer"))
+
+from sqlalchemy.sql import text  # noqa: E402
+
+from app.db import engine, init_db  # noqa: E402
+from app.schemas import SensorPayload  # noqa: E402
+from app.writer import CopyWriter, OrmWriter  # noqa: E402
+
+BATCH_SIZES = (1_000, 10_000, 100_000)
+SENSOR_TYPES = ("temperature", "humidite", "luminosite")
+
+
+def make_payloads(count: int) -> list[SensorPayload]:
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    return [
+        SensorPayload(
+            sensor_id=f"sensor-{i % 200}",
+            type=SENSOR_TYPES[i % 3],
+            value=random.uniform(0.0, 50.0),
+            timestamp=start + timedelta(milliseconds=i),
+            metadata={"parcel_id": f"P-{i % 20:03d}", "unit": "C"},
+        )
+        for i in range(count)
+    ]
+
+
+async def truncate() -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text("TRUNCATE sensor_readings"))
+
+
+async def measure(writer, payloads) -> float:
+    await truncate()
+    started = time.perf_counter()
+    await writer.write(payloads, [])
+    return len(payloads) / (time.perf_counter() - started)
+
+
+async def run() -> None:
+    await init_db()
+    writers = {"orm": OrmWriter(), "copy": CopyWriter()}
+    for writer in writers.values():
+        await writer.start()
+
+    print(f"{'rows':>8} | {'orm rows/s':>12} | {'copy rows/s':>12} | speedup")
+    try:
+        for size in BATCH_SIZES:
+            payloads = make_payloads(size)
+            orm_rate = await measure(writers["orm"], payloads)
+            copy_rate = await measure(writers["copy"], payloads)
+            print(f"{size:>8} | {orm_rate:>12,.0f} | {copy_rate:>12,.0f} | x{copy_rate / orm_rate:.1f}")
+    finally:
+        await truncate()
+        for writer in writers.values():
+            await writer.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
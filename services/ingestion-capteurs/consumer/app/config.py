@@ -26,9 +26,51 @@ DB_NAME = os.getenv("DB_NAME", "sensors")
 DATABASE_URL = (
     f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
+# Plain DSN for the raw asyncpg pool used by the COPY writer.
+ASYNCPG_DSN = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "4"))
+
+# "copy" streams batches with binary COPY, "orm" goes through SQLAlchemy.
+CONSUMER_WRITER = os.getenv("CONSUMER_WRITER", "copy").lower()
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+# Each worker process exposes /metrics on METRICS_PORT + worker_id.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9400"))
+METRICS_LAG_INTERVAL_S = float(os.getenv("METRICS_LAG_INTERVAL_S", "5"))
+
+# Micro-batching: drain up to BATCH_MAX_RECORDS messages (or wait at most
+# BATCH_LINGER_MS) before writing them in one transaction and committing offsets.
+BATCH_MAX_RECORDS = int(os.getenv("CONSUMER_BATCH_MAX_RECORDS", "500"))
+BATCH_LINGER_MS = int(os.getenv("CONSUMER_BATCH_LINGER_MS", "200"))
+BATCH_RETRY_BACKOFF_MS = int(os.getenv("CONSUMER_BATCH_RETRY_BACKOFF_MS", "1000"))
+
+# Number of consumer processes started by app.supervisor (0 = one per CPU).
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "0")) or os.cpu_count() or 1
+CONSUMER_SHUTDOWN_TIMEOUT_S = float(os.getenv("CONSUMER_SHUTDOWN_TIMEOUT_S", "30"))
+# A crashed worker is restarted after RESTART_BACKOFF_S, doubled on every consecutive
+# crash within RESTART_MIN_UPTIME_S of its start (e.g. Kafka or Postgres down) up to
+# RESTART_BACKOFF_MAX_S; the supervisor gives up on it after RESTART_MAX_FAILURES of them.
+CONSUMER_RESTART_BACKOFF_S = float(os.getenv("CONSUMER_RESTART_BACKOFF_S", "1"))
+CONSUMER_RESTART_BACKOFF_MAX_S = float(os.getenv("CONSUMER_RESTART_BACKOFF_MAX_S", "60"))
+CONSUMER_RESTART_MIN_UPTIME_S = float(os.getenv("CONSUMER_RESTART_MIN_UPTIME_S", "30"))
+CONSUMER_RESTART_MAX_FAILURES = int(os.getenv("CONSUMER_RESTART_MAX_FAILURES", "10"))
+
+# Row layout of the readings hypertables (switch an existing database with python -m app.migrate):
+# "wide" keeps metadata and the raw payload on every row; "slim" keys readings by
+# (sensor_id, type, observed_at), moves static metadata to the sensors / weather_stations
+# tables and archives the raw payload of RAW_PAYLOAD_SAMPLE_RATE of the readings only.
+READINGS_LAYOUT = os.getenv("READINGS_LAYOUT", "wide").lower()
+RAW_PAYLOAD_SAMPLE_RATE = float(os.getenv("RAW_PAYLOAD_SAMPLE_RATE", "0"))
+
+# TimescaleDB storage, applied by app.schema at startup (PostgreSQL interval strings).
+TIMESCALE_CHUNK_INTERVAL = os.getenv("TIMESCALE_CHUNK_INTERVAL", "1 day")
+# Chunks older than this are compressed (segmented by sensor/station id).
+TIMESCALE_COMPRESS_AFTER = os.getenv("TIMESCALE_COMPRESS_AFTER", "7 days")
+# Raw chunks older than this are dropped ("" keeps them); rollups have their own retention.
+TIMESCALE_RAW_RETENTION = os.getenv("TIMESCALE_RAW_RETENTION", "90 days")
+
 VALUE_BOUNDS = {
     "temperature": (-50.0, 80.0),
     "humidite": (0.0, 100.0),
@@ -1,33 +1,38 @@
 import logging
+from contextlib import asynccontextmanager
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.sql import text
+
+from agro_common import metrics
 
 from .config import DATABASE_URL
-from .models import Base
+from .schema import apply_schema
 
 logger = logging.getLogger(__name__)
 
 engine = create_async_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
+metrics.instrument_sqlalchemy(engine, pool="sqlalchemy")
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
-        await conn.execute(
-            text(
-                "SELECT create_hypertable('sensor_readings', 'observed_at', if_not_exists => TRUE)"
-            )
-        )
-        await conn.execute(
-            text(
-                "SELECT create_hypertable('weather_readings', 'observed_at', if_not_exists => TRUE)"
-            )
-        )
+        await apply_schema(conn)
     logger.info("TimescaleDB schema ready")
 
 
 def get_session() -> AsyncSession:
     return SessionLocal()
+
+
+@asynccontextmanager
+async def session_scope():
+    session = get_session()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
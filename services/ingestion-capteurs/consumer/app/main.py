@@ -1,118 +1,190 @@
 import asyncio
-import json
 import logging
-from contextlib import asynccontextmanager
+import time
 
 from aiokafka import AIOKafkaConsumer
 from pydantic import ValidationError
 
+from agro_common import metrics
+from agro_common.codecs import CodecError, decode_message
+
 from .config import (
+    BATCH_LINGER_MS,
+    BATCH_MAX_RECORDS,
+    BATCH_RETRY_BACKOFF_MS,
     KAFKA_BOOTSTRAP_SERVERS,
     KAFKA_CONSUMER_GROUP,
     KAFKA_TOPICS,
     LOG_LEVEL,
+    METRICS_LAG_INTERVAL_S,
+    METRICS_PORT,
 )
-from .db import get_session, init_db
-from .models import SensorReading, WeatherReading
+from .db import engine, init_db
 from .processing import clean_payload
 from .schemas import SensorPayload, WeatherPayload
+from .writer import create_writer
 
 logging.basicConfig(
     level=LOG_LEVEL,
     format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
 )
 logger = logging.getLogger("consumer")
+metrics.configure("ingestion-worker")
 
+WEATHER_TOPIC = "meteo.raw"
 
-@asynccontextmanager
-async def session_scope():
-    session = get_session()
-    try:
-        yield session
-        await session.commit()
-    except Exception:
-        await session.rollback()
-        raise
-    finally:
-        await session.close()
-
-
-async def handle_message(record, session):
-    # Check if this is a weather station message
-    if record.topic == "meteo.raw":
-        await handle_weather_message(record, session)
-    else:
-        await handle_sensor_message(record, session)
 
-
-async def handle_sensor_message(record, session):
-    payload = SensorPayload(**record.value)
-    cleaned = clean_payload(payload)
-    if cleaned is None:
-        return
-
-    raw_payload = cleaned.dict()
-    raw_payload["timestamp"] = cleaned.timestamp.isoformat()
-
-    reading = SensorReading(
-        sensor_id=cleaned.sensor_id,
-        sensor_type=cleaned.type,
-        value=cleaned.value,
-        observed_at=cleaned.timestamp,
-        extra_data=cleaned.metadata,
-        raw_payload=raw_payload,
-    )
-    session.add(reading)
-
-
-async def handle_weather_message(record, session):
-    payload = WeatherPayload(**record.value)
-    
-    raw_payload = payload.dict()
-    raw_payload["timestamp"] = payload.timestamp.isoformat()
-
-    reading = WeatherReading(
-        station_id=payload.station_id,
-        metric=payload.metric,
-        value=payload.value,
-        units=payload.units,
-        observed_at=payload.timestamp,
-        extra_data=payload.metadata,
-        raw_payload=raw_payload,
-    )
-    session.add(reading)
-
-
-async def consume():
-    await init_db()
+def build_payloads(batch):
+    """Split a drained batch into validated sensor and weather payloads, skipping invalid messages."""
+    sensors, weather = [], []
+    for records in batch.values():
+        for record in records:
+            try:
+                value = decode_message(record.value, record.headers)
+            except CodecError as exc:
+                logger.error(f"Undecodable message at {record.topic}[{record.partition}]@{record.offset}: {exc}")
+                continue
+            try:
+                if record.topic == WEATHER_TOPIC:
+                    weather.append(WeatherPayload(**value))
+                else:
+                    cleaned = clean_payload(SensorPayload(**value))
+                    if cleaned is not None:
+                        sensors.append(cleaned)
+            except ValidationError as exc:
+                logger.error(f"Validation failed: {exc.errors()}, payload: {value}")
+    return sensors, weather
+
+
+async def drain_batch(consumer):
+    """Collect records until BATCH_MAX_RECORDS is reached or BATCH_LINGER_MS elapses."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + BATCH_LINGER_MS / 1000
+    batch = {}
+    count = 0
+    while count < BATCH_MAX_RECORDS:
+        remaining_ms = int((deadline - loop.time()) * 1000)
+        if remaining_ms <= 0:
+            break
+        async with metrics.track("kafka", "getmany"):
+            chunk = await consumer.getmany(
+                timeout_ms=remaining_ms, max_records=BATCH_MAX_RECORDS - count
+            )
+        for tp, records in chunk.items():
+            batch.setdefault(tp, []).extend(records)
+            count += len(records)
+    return batch, count
+
+
+class WorkerStats:
+    """Throughput and lag figures a consumer reports when it stops."""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.messages = 0
+        self.batches = 0
+        self.started_at = time.monotonic()
+        self.elapsed_s = 0.0
+        self.lag = {}
+
+    def record_batch(self, count: int) -> None:
+        self.messages += count
+        self.batches += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "messages": self.messages,
+            "batches": self.batches,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "msgs_per_s": round(self.messages / self.elapsed_s, 1) if self.elapsed_s else 0.0,
+            "lag": self.lag,
+        }
+
+
+async def partition_lag(consumer) -> dict:
+    lag = {}
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        if highwater is None:
+            continue
+        position = await consumer.position(tp)
+        lag[f"{tp.topic}[{tp.partition}]"] = max(highwater - position, 0)
+        metrics.set_kafka_lag(tp.topic, tp.partition, max(highwater - position, 0))
+    return lag
+
+
+async def consume(stop_event=None, worker_id: int = 0, init_schema: bool = True) -> WorkerStats:
+    """Run one consumer of the group until stop_event (a threading/multiprocessing Event) is set."""
+    if init_schema:
+        await init_db()
+    metrics.serve(METRICS_PORT + worker_id)
+    metrics.start_loop_lag_monitor()
+    writer = create_writer()
+    await writer.start()
 
     consumer = AIOKafkaConsumer(
         *KAFKA_TOPICS,
         bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
         group_id=KAFKA_CONSUMER_GROUP,
-        value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+        # Values are decoded per message from their "codec" header (see build_payloads).
         enable_auto_commit=False,
         auto_offset_reset="earliest",
+        max_poll_records=BATCH_MAX_RECORDS,
     )
 
     await consumer.start()
-    logger.info("Kafka consumer started", extra={"topics": KAFKA_TOPICS})
+    logger.info(
+        "Kafka consumer started",
+        extra={
+            "topics": KAFKA_TOPICS,
+            "batch_max_records": BATCH_MAX_RECORDS,
+            "batch_linger_ms": BATCH_LINGER_MS,
+            "writer": type(writer).__name__,
+        },
+    )
 
+    stats = WorkerStats(worker_id)
+    loop = asyncio.get_running_loop()
+    next_lag_at = loop.time()
     try:
-        async for message in consumer:
+        while stop_event is None or not stop_event.is_set():
+            if loop.time() >= next_lag_at:
+                next_lag_at = loop.time() + METRICS_LAG_INTERVAL_S
+                await partition_lag(consumer)
+            batch, count = await drain_batch(consumer)
+            if not count:
+                continue
             try:
-                async with session_scope() as session:
-                    await handle_message(message, session)
-                await consumer.commit()
-            except ValidationError as exc:
-                logger.error(f"Validation failed: {exc.errors()}, payload: {message.value}")
-                await consumer.commit()  # Skip invalid messages
+                sensors, weather = build_payloads(batch)
+                await writer.write(sensors, weather)
+                # One offset commit per batch; invalid messages are skipped with it.
+                async with metrics.track("kafka", "commit"):
+                    await consumer.commit(
+                        {tp: records[-1].offset + 1 for tp, records in batch.items()}
+                    )
+                stats.record_batch(count)
             except Exception:
-                logger.exception("Failed to process message")
-                # Don't commit - will retry on restart
+                logger.exception("Failed to process batch of %d messages", count)
+                # Rewind to the first record of the batch so it is retried as a whole.
+                # Partitions revoked by a rebalance meanwhile are left to their new
+                # owner, which resumes from the last committed offset.
+                assigned = consumer.assignment()
+                for tp, records in batch.items():
+                    if tp in assigned:
+                        consumer.seek(tp, records[0].offset)
+                await asyncio.sleep(BATCH_RETRY_BACKOFF_MS / 1000)
     finally:
+        stats.elapsed_s = time.monotonic() - stats.started_at
+        try:
+            stats.lag = await partition_lag(consumer)
+        except Exception:
+            logger.exception("Could not compute partition lag")
         await consumer.stop()
+        await writer.close()
+        await engine.dispose()
         logger.info("Kafka consumer stopped")
+    return stats
 
 
 def main():
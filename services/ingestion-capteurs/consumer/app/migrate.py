@@ -0,0 +1,155 @@
+"""Moves an existing database from the wide readings layout to the slim one.
+
+    python -m app.migrate slim [--window "1 day"] [--drop-wide]
+
+Stop the consumers first and restart them with READINGS_LAYOUT=slim afterwards.
+
+1. the rollups and the readers' view are dropped, the wide hypertables (and their
+   indexes) renamed to ``<table>_wide``, and the slim schema created in their place;
+2. sensors / weather_stations are filled with each series' latest static metadata;
+3. readings are copied one time window per transaction, with ON CONFLICT DO NOTHING
+   (duplicates collapse onto the natural key, and an interrupted run can simply be
+   started again);
+4. the rollups are refreshed over the whole history.
+
+Raw payloads are not copied: ``<table>_wide`` keeps them until ``--drop-wide``.
+"""
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy.sql import text
+
+from agro_common.rollups import HYPERTABLES
+
+from .config import LOG_LEVEL
+from .db import engine
+from .schema import READINGS_VIEW, apply_schema, current_layout
+
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+)
+logger = logging.getLogger("consumer.migrate")
+
+# Per wide hypertable: dimension fill, then the per-window readings copy.
+_SLIM_COPIES = {
+    "sensor_readings": (
+        "INSERT INTO sensors (sensor_id, metadata)"
+        " SELECT DISTINCT ON (sensor_id) sensor_id, nullif(metadata - 'quality_flag', '{}'::jsonb)"
+        " FROM sensor_readings_wide WHERE metadata IS NOT NULL"
+        " ORDER BY sensor_id, observed_at DESC"
+        " ON CONFLICT (sensor_id) DO NOTHING",
+        "INSERT INTO sensor_readings (sensor_id, sensor_type, observed_at, value, quality_flag)"
+        " SELECT sensor_id, sensor_type, observed_at, value, metadata->>'quality_flag'"
+        " FROM sensor_readings_wide WHERE observed_at >= :start AND observed_at < :end"
+        " ON CONFLICT DO NOTHING",
+    ),
+    "weather_readings": (
+        "INSERT INTO weather_stations (station_id, metadata)"
+        " SELECT DISTINCT ON (station_id) station_id, nullif(metadata - 'quality_flag', '{}'::jsonb)"
+        " FROM weather_readings_wide WHERE metadata IS NOT NULL"
+        " ORDER BY station_id, observed_at DESC"
+        " ON CONFLICT (station_id) DO NOTHING",
+        "INSERT INTO weather_readings (station_id, metric, observed_at, value, units, quality_flag)"
+        " SELECT station_id, metric, observed_at, value, units, metadata->>'quality_flag'"
+        " FROM weather_readings_wide WHERE observed_at >= :start AND observed_at < :end"
+        " ON CONFLICT DO NOTHING",
+    ),
+}
+
+
+async def _table_exists(conn, name: str) -> bool:
+    return await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+
+
+async def _set_aside_wide(conn) -> None:
+    """Renames the wide hypertables out of the way (one transaction with the new schema)."""
+    await conn.execute(text(f"DROP VIEW IF EXISTS {READINGS_VIEW}"))
+    for table in HYPERTABLES:
+        # Continuous aggregates stay bound to the renamed table: rebuilt on the new one.
+        for rollup in table.rollups:
+            await conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {rollup.view}"))
+        indexes = list(
+            await conn.scalars(
+                text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"),
+                {"table": table.table},
+            )
+        )
+        wide = f"{table.table}_wide"
+        await conn.execute(text(f"ALTER TABLE {table.table} RENAME TO {wide}"))
+        # Index names are schema-wide: free them for the new table.
+        for index in indexes:
+            renamed = index.replace(table.table, wide, 1) if table.table in index else f"{index}_wide"
+            await conn.execute(text(f"ALTER INDEX {index} RENAME TO {renamed}"))
+        logger.info("Renamed %s to %s", table.table, wide)
+
+
+async def migrate_to_slim(window: str, drop_wide: bool) -> None:
+    async with engine.begin() as conn:
+        layout = await current_layout(conn)
+        if layout == "wide":
+            await _set_aside_wide(conn)
+            await apply_schema(conn, "slim")
+        elif layout is None:
+            raise RuntimeError("sensor_readings does not exist: nothing to migrate")
+
+    for table in HYPERTABLES:
+        wide = f"{table.table}_wide"
+        async with engine.begin() as conn:
+            if not await _table_exists(conn, wide):
+                logger.info("%s already dropped, skipping", wide)
+                continue
+            fill_dimension, copy_window = _SLIM_COPIES[table.table]
+            await conn.execute(text(fill_dimension))
+            windows = (
+                await conn.execute(
+                    text(
+                        "SELECT w, w + CAST(:window AS text)::interval FROM generate_series("
+                        f" (SELECT date_trunc('day', min(observed_at)) FROM {wide}),"
+                        f" (SELECT max(observed_at) FROM {wide}),"
+                        " CAST(:window AS text)::interval) AS w"
+                    ),
+                    {"window": window},
+                )
+            ).all()
+        copied = 0
+        for start, end in windows:
+            async with engine.begin() as conn:
+                result = await conn.execute(text(copy_window), {"start": start, "end": end})
+            copied += result.rowcount
+            logger.info("%s: copied %d rows of [%s, %s)", table.table, result.rowcount, start, end)
+        logger.info("%s: %d rows copied from %s", table.table, copied, wide)
+
+    # Refreshing a continuous aggregate cannot run inside a transaction.
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in HYPERTABLES:
+            for rollup in table.rollups:
+                await conn.execute(text(f"CALL refresh_continuous_aggregate('{rollup.view}', NULL, NULL)"))
+                logger.info("Refreshed %s", rollup.view)
+
+    if drop_wide:
+        async with engine.begin() as conn:
+            for table in HYPERTABLES:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {table.table}_wide"))
+        logger.info("Dropped the wide tables")
+
+
+async def _main(args) -> None:
+    try:
+        await migrate_to_slim(args.window, args.drop_wide)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("layout", choices=["slim"])
+    parser.add_argument("--window", default="1 day", help="time range copied per transaction (PostgreSQL interval)")
+    parser.add_argument("--drop-wide", action="store_true", help="drop the <table>_wide tables once copied")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
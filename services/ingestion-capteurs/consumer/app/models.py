@@ -1,4 +1,5 @@
-from sqlalchemy import Column, DateTime, Float, Integer, JSON, String
+from sqlalchemy import Column, DateTime, Float, Integer, JSON, String, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -27,3 +28,66 @@ class WeatherReading(Base):
     observed_at = Column(DateTime(timezone=True), nullable=False, index=True)
     extra_data = Column("metadata", JSON, nullable=True)
     raw_payload = Column(JSON, nullable=False)
+
+
+# Slim layout (READINGS_LAYOUT=slim): same table names, so a separate metadata.
+SlimBase = declarative_base()
+
+
+class SlimSensorReading(SlimBase):
+    __tablename__ = "sensor_readings"
+
+    sensor_id = Column(String, primary_key=True)
+    sensor_type = Column(String, primary_key=True)
+    observed_at = Column(DateTime(timezone=True), primary_key=True)
+    value = Column(Float, nullable=False)
+    quality_flag = Column(String, nullable=True)
+
+
+class SlimWeatherReading(SlimBase):
+    __tablename__ = "weather_readings"
+
+    station_id = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)
+    observed_at = Column(DateTime(timezone=True), primary_key=True)
+    value = Column(Float, nullable=True)
+    units = Column(String, nullable=True)
+    quality_flag = Column(String, nullable=True)
+
+
+class Sensor(SlimBase):
+    """Static metadata of a sensor (parcel, unit, position…), last value received."""
+
+    __tablename__ = "sensors"
+
+    sensor_id = Column(String, primary_key=True)
+    extra_data = Column("metadata", JSONB, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class WeatherStation(SlimBase):
+    __tablename__ = "weather_stations"
+
+    station_id = Column(String, primary_key=True)
+    extra_data = Column("metadata", JSONB, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class SensorPayloadArchive(SlimBase):
+    """Raw payloads kept for RAW_PAYLOAD_SAMPLE_RATE of the readings."""
+
+    __tablename__ = "sensor_payloads"
+
+    sensor_id = Column(String, primary_key=True)
+    sensor_type = Column(String, primary_key=True)
+    observed_at = Column(DateTime(timezone=True), primary_key=True)
+    raw_payload = Column(JSON, nullable=False)
+
+
+class WeatherPayloadArchive(SlimBase):
+    __tablename__ = "weather_payloads"
+
+    station_id = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)
+    observed_at = Column(DateTime(timezone=True), primary_key=True)
+    raw_payload = Column(JSON, nullable=False)
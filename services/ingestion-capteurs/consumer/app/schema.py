@@ -0,0 +1,287 @@
+"""TimescaleDB schema of the ingestion hypertables, applied once at consumer startup.
+
+Owns everything the readings tables need beyond their columns: hypertable chunk
+interval, indexes, native compression (segmented by sensor/station id, so a
+compressed batch holds one series in time order), raw-data retention, and the
+5 min / hourly / daily continuous aggregates defined in ``agro_common.rollups``
+with their refresh and retention policies. Every statement is idempotent.
+
+Two row layouts are supported (READINGS_LAYOUT, see config); ``python -m app.migrate``
+moves an existing database from the wide layout to the slim one.
+
+Policies are added with ``if_not_exists``: changing TIMESCALE_COMPRESS_AFTER or
+TIMESCALE_RAW_RETENTION on an existing database takes ``remove_*_policy`` first.
+"""
+import logging
+from datetime import timedelta
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import text
+
+from agro_common.rollups import HYPERTABLES, Hypertable, Rollup
+
+from .config import (
+    READINGS_LAYOUT,
+    TIMESCALE_CHUNK_INTERVAL,
+    TIMESCALE_COMPRESS_AFTER,
+    TIMESCALE_RAW_RETENTION,
+)
+
+logger = logging.getLogger(__name__)
+
+# Both layouts keep observed_at in the primary key: TimescaleDB requires the
+# partitioning column in every unique index.
+_TABLES = {
+    "wide": {
+        "sensor_readings": """
+            CREATE TABLE IF NOT EXISTS sensor_readings (
+                id              BIGSERIAL,
+                sensor_id       TEXT        NOT NULL,
+                sensor_type     TEXT        NOT NULL,
+                value           DOUBLE PRECISION NOT NULL,
+                observed_at     TIMESTAMPTZ NOT NULL,
+                metadata        JSONB,
+                raw_payload     JSONB       NOT NULL,
+                PRIMARY KEY (id, observed_at)
+            )""",
+        "weather_readings": """
+            CREATE TABLE IF NOT EXISTS weather_readings (
+                id              BIGSERIAL,
+                station_id      TEXT        NOT NULL,
+                metric          TEXT        NOT NULL,
+                value           DOUBLE PRECISION,
+                units           TEXT,
+                observed_at     TIMESTAMPTZ NOT NULL,
+                metadata        JSONB,
+                raw_payload     JSONB       NOT NULL,
+                PRIMARY KEY (id, observed_at)
+            )""",
+    },
+    # A sensor reports several types at the same instant, so the type is part of the
+    # natural key; a replayed reading conflicts instead of being stored twice.
+    "slim": {
+        "sensor_readings": """
+            CREATE TABLE IF NOT EXISTS sensor_readings (
+                sensor_id       TEXT        NOT NULL,
+                sensor_type     TEXT        NOT NULL,
+                observed_at     TIMESTAMPTZ NOT NULL,
+                value           DOUBLE PRECISION NOT NULL,
+                quality_flag    TEXT,
+                PRIMARY KEY (sensor_id, sensor_type, observed_at)
+            )""",
+        "weather_readings": """
+            CREATE TABLE IF NOT EXISTS weather_readings (
+                station_id      TEXT        NOT NULL,
+                metric          TEXT        NOT NULL,
+                observed_at     TIMESTAMPTZ NOT NULL,
+                value           DOUBLE PRECISION,
+                units           TEXT,
+                quality_flag    TEXT,
+                PRIMARY KEY (station_id, metric, observed_at)
+            )""",
+        "sensor_payloads": """
+            CREATE TABLE IF NOT EXISTS sensor_payloads (
+                sensor_id       TEXT        NOT NULL,
+                sensor_type     TEXT        NOT NULL,
+                observed_at     TIMESTAMPTZ NOT NULL,
+                raw_payload     JSONB       NOT NULL,
+                PRIMARY KEY (sensor_id, sensor_type, observed_at)
+            )""",
+        "weather_payloads": """
+            CREATE TABLE IF NOT EXISTS weather_payloads (
+                station_id      TEXT        NOT NULL,
+                metric          TEXT        NOT NULL,
+                observed_at     TIMESTAMPTZ NOT NULL,
+                raw_payload     JSONB       NOT NULL,
+                PRIMARY KEY (station_id, metric, observed_at)
+            )""",
+    },
+}
+
+# Payload archives of the slim layout: hypertable -> compression segment column.
+_ARCHIVES = {"sensor_payloads": "sensor_id", "weather_payloads": "station_id"}
+
+_DIMENSIONS = (
+    """
+    CREATE TABLE IF NOT EXISTS sensors (
+        sensor_id       TEXT        PRIMARY KEY,
+        metadata        JSONB,
+        updated_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS weather_stations (
+        station_id      TEXT        PRIMARY KEY,
+        metadata        JSONB,
+        updated_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+    )""",
+)
+
+# Series lookups; time-only scans use the (observed_at DESC) index create_hypertable
+# adds, and the slim layout's natural key already starts with the series.
+_INDEXES = {
+    "wide": {
+        "sensor_readings": (
+            "CREATE INDEX IF NOT EXISTS idx_sensor_readings_sensor_time ON sensor_readings (sensor_id, observed_at DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_sensor_readings_type_time ON sensor_readings (sensor_type, observed_at DESC)",
+            "DROP INDEX IF EXISTS idx_sensor_readings_observed_at",
+        ),
+        "weather_readings": (
+            "CREATE INDEX IF NOT EXISTS idx_weather_station_time ON weather_readings (station_id, observed_at DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_weather_metric_time ON weather_readings (metric, observed_at DESC)",
+            "DROP INDEX IF EXISTS idx_weather_observed_at",
+        ),
+    },
+    "slim": {
+        "sensor_readings": (
+            "CREATE INDEX IF NOT EXISTS idx_sensor_readings_type_time ON sensor_readings (sensor_type, observed_at DESC)",
+        ),
+        "weather_readings": (),
+    },
+}
+
+# Readers (pretraitement) query this view: same columns whatever the layout, with the
+# per-reading quality_flag folded back into the sensor's metadata.
+READINGS_VIEW = "sensor_readings_full"
+_VIEWS = {
+    "wide": f"""
+        CREATE OR REPLACE VIEW {READINGS_VIEW} AS
+        SELECT sensor_id, sensor_type, value, observed_at, metadata
+        FROM sensor_readings""",
+    "slim": f"""
+        CREATE OR REPLACE VIEW {READINGS_VIEW} AS
+        SELECT r.sensor_id, r.sensor_type, r.value, r.observed_at,
+               CASE WHEN r.quality_flag IS NULL THEN s.metadata
+                    ELSE coalesce(s.metadata, '{{}}'::jsonb) || jsonb_build_object('quality_flag', r.quality_flag)
+               END AS metadata
+        FROM sensor_readings r LEFT JOIN sensors s USING (sensor_id)""",
+}
+
+LAYOUTS = tuple(_TABLES)
+
+
+def _interval(value: timedelta) -> str:
+    # DDL takes no bind parameters: rollup buckets are rendered as literals.
+    return f"INTERVAL '{int(value.total_seconds())} seconds'"
+
+
+async def apply_schema(conn: AsyncConnection, layout: str = READINGS_LAYOUT) -> None:
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown READINGS_LAYOUT '{layout}' (expected one of {LAYOUTS})")
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+    current = await current_layout(conn)
+    if current not in (None, layout):
+        raise RuntimeError(
+            f"sensor_readings uses the {current} layout, READINGS_LAYOUT={layout}: run python -m app.migrate {layout}"
+        )
+    await create_tables(conn, layout)
+    for table in HYPERTABLES:
+        # Dropping raw chunks inside a refresh window would erase their rollup rows.
+        widest = max(rollup.refresh_start for rollup in table.rollups)
+        await _apply_hypertable(conn, table.table, table.segment_by, widest)
+        for rollup in table.rollups:
+            await _apply_rollup(conn, table, rollup)
+    if layout == "slim":
+        for name, segment_by in _ARCHIVES.items():
+            await _apply_hypertable(conn, name, segment_by, None)
+
+
+async def create_tables(conn: AsyncConnection, layout: str) -> None:
+    """Tables, indexes and the readers' view of `layout`: the plain PostgreSQL part of the schema."""
+    if layout == "slim":
+        for statement in _DIMENSIONS:
+            await conn.execute(text(statement))
+    for name, statement in _TABLES[layout].items():
+        await conn.execute(text(statement))
+        for index in _INDEXES[layout].get(name, ()):
+            await conn.execute(text(index))
+    await conn.execute(text(_VIEWS[layout]))
+
+
+async def current_layout(conn: AsyncConnection):
+    """'wide' or 'slim' from the columns of sensor_readings, None if it does not exist yet."""
+    columns = set(
+        await conn.scalars(
+            text("SELECT column_name FROM information_schema.columns WHERE table_name = 'sensor_readings'")
+        )
+    )
+    if not columns:
+        return None
+    return "wide" if "raw_payload" in columns else "slim"
+
+
+async def _apply_hypertable(conn: AsyncConnection, name: str, segment_by: str, widest_refresh) -> None:
+    await conn.execute(
+        text(
+            "SELECT create_hypertable(:table, 'observed_at',"
+            " chunk_time_interval => CAST(:chunk AS text)::interval, if_not_exists => TRUE)"
+        ),
+        {"table": name, "chunk": TIMESCALE_CHUNK_INTERVAL},
+    )
+    # Existing hypertables: applies to the chunks created from now on.
+    await conn.execute(
+        text("SELECT set_chunk_time_interval(:table, CAST(:chunk AS text)::interval)"),
+        {"table": name, "chunk": TIMESCALE_CHUNK_INTERVAL},
+    )
+
+    compressed = await conn.scalar(
+        text("SELECT compression_enabled FROM timescaledb_information.hypertables WHERE hypertable_name = :table"),
+        {"table": name},
+    )
+    if not compressed:
+        await conn.execute(
+            text(
+                f"ALTER TABLE {name} SET (timescaledb.compress,"
+                f" timescaledb.compress_segmentby = '{segment_by}',"
+                " timescaledb.compress_orderby = 'observed_at DESC')"
+            )
+        )
+    await conn.execute(
+        text("SELECT add_compression_policy(:table, CAST(:after AS text)::interval, if_not_exists => TRUE)"),
+        {"table": name, "after": TIMESCALE_COMPRESS_AFTER},
+    )
+
+    if TIMESCALE_RAW_RETENTION:
+        if widest_refresh is not None:
+            safe = await conn.scalar(
+                text("SELECT CAST(:retention AS text)::interval > CAST(:widest AS interval)"),
+                {"retention": TIMESCALE_RAW_RETENTION, "widest": widest_refresh},
+            )
+            if not safe:
+                raise ValueError(
+                    f"TIMESCALE_RAW_RETENTION={TIMESCALE_RAW_RETENTION!r} must exceed the widest rollup refresh window ({widest_refresh})"
+                )
+        await conn.execute(
+            text("SELECT add_retention_policy(:table, CAST(:retention AS text)::interval, if_not_exists => TRUE)"),
+            {"table": name, "retention": TIMESCALE_RAW_RETENTION},
+        )
+    logger.info("Hypertable %s ready", name)
+
+
+async def _apply_rollup(conn: AsyncConnection, table: Hypertable, rollup: Rollup) -> None:
+    keys = ", ".join(table.keys)
+    # materialized_only = false: queries add the not-yet-materialized recent buckets
+    # from the raw table (real-time aggregation).
+    await conn.execute(
+        text(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup.view}"
+            " WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS"
+            f" SELECT time_bucket({_interval(rollup.bucket)}, observed_at) AS bucket, {keys},"
+            " min(value) AS value_min, max(value) AS value_max,"
+            " avg(value) AS value_avg, count(value) AS value_count"
+            f" FROM {table.table} GROUP BY bucket, {keys}"
+            " WITH NO DATA"
+        )
+    )
+    await conn.execute(
+        text(
+            "SELECT add_continuous_aggregate_policy(:view, start_offset => CAST(:start AS interval),"
+            " end_offset => CAST(:end AS interval), schedule_interval => CAST(:schedule AS interval),"
+            " if_not_exists => TRUE)"
+        ),
+        {"view": rollup.view, "start": rollup.refresh_start, "end": rollup.refresh_end, "schedule": rollup.schedule},
+    )
+    if rollup.retention is not None:
+        await conn.execute(
+            text("SELECT add_retention_policy(:view, CAST(:retention AS interval), if_not_exists => TRUE)"),
+            {"view": rollup.view, "retention": rollup.retention},
+        )
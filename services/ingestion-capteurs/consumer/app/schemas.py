@@ -1,10 +1,26 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Any, Dict
 
 from dateutil import parser as date_parser
 from pydantic import BaseModel, Field, validator
 
 
+def parse_timestamp(value):
+    """Ensure timestamps are converted to datetime.
+
+    Binary codecs send epoch milliseconds; JSON sends ISO-8601, parsed with the
+    C-level fromisoformat first and dateutil only for the formats it rejects.
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return date_parser.isoparse(value)
+
+
 class SensorPayload(BaseModel):
     sensor_id: str
     type: str
@@ -12,12 +28,7 @@ class SensorPayload(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     metadata: Dict[str, Any] | None = None
 
-    @validator("timestamp", pre=True)
-    def parse_timestamp(cls, value):  # noqa: D401
-        """Ensure timestamps are converted to datetime."""
-        if isinstance(value, datetime):
-            return value
-        return date_parser.isoparse(value)
+    _parse_timestamp = validator("timestamp", pre=True, allow_reuse=True)(parse_timestamp)
 
 
 class WeatherPayload(BaseModel):
@@ -28,9 +39,4 @@ class WeatherPayload(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     metadata: Dict[str, Any] | None = None
 
-    @validator("timestamp", pre=True)
-    def parse_timestamp(cls, value):  # noqa: D401
-        """Ensure timestamps are converted to datetime."""
-        if isinstance(value, datetime):
-            return value
-        return date_parser.isoparse(value)
+    _parse_timestamp = validator("timestamp", pre=True, allow_reuse=True)(parse_timestamp)
@@ -0,0 +1,126 @@
+"""Runs CONSUMER_WORKERS consumer processes in the same Kafka consumer group.
+
+Kafka hands every partition to exactly one member of the group, and each worker
+processes its batches sequentially, so readings of a partition are never
+reordered. Every worker is a separate (spawned) process with its own event
+loop, Kafka client, SQLAlchemy engine and COPY pool. Workers beyond the number of
+partitions stay idle until a rebalance gives them work.
+
+A crashed worker is restarted with exponential backoff while it keeps failing
+shortly after starting (see CONSUMER_RESTART_* in app.config); after too many
+consecutive fast failures it is given up, and the supervisor exits non-zero once
+it stops.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import queue
+import signal
+import sys
+
+from agro_common.supervision import RestartPolicy, supervise
+
+from .config import (
+    CONSUMER_RESTART_BACKOFF_MAX_S,
+    CONSUMER_RESTART_BACKOFF_S,
+    CONSUMER_RESTART_MAX_FAILURES,
+    CONSUMER_RESTART_MIN_UPTIME_S,
+    CONSUMER_SHUTDOWN_TIMEOUT_S,
+    CONSUMER_WORKERS,
+    LOG_LEVEL,
+)
+from .db import engine, init_db
+
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format="%(asctime)s | %(levelname)s | %(processName)s | %(name)s | %(message)s",
+)
+logger = logging.getLogger("consumer.supervisor")
+
+
+def _run_worker(worker_id: int, stop_event, results) -> None:
+    # Shutdown is coordinated by the supervisor through stop_event.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from .main import consume
+
+    stats = asyncio.run(consume(stop_event=stop_event, worker_id=worker_id, init_schema=False))
+    results.put(stats.as_dict())
+
+
+async def _prepare_schema() -> None:
+    await init_db()
+    await engine.dispose()
+
+
+def _start_worker(ctx, worker_id: int, stop_event, results):
+    process = ctx.Process(
+        target=_run_worker,
+        args=(worker_id, stop_event, results),
+        name=f"consumer-{worker_id}",
+    )
+    process.start()
+    return process
+
+
+def _report(reports: list, workers: int) -> None:
+    total_messages = sum(r["messages"] for r in reports)
+    total_rate = sum(r["msgs_per_s"] for r in reports)
+    for r in sorted(reports, key=lambda r: r["worker_id"]):
+        logger.info(
+            "worker %d: %d msgs in %d batches, %.1f msgs/s, lag %s",
+            r["worker_id"], r["messages"], r["batches"], r["msgs_per_s"], r["lag"] or "{}",
+        )
+    logger.info(
+        "%d/%d workers reported: %d msgs total, %.1f msgs/s aggregate, total lag %d",
+        len(reports), workers, total_messages, total_rate,
+        sum(sum(r["lag"].values()) for r in reports),
+    )
+
+
+def main(workers: int = CONSUMER_WORKERS) -> None:
+    asyncio.run(_prepare_schema())
+
+    ctx = mp.get_context("spawn")
+    stop_event = ctx.Event()
+    results = ctx.Queue()
+
+    def request_stop(signum, _frame):
+        logger.info("Received signal %s, stopping %d workers", signum, workers)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    policy = RestartPolicy(
+        backoff_s=CONSUMER_RESTART_BACKOFF_S,
+        backoff_max_s=CONSUMER_RESTART_BACKOFF_MAX_S,
+        min_uptime_s=CONSUMER_RESTART_MIN_UPTIME_S,
+        max_failures=CONSUMER_RESTART_MAX_FAILURES,
+    )
+    logger.info("Starting %d consumer workers", workers)
+    processes, abandoned = supervise(
+        lambda worker_id: _start_worker(ctx, worker_id, stop_event, results), workers, stop_event, policy, logger
+    )
+
+    reports = []
+    for _ in processes:
+        try:
+            reports.append(results.get(timeout=CONSUMER_SHUTDOWN_TIMEOUT_S))
+        except queue.Empty:
+            break
+    for worker_id, process in processes.items():
+        process.join(timeout=CONSUMER_SHUTDOWN_TIMEOUT_S)
+        if process.is_alive():
+            logger.warning("Worker %d did not stop in time, terminating", worker_id)
+            process.terminate()
+
+    _report(reports, workers)
+    if abandoned:
+        # Non-zero exit, so the container's restart policy takes over.
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
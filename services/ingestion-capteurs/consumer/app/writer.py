@@ -0,0 +1,384 @@
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence
+
+import asyncpg
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from agro_common import metrics
+
+from .config import (
+    ASYNCPG_DSN,
+    CONSUMER_WRITER,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    RAW_PAYLOAD_SAMPLE_RATE,
+    READINGS_LAYOUT,
+)
+from .db import session_scope
+from .models import (
+    Sensor,
+    SensorPayloadArchive,
+    SensorReading,
+    SlimSensorReading,
+    SlimWeatherReading,
+    WeatherPayloadArchive,
+    WeatherReading,
+    WeatherStation,
+)
+from .schemas import SensorPayload, WeatherPayload
+
+logger = logging.getLogger(__name__)
+
+SENSOR_TABLE = "sensor_readings"
+SENSOR_COLUMNS = (
+    "sensor_id",
+    "sensor_type",
+    "value",
+    "observed_at",
+    "metadata",
+    "raw_payload",
+)
+
+WEATHER_TABLE = "weather_readings"
+WEATHER_COLUMNS = (
+    "station_id",
+    "metric",
+    "value",
+    "units",
+    "observed_at",
+    "metadata",
+    "raw_payload",
+)
+
+# Slim layout (READINGS_LAYOUT=slim): natural keys, no per-row metadata or raw payload.
+SLIM_SENSOR_COLUMNS = ("sensor_id", "sensor_type", "observed_at", "value", "quality_flag")
+SLIM_WEATHER_COLUMNS = ("station_id", "metric", "observed_at", "value", "units", "quality_flag")
+SENSOR_ARCHIVE_TABLE = "sensor_payloads"
+SENSOR_ARCHIVE_COLUMNS = ("sensor_id", "sensor_type", "observed_at", "raw_payload")
+WEATHER_ARCHIVE_TABLE = "weather_payloads"
+WEATHER_ARCHIVE_COLUMNS = ("station_id", "metric", "observed_at", "raw_payload")
+SENSOR_DIMENSION = "sensors"
+WEATHER_DIMENSION = "weather_stations"
+
+# Metadata describing one reading rather than its sensor: stays on the slim row.
+READING_METADATA_KEYS = ("quality_flag",)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Payload timestamps default to naive utcnow(); TIMESTAMPTZ needs an aware value.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _dumps(value) -> str | None:
+    return None if value is None else json.dumps(value)
+
+
+def sensor_record(payload: SensorPayload) -> tuple:
+    return (
+        payload.sensor_id,
+        payload.type,
+        payload.value,
+        _as_utc(payload.timestamp),
+        _dumps(payload.metadata),
+        payload.json(),
+    )
+
+
+def weather_record(payload: WeatherPayload) -> tuple:
+    return (
+        payload.station_id,
+        payload.metric,
+        payload.value,
+        payload.units,
+        _as_utc(payload.timestamp),
+        _dumps(payload.metadata),
+        payload.json(),
+    )
+
+
+def _quality_flag(metadata: Dict[str, Any] | None) -> str | None:
+    flag = metadata.get("quality_flag") if metadata else None
+    return None if flag is None else str(flag)
+
+
+def slim_sensor_record(payload: SensorPayload) -> tuple:
+    return (
+        payload.sensor_id,
+        payload.type,
+        _as_utc(payload.timestamp),
+        payload.value,
+        _quality_flag(payload.metadata),
+    )
+
+
+def slim_weather_record(payload: WeatherPayload) -> tuple:
+    return (
+        payload.station_id,
+        payload.metric,
+        _as_utc(payload.timestamp),
+        payload.value,
+        payload.units,
+        _quality_flag(payload.metadata),
+    )
+
+
+def sensor_archive_record(payload: SensorPayload) -> tuple:
+    return (payload.sensor_id, payload.type, _as_utc(payload.timestamp), payload.json())
+
+
+def weather_archive_record(payload: WeatherPayload) -> tuple:
+    return (payload.station_id, payload.metric, _as_utc(payload.timestamp), payload.json())
+
+
+def archived(series: str, kind: str, timestamp: datetime, rate: float) -> bool:
+    """Whether the raw payload of a reading is archived, for a `rate` share of the readings.
+
+    Hash-based rather than random, so a replayed batch archives the same readings.
+    """
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return zlib.crc32(f"{series}|{kind}|{_as_utc(timestamp).isoformat()}".encode()) < rate * 0x100000000
+
+
+def latest_metadata(payloads: Sequence, key: str) -> Dict[str, Dict[str, Any]]:
+    """Static metadata (without READING_METADATA_KEYS) per sensor/station; the last payload of the batch wins."""
+    latest = {}
+    for payload in payloads:
+        if not payload.metadata:
+            continue
+        static = {k: v for k, v in payload.metadata.items() if k not in READING_METADATA_KEYS}
+        if static:
+            latest[getattr(payload, key)] = static
+    return latest
+
+
+class DimensionCache:
+    """Metadata this process last wrote per sensor/station.
+
+    Metadata rarely changes, so most batches upsert no dimension row at all.
+    """
+
+    def __init__(self):
+        self._written: Dict[tuple, str] = {}
+
+    def changes(self, table: str, latest: Dict[str, Dict[str, Any]]) -> List[tuple]:
+        rows = []
+        # Sorted: concurrent workers lock dimension rows in the same order.
+        for key in sorted(latest):
+            encoded = json.dumps(latest[key], sort_keys=True)
+            if self._written.get((table, key)) != encoded:
+                rows.append((key, encoded))
+        return rows
+
+    def remember(self, table: str, rows: List[tuple]) -> None:
+        for key, encoded in rows:
+            self._written[(table, key)] = encoded
+
+
+def _upsert_dimension_sql(table: str, key: str) -> str:
+    return (
+        f"INSERT INTO {table} ({key}, metadata) VALUES ($1, $2::jsonb) "
+        f"ON CONFLICT ({key}) DO UPDATE SET metadata = EXCLUDED.metadata, updated_at = now() "
+        f"WHERE {table}.metadata IS DISTINCT FROM EXCLUDED.metadata"
+    )
+
+
+def _insert_sql(table: str, columns: Sequence[str]) -> str:
+    placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+        "ON CONFLICT DO NOTHING"
+    )
+
+
+class CopyWriter:
+    """Writes batches into the hypertables with binary COPY on a raw asyncpg pool.
+
+    Rows are handed to COPY as plain tuples, and JSON columns are serialized exactly
+    once. If COPY hits a uniqueness conflict the batch is re-inserted with executemany
+    and ON CONFLICT DO NOTHING. Only the slim layout has a natural key, so only there
+    is a batch replayed after a crash idempotent; the wide layout, keyed on
+    (id, observed_at), stores the replayed rows a second time.
+    """
+
+    def __init__(
+        self,
+        dsn: str = ASYNCPG_DSN,
+        min_size: int = DB_POOL_MIN_SIZE,
+        max_size: int = DB_POOL_MAX_SIZE,
+        layout: str = READINGS_LAYOUT,
+        sample_rate: float = RAW_PAYLOAD_SAMPLE_RATE,
+    ):
+        self._dsn = dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self._layout = layout
+        self._sample_rate = sample_rate
+        self._dimensions = DimensionCache()
+        self._pool: asyncpg.Pool | None = None
+
+    async def start(self) -> None:
+        self._pool = await asyncpg.create_pool(
+            self._dsn, min_size=self._min_size, max_size=self._max_size
+        )
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def write(self, sensors: List[SensorPayload], weather: List[WeatherPayload]) -> None:
+        if not sensors and not weather:
+            return
+        started = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            metrics.observe_pool_wait("asyncpg", time.perf_counter() - started)
+            async with conn.transaction():
+                if self._layout == "slim":
+                    upserted = await self._write_slim(conn, sensors, weather)
+                else:
+                    upserted = []
+                    if sensors:
+                        await self._copy(conn, SENSOR_TABLE, SENSOR_COLUMNS, [sensor_record(p) for p in sensors])
+                    if weather:
+                        await self._copy(conn, WEATHER_TABLE, WEATHER_COLUMNS, [weather_record(p) for p in weather])
+        # Only once committed: a rolled-back upsert must be retried with the next batch.
+        for table, rows in upserted:
+            self._dimensions.remember(table, rows)
+
+    async def _write_slim(self, conn, sensors: List[SensorPayload], weather: List[WeatherPayload]) -> List[tuple]:
+        upserted = []
+        for table, key, payloads in ((SENSOR_DIMENSION, "sensor_id", sensors), (WEATHER_DIMENSION, "station_id", weather)):
+            rows = self._dimensions.changes(table, latest_metadata(payloads, key))
+            if rows:
+                async with metrics.track("db", "UPSERT"):
+                    await conn.executemany(_upsert_dimension_sql(table, key), rows)
+                upserted.append((table, rows))
+        rate = self._sample_rate
+        if sensors:
+            await self._copy(conn, SENSOR_TABLE, SLIM_SENSOR_COLUMNS, [slim_sensor_record(p) for p in sensors])
+            archive = [sensor_archive_record(p) for p in sensors if archived(p.sensor_id, p.type, p.timestamp, rate)]
+            if archive:
+                await self._copy(conn, SENSOR_ARCHIVE_TABLE, SENSOR_ARCHIVE_COLUMNS, archive)
+        if weather:
+            await self._copy(conn, WEATHER_TABLE, SLIM_WEATHER_COLUMNS, [slim_weather_record(p) for p in weather])
+            archive = [weather_archive_record(p) for p in weather if archived(p.station_id, p.metric, p.timestamp, rate)]
+            if archive:
+                await self._copy(conn, WEATHER_ARCHIVE_TABLE, WEATHER_ARCHIVE_COLUMNS, archive)
+        return upserted
+
+    async def _copy(self, conn, table: str, columns: Sequence[str], records: List[tuple]) -> None:
+        try:
+            # Savepoint, so a failed COPY does not abort the surrounding transaction.
+            async with conn.transaction(), metrics.track("db", "COPY"):
+                await conn.copy_records_to_table(table, records=records, columns=columns)
+        except asyncpg.UniqueViolationError:
+            logger.warning("COPY into %s hit a conflict, falling back to executemany", table)
+            async with metrics.track("db", "INSERT"):
+                await conn.executemany(_insert_sql(table, columns), records)
+
+
+class OrmWriter:
+    """Writes batches through SQLAlchemy with one multi-row INSERT per table."""
+
+    def __init__(self, layout: str = READINGS_LAYOUT, sample_rate: float = RAW_PAYLOAD_SAMPLE_RATE):
+        self._layout = layout
+        self._sample_rate = sample_rate
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def write(self, sensors: List[SensorPayload], weather: List[WeatherPayload]) -> None:
+        if not sensors and not weather:
+            return
+        async with session_scope() as session:
+            if self._layout == "slim":
+                await self._write_slim(session, sensors, weather)
+                return
+            if sensors:
+                await session.execute(insert(SensorReading), [sensor_row(p) for p in sensors])
+            if weather:
+                await session.execute(insert(WeatherReading), [weather_row(p) for p in weather])
+
+    async def _write_slim(self, session, sensors: List[SensorPayload], weather: List[WeatherPayload]) -> None:
+        for model, key, payloads in ((Sensor, "sensor_id", sensors), (WeatherStation, "station_id", weather)):
+            latest = latest_metadata(payloads, key)
+            if not latest:
+                continue
+            table = model.__table__
+            stmt = pg_insert(table).values([{key: k, "metadata": latest[k]} for k in sorted(latest)])
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[key],
+                    set_={"metadata": stmt.excluded["metadata"], "updated_at": func.now()},
+                    where=table.c.metadata.is_distinct_from(stmt.excluded["metadata"]),
+                )
+            )
+        rate = self._sample_rate
+        if sensors:
+            rows = [dict(zip(SLIM_SENSOR_COLUMNS, slim_sensor_record(p))) for p in sensors]
+            await session.execute(pg_insert(SlimSensorReading).on_conflict_do_nothing(), rows)
+            archive = [sensor_row(p) for p in sensors if archived(p.sensor_id, p.type, p.timestamp, rate)]
+            if archive:
+                await session.execute(
+                    pg_insert(SensorPayloadArchive).on_conflict_do_nothing(),
+                    [{k: row[k] for k in ("sensor_id", "sensor_type", "observed_at", "raw_payload")} for row in archive],
+                )
+        if weather:
+            rows = [dict(zip(SLIM_WEATHER_COLUMNS, slim_weather_record(p))) for p in weather]
+            await session.execute(pg_insert(SlimWeatherReading).on_conflict_do_nothing(), rows)
+            archive = [weather_row(p) for p in weather if archived(p.station_id, p.metric, p.timestamp, rate)]
+            if archive:
+                await session.execute(
+                    pg_insert(WeatherPayloadArchive).on_conflict_do_nothing(),
+                    [{k: row[k] for k in ("station_id", "metric", "observed_at", "raw_payload")} for row in archive],
+                )
+
+
+def sensor_row(payload: SensorPayload) -> dict:
+    raw_payload = payload.dict()
+    raw_payload["timestamp"] = payload.timestamp.isoformat()
+
+    return {
+        "sensor_id": payload.sensor_id,
+        "sensor_type": payload.type,
+        "value": payload.value,
+        "observed_at": payload.timestamp,
+        "extra_data": payload.metadata,
+        "raw_payload": raw_payload,
+    }
+
+
+def weather_row(payload: WeatherPayload) -> dict:
+    raw_payload = payload.dict()
+    raw_payload["timestamp"] = payload.timestamp.isoformat()
+
+    return {
+        "station_id": payload.station_id,
+        "metric": payload.metric,
+        "value": payload.value,
+        "units": payload.units,
+        "observed_at": payload.timestamp,
+        "extra_data": payload.metadata,
+        "raw_payload": raw_payload,
+    }
+
+
+def create_writer(kind: str = CONSUMER_WRITER):
+    if kind == "orm":
+        return OrmWriter()
+    if kind == "copy":
+        return CopyWriter()
+    raise ValueError(f"Unknown CONSUMER_WRITER '{kind}' (expected 'copy' or 'orm')")
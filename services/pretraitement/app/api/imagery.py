@@ -1,83 +1,103 @@
 from __future__ import annotations
 
-import io
+import asyncio
 from datetime import datetime
 from pathlib import Path
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, File, Form, UploadFile, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import get_settings
-from ..db import get_session
+from ..db import AsyncSessionFactory, get_session
 from ..schemas import (
     ImageTilingRequest,
+    ImageUploadForm,
     JobCreateResponse,
     JobStatus,
     MinioObjectRef,
+    TileListResponse,
 )
 from ..services import imagery as imagery_service
 from ..storage import get_client
+from ..uploads import UploadError, promote_upload, receive_upload
+from ..workers import notify
 
 router = APIRouter(prefix='/imagery', tags=['imagery'])
 
+def multipart_body(form: type[BaseModel] | None = None) -> dict:
+    """OpenAPI requestBody for endpoints that parse their multipart body themselves."""
+    schema = form.model_json_schema() if form is not None else {"type": "object", "properties": {}}
+    schema["properties"] = {"file": {"type": "string", "format": "binary"}, **schema["properties"]}
+    schema["required"] = ["file", *schema.get("required", [])]
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": schema}}}}
 
-@router.post('/upload', status_code=status.HTTP_202_ACCEPTED)
+
+async def receive_to_raw_bucket(request: Request, form: type[BaseModel] | None = None):
+    """Streams the request's `file` part into the raw bucket under its content hash.
+
+    Returns (upload, reused, form values). Nothing is buffered beyond the upload
+    queue and the multipart parts in flight; see app/uploads.py.
+    """
+    settings = get_settings()
+    minio_client = get_client()
+    try:
+        upload = await receive_upload(request, minio_client, settings, settings.minio_raw_bucket)
+    except UploadError as exc:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    try:
+        values = None
+        if form is not None:
+            values = form.model_validate({k: v for k, v in upload.fields.items() if v != ""})
+    except ValidationError as exc:
+        await asyncio.to_thread(minio_client.remove_object, upload.bucket, upload.object_name)
+        raise HTTPException(422, detail=exc.errors(include_url=False)) from exc
+    upload.filename = Path(upload.filename or 'uav-image.tif').name
+    reused = await asyncio.to_thread(promote_upload, minio_client, upload)
+    return upload, reused, values
+
+
+@router.post('/upload', status_code=status.HTTP_202_ACCEPTED, openapi_extra=multipart_body(ImageUploadForm))
 async def upload_imagery(
-    parcel_id: Annotated[str, Form(description="Parcel ID")],
-    mission_id: Annotated[str, Form(description="Mission ID")],
-    file: Annotated[UploadFile, File(description="Image file to upload")],
-    tile_size: Annotated[int, Form(description="Tile size in pixels")] = 512,
-    overlap: Annotated[int, Form(description="Overlap between tiles in pixels")] = 64,
-    target_crs: Annotated[str, Form(description="Target CRS")] = "EPSG:4326",
+    request: Request,
     session: AsyncSession = Depends(get_session),
 ):
     """
     Upload a UAV image and automatically trigger tiling.
 
-    Returns upload info and tiling job ID.
+    Multipart body: the image as `file` plus the ImageUploadForm fields. The image is
+    streamed into MinIO as it arrives and stored under its SHA-256, so a retried upload
+    is stored once. Returns upload info and tiling job ID.
     """
-    settings = get_settings()
-    minio_client = get_client()
-
-    filename = Path(file.filename or 'uav-image.tif').name
-    object_name = f"{parcel_id}/{mission_id}/raw/{filename}"
-
-    # Read file content
-    content = await file.read()
-
-    # Upload to MinIO
-    minio_client.put_object(
-        settings.minio_raw_bucket,
-        object_name,
-        io.BytesIO(content),
-        length=len(content),
-        content_type=file.content_type or 'image/tiff',
-    )
+    upload, reused, form = await receive_to_raw_bucket(request, ImageUploadForm)
 
     # Automatically trigger tiling
     tiling_request = ImageTilingRequest(
-        source=MinioObjectRef(bucket=settings.minio_raw_bucket, object_name=object_name),
-        parcel_id=parcel_id,
-        mission_id=mission_id,
-        tile_size=tile_size,
-        overlap=overlap,
-        target_crs=target_crs,
+        source=MinioObjectRef(bucket=upload.bucket, object_name=upload.object_name),
+        source_sha256=upload.sha256,
+        **form.model_dump(),
     )
 
-    job_id = await imagery_service.create_tile_job(tiling_request, session)
+    upload_info = {
+        "bucket": upload.bucket,
+        "object_name": upload.object_name,
+        "filename": upload.filename,
+        "size_bytes": upload.size,
+        "sha256": upload.sha256,
+        "content_type": upload.content_type,
+        "reused": reused,
+    }
+    job_id = await imagery_service.create_tile_job(tiling_request, session, upload=upload_info)
     await session.commit()
+    notify()
 
     return {
-        "message": "Image uploaded successfully",
-        "upload": {
-            "bucket": settings.minio_raw_bucket,
-            "object_name": object_name,
-            "size_bytes": len(content),
-            "content_type": file.content_type,
-        },
+        "message": "Image already stored" if reused else "Image uploaded successfully",
+        "upload": upload_info,
         "tiling_job_id": job_id,
-        "tiling_status": "Tiling job created and processing automatically",
+        "tiling_status": "Tiling job queued",
     }
 
 
@@ -94,20 +114,38 @@ async def tile_existing_imagery(
     """
     job_id = await imagery_service.create_tile_job(request, session)
     await session.commit()
+    notify()
 
     return {
         "job_id": job_id,
-        "status": "Tiling job created",
+        "status": "Tiling job queued",
         "target_bucket": "uav-tiles",
     }
 
 
-@router.get("/tiles/{parcel_id}/{mission_id}", response_model=list)
+@router.get("/tiles/{parcel_id}/{mission_id}", response_model=TileListResponse)
 async def get_tiles(
     parcel_id: str,
     mission_id: str,
+    after: Annotated[int | None, Query(description="Last tile_id of the previous page")] = None,
+    limit: Annotated[int, Query(ge=1, le=5000)] = 1000,
     session: AsyncSession = Depends(get_session),
 ):
-    """List all tiles for a given parcel and mission."""
-    tiles = await imagery_service.list_tiles(parcel_id, mission_id, session)
-    return tiles
+    """One page of a mission's tiles ordered by tile_id; pass `nextAfter` back as `after`."""
+    tiles = await imagery_service.list_tiles(parcel_id, mission_id, session, after=after, limit=limit)
+    return TileListResponse(
+        items=[imagery_service.tile_info(tile) for tile in tiles],
+        nextAfter=tiles[-1].tile_id if len(tiles) == limit else None,
+    )
+
+
+@router.get("/tiles/{parcel_id}/{mission_id}/stream")
+async def stream_tiles(parcel_id: str, mission_id: str):
+    """Every tile of a mission as NDJSON, fetched page by page."""
+
+    async def lines():
+        async with AsyncSessionFactory() as session:
+            async for tile in imagery_service.iter_tiles(parcel_id, mission_id, session):
+                yield imagery_service.tile_info(tile).model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
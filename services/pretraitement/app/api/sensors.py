@@ -1,27 +1,62 @@
-from fastapi import APIRouter, Depends, status
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..schemas import JobCreateResponse, JobStatus, SensorCleaningRequest
+from ..services import cleaning
 from ..services import jobs as job_service
 from ..services import sensors as sensors_service
-from ..workers import schedule_sensor_cleaning
+from ..workers import notify
 from .deps import get_db_session
 
 router = APIRouter(prefix='/capteurs', tags=['capteurs'])
 
+# Per series, for GET /capteurs/{sensor_id}/series.
+MAX_SERIES_POINTS = 10_000
+
 
 @router.post('/clean', status_code=status.HTTP_202_ACCEPTED, response_model=JobCreateResponse)
 async def enqueue_sensor_cleaning(
     request: SensorCleaningRequest,
     session: AsyncSession = Depends(get_db_session),
 ) -> JobCreateResponse:
-    payload = request.model_dump(by_alias=True, exclude_none=True)
-    job = await job_service.create_job(session, 'sensor-cleaning', payload=payload)
+    if request.strategy not in cleaning.STRATEGIES:
+        raise HTTPException(422, detail=f"Unknown strategy '{request.strategy}', expected one of {sorted(cleaning.STRATEGIES)}")
+    if not request.readings and not request.parcel_id and not request.sensor_ids:
+        raise HTTPException(422, detail="Send readings, or parcel_id/sensorIds to clean from sensor_readings")
+    # JSON mode: the payload is stored as JSONB, timestamps become ISO strings.
+    payload = request.model_dump(mode='json', by_alias=True, exclude_none=True)
+    job = await job_service.create_job(session, sensors_service.CLEANING_JOB_TYPE, payload=payload)
     await session.commit()
-    schedule_sensor_cleaning(job.id, payload)
+    notify()
     return JobCreateResponse(jobId=job.id, status=JobStatus(job.status), type=job.job_type)
 
 
+@router.get('/{sensor_id}/series')
+async def get_sensor_series(
+    sensor_id: str,
+    from_timestamp: Annotated[datetime, Query(alias='fromTimestamp')],
+    to_timestamp: Annotated[Optional[datetime], Query(alias='toTimestamp')] = None,
+    resolution_s: Annotated[int, Query(alias='resolution', ge=1, le=31 * 86400, description='Seconds per point')] = 3600,
+    session: AsyncSession = Depends(get_db_session),
+) -> dict:
+    """Aggregates per `resolution` seconds, read from the 5 min / hourly / daily rollups when they fit."""
+    start = _aware(from_timestamp)
+    end = _aware(to_timestamp) if to_timestamp else datetime.now(timezone.utc)
+    resolution = timedelta(seconds=resolution_s)
+    if end <= start:
+        raise HTTPException(422, detail='toTimestamp must be after fromTimestamp')
+    if (end - start) / resolution > MAX_SERIES_POINTS:
+        raise HTTPException(422, detail=f"More than {MAX_SERIES_POINTS} points requested, raise resolution")
+    return await sensors_service.fetch_rollup_series(session, sensor_id, start, end, resolution)
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
 @router.get('/parcelles/{parcel_id}/latest')
 async def get_latest_series(
     parcel_id: str,
@@ -24,6 +24,55 @@ class Settings(BaseSettings):
     minio_raw_bucket: str = Field(default='uav-raw', alias='MINIO_RAW_BUCKET')
     minio_tiles_bucket: str = Field(default='uav-tiles', alias='MINIO_TILES_BUCKET')
 
+    # UAV tiling: the source is read window by window, either from a streamed local
+    # copy ('download') or straight from MinIO with ranged GETs through GDAL ('vsis3').
+    tiling_source_mode: Literal['download', 'vsis3'] = Field(default='download', alias='TILING_SOURCE_MODE')
+    tiling_tmp_dir: Optional[str] = Field(default=None, alias='TILING_TMP_DIR')
+    tiling_gdal_cache_mb: int = Field(default=64, alias='TILING_GDAL_CACHE_MB')
+    # Pipeline: one reader thread -> TILING_ENCODE_WORKERS processes -> bounded concurrent uploads.
+    tiling_encode_workers: int = Field(default=0, alias='TILING_ENCODE_WORKERS')  # 0 = one per CPU
+    tiling_upload_concurrency: int = Field(default=8, alias='TILING_UPLOAD_CONCURRENCY')
+    tiling_read_ahead: int = Field(default=16, alias='TILING_READ_AHEAD')
+    # Uploads stream into a MinIO multipart upload: at most UPLOAD_QUEUE_CHUNKS request chunks
+    # are queued and UPLOAD_PARALLEL_PARTS parts of UPLOAD_PART_SIZE_MB are in flight (see
+    # uploads.upload_memory_bound_mb for what one upload holds in total).
+    upload_part_size_mb: int = Field(default=8, ge=5, alias='UPLOAD_PART_SIZE_MB')
+    upload_parallel_parts: int = Field(default=2, ge=1, alias='UPLOAD_PARALLEL_PARTS')
+    upload_queue_chunks: int = Field(default=64, ge=1, alias='UPLOAD_QUEUE_CHUNKS')
+    # Tile metadata is upserted and committed every TILING_METADATA_CHUNK tiles.
+    tiling_metadata_chunk: int = Field(default=500, alias='TILING_METADATA_CHUNK')
+
+    # Pull-mode cleaning reads sensor_readings CLEANING_CHUNK_ROWS rows at a time; the readings
+    # within CLEANING_OVERLAP_S of a chunk edge are kept as context (outlier window, gaps,
+    # interpolation) and should span several readings of the sparsest series.
+    cleaning_chunk_rows: int = Field(default=100_000, ge=1000, alias='CLEANING_CHUNK_ROWS')
+    cleaning_overlap_s: float = Field(default=3600.0, ge=0, alias='CLEANING_OVERLAP_S')
+
+    # Job queue: preprocess_jobs rows are claimed with FOR UPDATE SKIP LOCKED by workers
+    # running in the API process (JOB_WORKER_EMBEDDED) and/or `python -m app.supervisor`.
+    job_worker_embedded: bool = Field(default=True, alias='JOB_WORKER_EMBEDDED')
+    job_worker_processes: int = Field(default=1, ge=1, alias='JOB_WORKER_PROCESSES')
+    # Jobs of a type running at once in one worker process, e.g. '{"tile_uav_image": 2}'.
+    job_concurrency: dict[str, int] = Field(
+        default={'tile_uav_image': 1, 'sensor-cleaning': 4}, alias='JOB_CONCURRENCY'
+    )
+    job_poll_interval_s: float = Field(default=1.0, gt=0, alias='JOB_POLL_INTERVAL_S')
+    job_heartbeat_s: float = Field(default=10.0, gt=0, alias='JOB_HEARTBEAT_S')
+    # A processing job whose heartbeat is older than this is orphaned and requeued.
+    job_lease_s: float = Field(default=60.0, gt=0, alias='JOB_LEASE_S')
+    job_max_attempts: int = Field(default=3, ge=1, alias='JOB_MAX_ATTEMPTS')
+    job_retry_backoff_s: float = Field(default=5.0, ge=0, alias='JOB_RETRY_BACKOFF_S')  # doubled per attempt
+    job_shutdown_timeout_s: float = Field(default=30.0, ge=0, alias='JOB_SHUTDOWN_TIMEOUT_S')
+    # `python -m app.supervisor` restarts a crashed worker after JOB_WORKER_RESTART_BACKOFF_S,
+    # doubled per consecutive crash within JOB_WORKER_RESTART_MIN_UPTIME_S of its start up to
+    # JOB_WORKER_RESTART_BACKOFF_MAX_S, and gives it up after JOB_WORKER_RESTART_MAX_FAILURES.
+    job_worker_restart_backoff_s: float = Field(default=1.0, ge=0, alias='JOB_WORKER_RESTART_BACKOFF_S')
+    job_worker_restart_backoff_max_s: float = Field(default=60.0, ge=0, alias='JOB_WORKER_RESTART_BACKOFF_MAX_S')
+    job_worker_restart_min_uptime_s: float = Field(default=30.0, ge=0, alias='JOB_WORKER_RESTART_MIN_UPTIME_S')
+    job_worker_restart_max_failures: int = Field(default=10, ge=1, alias='JOB_WORKER_RESTART_MAX_FAILURES')
+    # Standalone worker i serves its Prometheus metrics on WORKER_METRICS_PORT + i.
+    worker_metrics_port: int = Field(default=9101, alias='WORKER_METRICS_PORT')
+
     kafka_bootstrap_servers: Optional[str] = Field(default=None, alias='KAFKA_BOOTSTRAP_SERVERS')
     kafka_topic_events: str = Field(default='pretraitement.events', alias='KAFKA_PRETRAIT_TOPIC')
 
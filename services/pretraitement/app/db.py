@@ -1,7 +1,10 @@
 from collections.abc import AsyncGenerator
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
+from agro_common import metrics
+
 from .config import get_settings
 
 _settings = get_settings()
@@ -11,6 +14,7 @@ engine: AsyncEngine = create_async_engine(
     echo=False,
     pool_pre_ping=True,
 )
+metrics.instrument_sqlalchemy(engine, pool="timescale")
 
 AsyncSessionFactory = async_sessionmaker(
     engine,
@@ -27,8 +31,36 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         await session.close()
 
 
+# Idempotent upgrades for tables created before a column/index existed (create_all
+# only creates missing tables).
+_MIGRATIONS = (
+    "ALTER TABLE uav_tiles_meta ADD COLUMN IF NOT EXISTS tile_id INTEGER",
+    "UPDATE uav_tiles_meta SET tile_id = (metadata->>'tile_id')::int "
+    "WHERE tile_id IS NULL AND metadata ? 'tile_id'",
+    # Keep only the most recent row per tile before the unique index is built.
+    "DELETE FROM uav_tiles_meta t USING ("
+    " SELECT id, row_number() OVER ("
+    "  PARTITION BY parcel_id, mission_id, tile_id ORDER BY generated_at DESC) AS rn"
+    " FROM uav_tiles_meta WHERE tile_id IS NOT NULL) d "
+    "WHERE t.id = d.id AND d.rn > 1",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_uav_tiles_meta_parcel_mission_tile "
+    "ON uav_tiles_meta (parcel_id, mission_id, tile_id)",
+    "ALTER TABLE preprocess_jobs ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_preprocess_jobs_fingerprint "
+    "ON preprocess_jobs (fingerprint, updated_at DESC)",
+    "ALTER TABLE preprocess_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE preprocess_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMPTZ NOT NULL DEFAULT NOW()",
+    "ALTER TABLE preprocess_jobs ADD COLUMN IF NOT EXISTS locked_by VARCHAR(64)",
+    "ALTER TABLE preprocess_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ",
+    "CREATE INDEX IF NOT EXISTS ix_preprocess_jobs_pending "
+    "ON preprocess_jobs (job_type, run_after) WHERE status = 'pending'",
+)
+
+
 async def init_db() -> None:
     from .models import Base
 
     async with engine.begin() as connection:
-        await connection.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await connection.run_sync(Base.metadata.create_all)
+        for statement in _MIGRATIONS:
+            await connection.execute(text(statement))
\ No newline at end of file
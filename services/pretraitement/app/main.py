@@ -1,15 +1,19 @@
 from __future__ import annotations
 import time
-import io
 import httpx
+from agro_common import metrics
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 
 from .api import api_router
+from .api.imagery import multipart_body, receive_to_raw_bucket
 from .config import get_settings
 from .db import init_db
 from .logging import configure_logging
-from .storage import ensure_default_buckets
+from .services.tiling import shutdown_executors
+from .storage import ensure_default_buckets, get_client
+from .uploads import multipart_stream, object_chunks
+from .workers import start_embedded, stop_embedded
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -18,7 +22,11 @@ async def lifespan(app: FastAPI):
     await init_db()
     await ensure_default_buckets(settings)
     app.state.start_time = time.monotonic()
+    if settings.job_worker_embedded:
+        start_embedded(settings)
     yield
+    await stop_embedded()
+    shutdown_executors()
 
 settings = get_settings()
 app = FastAPI(
@@ -27,27 +35,40 @@ app = FastAPI(
     version="1.1.0",
     lifespan=lifespan,
 )
+metrics.instrument_fastapi(app, "pretraitement", enabled=settings.metrics_enabled)
 
 # Route pour le pipeline Drone -> Prétraitement -> Vision
-@app.post("/process-image")
-async def process_and_forward(file: UploadFile = File(...)):
+@app.post("/process-image", openapi_extra=multipart_body())
+async def process_and_forward(request: Request):
     """
     Validation du point 2 du cahier des charges : 
     Segmentation et nettoyage des images UAV avant analyse IA.
     """
     try:
-        content = await file.read()
+        # L'image est streamée vers MinIO à la réception (jamais entière en mémoire),
+        # puis relue par blocs pour être transmise au service vision.
+        upload, _, _ = await receive_to_raw_bucket(request)
         
         # --- SIMULATION PRÉTRAITEMENT (Nettoyage/Normalisation) ---
         # Ici le service utilise virtuellement Rasterio/Pillow pour préparer l'image
-        print(f"⚙️ Prétraitement actif : Segmentation de {file.filename}")
+        print(f"⚙️ Prétraitement actif : Segmentation de {upload.filename}")
 
         # --- TRANSMISSION AU SERVICE VISION (Point 3 du cahier des charges) ---
         # Le service vision est accessible via son nom de conteneur Docker
-        async with httpx.AsyncClient() as client:
-            files = {'file': (file.filename, io.BytesIO(content), file.content_type)}
+        content_type, body = multipart_stream(
+            "file",
+            upload.filename,
+            upload.content_type,
+            object_chunks(get_client(), upload.bucket, upload.object_name),
+        )
+        async with httpx.AsyncClient() as client, metrics.track("vision", "analyze"):
             # Appel interne vers le microservice vision
-            response = await client.post("http://agro_vision_plante:8000/analyze", files=files, timeout=10.0)
+            response = await client.post(
+                "http://agro_vision_plante:8000/analyze",
+                content=body,
+                headers={"Content-Type": content_type},
+                timeout=10.0,
+            )
             
         if response.status_code != 200:
             raise HTTPException(status_code=response.status_code, detail="Erreur lors de l'analyse vision")
@@ -55,7 +76,7 @@ async def process_and_forward(file: UploadFile = File(...)):
         return {
             "status": "Success",
             "step": "Pretreatment Completed",
-            "filename": file.filename,
+            "filename": upload.filename,
             "vision_results": response.json()
         }
     except Exception as e:
@@ -33,6 +33,18 @@ class PreprocessJob(Base):
     payload: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     result: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     error: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # Tiling jobs: hash of (source content, tiling parameters); equal fingerprints give equal tiles.
+    fingerprint: Mapped[str | None] = mapped_column(String(64))
+    # Queue state: workers claim pending rows whose run_after has passed (FOR UPDATE SKIP
+    # LOCKED), then keep heartbeat_at fresh while they hold them.
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text('0'))
+    run_after: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=text('NOW()'),
+    )
+    locked_by: Mapped[str | None] = mapped_column(String(64))
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
@@ -49,6 +61,17 @@ class PreprocessJob(Base):
     tiles: Mapped[list[UavTileMetadata]] = relationship(back_populates='job')
 
 
+# Finding a completed tiling job to reuse for a fingerprint.
+Index('ix_preprocess_jobs_fingerprint', PreprocessJob.fingerprint, PreprocessJob.updated_at.desc())
+# Claiming the next runnable job of a type; only pending rows are indexed.
+Index(
+    'ix_preprocess_jobs_pending',
+    PreprocessJob.job_type,
+    PreprocessJob.run_after,
+    postgresql_where=PreprocessJob.status == JobStatusEnum.pending.value,
+)
+
+
 class SensorSeriesNormalized(Base):
     __tablename__ = 'sensor_series_norm'
 
@@ -79,6 +102,7 @@ class UavTileMetadata(Base):
     job_id: Mapped[str | None] = mapped_column(String(64), ForeignKey('preprocess_jobs.id'), index=True)
     parcel_id: Mapped[str | None] = mapped_column(String(64), index=True)
     mission_id: Mapped[str | None] = mapped_column(String(64), index=True)
+    tile_id: Mapped[int | None] = mapped_column(Integer)
     tile_path: Mapped[str] = mapped_column(String(512), nullable=False)
     bounds: Mapped[dict | None] = mapped_column(JSONB)
     crs: Mapped[str | None] = mapped_column(String(32))
@@ -91,3 +115,11 @@ class UavTileMetadata(Base):
 
 Index('ix_uav_tiles_meta_parcel_generated', UavTileMetadata.parcel_id, UavTileMetadata.generated_at.desc())
 Index('ix_uav_tiles_meta_mission', UavTileMetadata.mission_id)
+# Keyset pagination of a mission's tiles; re-tiling a mission upserts on this key.
+Index(
+    'ux_uav_tiles_meta_parcel_mission_tile',
+    UavTileMetadata.parcel_id,
+    UavTileMetadata.mission_id,
+    UavTileMetadata.tile_id,
+    unique=True,
+)
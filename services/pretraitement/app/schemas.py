@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -40,6 +40,7 @@ class SensorReading(BaseModel):
 class SensorCleaningRequest(BaseModel):
     readings: List[SensorReading] | None = None
     parcel_id: Optional[str] = None
+    sensor_ids: Optional[List[str]] = Field(default=None, alias='sensorIds')
     from_timestamp: Optional[datetime] = Field(default=None, alias='fromTimestamp')
     to_timestamp: Optional[datetime] = Field(default=None, alias='toTimestamp')
     strategy: str = 'default'
@@ -59,11 +60,45 @@ class MinioObjectRef(BaseModel):
 
 class ImageTilingRequest(BaseModel):
     source: MinioObjectRef
+    # Hex SHA-256 of the source content; read from the object's metadata when omitted.
+    source_sha256: Optional[str] = Field(default=None, pattern=r'^[0-9a-f]{64}$')
     parcel_id: Optional[str] = None
     mission_id: Optional[str] = None
     tile_size: int = 512
     overlap: int = 0
     target_crs: str = 'EPSG:4326'
+    # Output pixel size in target_crs units; None keeps the source's ground sampling.
+    resolution: Optional[float] = Field(default=None, gt=0)
+    # 'tiles': fixed-size GeoTIFF tiles; 'cog': one Cloud-Optimized GeoTIFF with overviews;
+    # 'xyz': WebMercator {z}/{x}/{y} pyramid.
+    output_format: Literal['tiles', 'cog', 'xyz'] = 'tiles'
+
+
+class ImageUploadForm(BaseModel):
+    """Text fields of the multipart upload, sent alongside its `file` part."""
+
+    parcel_id: str
+    mission_id: str
+    tile_size: int = 512
+    overlap: int = 64
+    target_crs: str = 'EPSG:4326'
+    resolution: Optional[float] = Field(default=None, gt=0)
+    output_format: Literal['tiles', 'cog', 'xyz'] = 'tiles'
+
+
+class TileInfo(BaseModel):
+    tile_id: int
+    path: str
+    bounds: Dict[str, Any] | None = None
+    crs: Optional[str] = None
+    resolution: Optional[float] = None
+    job_id: Optional[str] = None
+    generated_at: Optional[datetime] = None
+
+
+class TileListResponse(BaseModel):
+    items: List[TileInfo]
+    next_after: Optional[int] = Field(default=None, alias='nextAfter')
 
 
 class JobCreateResponse(BaseModel):
@@ -0,0 +1,313 @@
+"""Vectorized cleaning of sensor series.
+
+All readings of a job sit in one DataFrame and every step works on whole columns: a
+series (sensor_id x metric_type) is a contiguous run of the sorted frame, identified by
+an integer group code, never a Python loop over readings. Steps, in order:
+
+1. invalid readings (no timestamp, non-finite value) are dropped;
+2. values outside METRIC_RANGES[metric_type] are dropped;
+3. duplicate timestamps within a series are dropped, the last reading wins;
+4. a value further than `outlier_threshold` robust z-scores from its rolling median
+   (scale: 1.4826 x rolling MAD) is flagged 'outlier', or dropped by strict strategies;
+5. a step longer than `gap_factor` x the series' median step flags 'gap' on the
+   reading after it;
+6. optionally, each series is resampled to a fixed grid (bucket mean); holes of at
+   most `interpolate_limit` buckets are linearly interpolated ('interpolated').
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+# Same bounds as the ingestion consumer; readings outside them are physically impossible.
+METRIC_RANGES: dict[str, tuple[float, float]] = {
+    'temperature': (-50.0, 80.0),
+    'humidite': (0.0, 100.0),
+    'luminosite': (0.0, 200000.0),
+}
+
+SERIES_KEY = ['sensor_id', 'metric_type']
+# Consistency constant making the MAD an estimator of the standard deviation for normal data.
+_MAD_SCALE = 1.4826
+
+
+@dataclass(frozen=True)
+class CleaningStrategy:
+    range_check: bool = True
+    deduplicate: bool = True
+    outlier_window: int = 11  # readings, centred; 0 disables outlier detection
+    outlier_threshold: float = 3.5
+    drop_outliers: bool = False
+    gap_factor: float = 3.0  # 0 disables gap detection
+    resample: Optional[str] = None  # pandas offset alias of the output grid, e.g. '15min'
+    interpolate_limit: int = 2  # grid buckets
+
+
+STRATEGIES: dict[str, CleaningStrategy] = {
+    'default': CleaningStrategy(),
+    'strict': CleaningStrategy(outlier_threshold=3.0, drop_outliers=True),
+    'range-only': CleaningStrategy(outlier_window=0, gap_factor=0),
+    'resample-15min': CleaningStrategy(drop_outliers=True, resample='15min'),
+    'resample-1h': CleaningStrategy(drop_outliers=True, resample='1h'),
+}
+
+
+def get_strategy(name: str) -> CleaningStrategy:
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown cleaning strategy '{name}' (expected one of {sorted(STRATEGIES)})") from None
+
+
+def empty_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            'parcel_id': pd.Series(dtype=object),
+            'sensor_id': pd.Series(dtype=object),
+            'metric_type': pd.Series(dtype=object),
+            'timestamp': pd.Series(dtype='datetime64[ns, UTC]'),
+            'value': pd.Series(dtype='float64'),
+            'quality_flag': pd.Series(dtype=object),
+            'meta': pd.Series(dtype=object),
+        }
+    )
+
+
+def frame_from_readings(readings: list[dict[str, Any]], parcel_id: Optional[str] = None) -> pd.DataFrame:
+    """Frame of SensorReading dicts (as stored in a job payload); malformed readings become invalid rows."""
+    if not readings:
+        return empty_frame()
+    metadata = [entry.get('metadata') or {} for entry in readings]
+    return pd.DataFrame(
+        {
+            'parcel_id': [parcel_id or meta.get('parcel_id') for meta in metadata],
+            'sensor_id': [entry.get('sensor_id') for entry in readings],
+            'metric_type': [entry.get('type') for entry in readings],
+            'timestamp': pd.to_datetime([entry.get('timestamp') for entry in readings], utc=True, errors='coerce', format='ISO8601'),
+            'value': pd.to_numeric(pd.Series([entry.get('value') for entry in readings], dtype=object), errors='coerce'),
+            'quality_flag': [meta.get('quality_flag') for meta in metadata],
+            'meta': [meta or None for meta in metadata],
+        }
+    )
+
+
+def between(frame: pd.DataFrame, start: Optional[datetime], end: Optional[datetime]) -> pd.DataFrame:
+    """Readings with start <= timestamp < end (either bound optional)."""
+    mask = np.ones(len(frame), dtype=bool)
+    if start is not None:
+        mask &= (frame['timestamp'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (frame['timestamp'] < pd.Timestamp(end)).to_numpy()
+    return frame if mask.all() else frame[mask]
+
+
+def clean_frame(
+    frame: pd.DataFrame,
+    strategy: CleaningStrategy,
+    emit: Optional[tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]] = None,
+) -> tuple[pd.DataFrame, dict[str, Any]]:
+    """Cleaned copy of `frame` (sorted by series then time) and counters for the job result.
+
+    With `emit=(low, high)`, readings outside [low, high) only serve as context (window
+    neighbours, gap steps, interpolation ends): they are neither returned nor counted.
+    """
+    emitted = _emit_mask(frame['timestamp'], emit)
+    stats: dict[str, Any] = {'input': int(emitted.sum()), 'dropped': {}, 'flagged': {}}
+
+    value = frame['value'].to_numpy(dtype='float64', na_value=np.nan)
+    invalid = ~np.isfinite(value) | frame['timestamp'].isna().to_numpy()
+    invalid |= frame['sensor_id'].isna().to_numpy() | frame['metric_type'].isna().to_numpy()
+    frame, emitted = _drop(frame, emitted, invalid, 'invalid', stats)
+
+    if strategy.range_check:
+        metric = frame['metric_type']
+        lower = metric.map({name: bounds[0] for name, bounds in METRIC_RANGES.items()}).to_numpy(dtype='float64', na_value=np.nan)
+        upper = metric.map({name: bounds[1] for name, bounds in METRIC_RANGES.items()}).to_numpy(dtype='float64', na_value=np.nan)
+        value = frame['value'].to_numpy()
+        # Metrics without bounds compare False against NaN and are kept.
+        frame, emitted = _drop(frame, emitted, (value < lower) | (value > upper), 'out_of_range', stats)
+
+    # Sort on integer codes rather than the strings themselves.
+    sensor, _ = pd.factorize(frame['sensor_id'], sort=True)
+    metric, metrics = pd.factorize(frame['metric_type'], sort=True)
+    ns = _nanoseconds(frame['timestamp'])
+    order = np.lexsort((ns, metric, sensor))
+    codes, ns, emitted = (sensor * len(metrics) + metric)[order], ns[order], emitted[order]
+    frame = frame.take(order).reset_index(drop=True)
+
+    if strategy.deduplicate:
+        # Sorted: a duplicate is followed by the same series and timestamp (keep the last one).
+        duplicate = np.zeros(len(codes), dtype=bool)
+        duplicate[:-1] = (codes[1:] == codes[:-1]) & (ns[1:] == ns[:-1])
+        frame, emitted = _drop(frame, emitted, duplicate, 'duplicates', stats)
+        codes, ns = codes[~duplicate], ns[~duplicate]
+
+    stats['series'] = len(_runs(codes[emitted])) if emitted.any() else 0
+    flags = frame['quality_flag'].fillna('ok').to_numpy(dtype=object, copy=True)
+
+    outlier = np.zeros(len(frame), dtype=bool)
+    if strategy.outlier_window and len(frame):
+        outlier = _outliers(frame['value'].to_numpy(), codes, strategy.outlier_window, strategy.outlier_threshold)
+    if strategy.drop_outliers:
+        frame, emitted = _drop(frame, emitted, outlier, 'outliers', stats)
+        codes, ns, flags = codes[~outlier], ns[~outlier], flags[~outlier]
+    else:
+        flags[outlier] = 'outlier'
+        stats['flagged']['outlier'] = int((outlier & emitted).sum())
+
+    if strategy.resample:
+        stats['resampled_from'] = int(emitted.sum())
+        frame = _resample(frame, codes, ns, strategy, stats, emit)
+    else:
+        if strategy.gap_factor and len(frame):
+            gap = _gaps(ns, codes, strategy.gap_factor) & (flags != 'outlier')
+            flags[gap] = 'gap'
+            stats['flagged']['gap'] = int((gap & emitted).sum())
+        frame = frame.assign(quality_flag=flags)
+        if not emitted.all():
+            frame = frame[emitted].reset_index(drop=True)
+
+    stats['output'] = len(frame)
+    return frame, stats
+
+
+def _emit_mask(timestamps: pd.Series, emit) -> np.ndarray:
+    """Readings inside [low, high); unparseable timestamps count as inside, to be reported as invalid."""
+    inside = np.ones(len(timestamps), dtype=bool)
+    if emit is None:
+        return inside
+    low, high = emit
+    if low is not None:
+        inside &= ~(timestamps < low).to_numpy()
+    if high is not None:
+        inside &= ~(timestamps >= high).to_numpy()
+    return inside
+
+
+def _drop(
+    frame: pd.DataFrame, emitted: np.ndarray, mask: np.ndarray, reason: str, stats: dict
+) -> tuple[pd.DataFrame, np.ndarray]:
+    stats['dropped'][reason] = int((mask & emitted).sum())
+    if not mask.any():
+        return frame, emitted
+    return frame[~mask].reset_index(drop=True), emitted[~mask]
+
+
+def _nanoseconds(timestamps: pd.Series) -> np.ndarray:
+    return pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+
+
+# Rows per block of the outlier windows: bounds the (rows x window) scratch arrays.
+_WINDOW_BLOCK = 1 << 16
+
+
+def _outliers(values: np.ndarray, codes: np.ndarray, window: int, threshold: float) -> np.ndarray:
+    """Hampel filter: |x - median(W)| > threshold x 1.4826 x median(|W - median(W)|).
+
+    W is the centred window of `window` readings, truncated at series boundaries.
+    """
+    offsets = np.arange(window) - window // 2
+    outlier = np.zeros(len(values), dtype=bool)
+    for start in range(0, len(values), _WINDOW_BLOCK):
+        rows = np.arange(start, min(start + _WINDOW_BLOCK, len(values)))
+        positions = rows[:, None] + offsets
+        index = np.clip(positions, 0, len(values) - 1)
+        inside = (positions == index) & (codes[index] == codes[rows, None])
+        windows = np.where(inside, values[index], np.nan)
+        median = _nanmedian_rows(windows)
+        mad = _nanmedian_rows(np.abs(windows - median[:, None]))
+        deviation = np.abs(values[rows] - median)
+        # A flat window (MAD 0) gives no scale to judge by.
+        outlier[rows] = (mad > 0) & (deviation > threshold * _MAD_SCALE * mad)
+    return outlier
+
+
+def _nanmedian_rows(windows: np.ndarray) -> np.ndarray:
+    """Row medians ignoring NaN: sorting puts NaN last, so the median is among the first `count` slots."""
+    ordered = np.sort(windows, axis=1)
+    count = np.count_nonzero(~np.isnan(windows), axis=1)
+    rows = np.arange(len(windows))
+    return (ordered[rows, np.maximum(count - 1, 0) // 2] + ordered[rows, count // 2]) / 2
+
+
+def _gaps(ns: np.ndarray, codes: np.ndarray, factor: float) -> np.ndarray:
+    step = np.empty(len(ns), dtype='float64')
+    step[0] = np.nan
+    step[1:] = np.diff(ns)
+    step[1:][codes[1:] != codes[:-1]] = np.nan  # first reading of each series
+    typical = pd.Series(step).groupby(codes, sort=False).transform('median').to_numpy()
+    return step > factor * typical
+
+
+def _runs(keys: np.ndarray) -> np.ndarray:
+    """Start offsets of the runs of equal consecutive keys."""
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _resample(
+    frame: pd.DataFrame, codes: np.ndarray, ns: np.ndarray, strategy: CleaningStrategy, stats: dict, emit=None
+) -> pd.DataFrame:
+    """One row per series and grid bucket, from each series' first to its last observed bucket.
+
+    Buckets are emitted when their start lies in `emit`; callers align its bounds on the grid.
+    """
+    if frame.empty:
+        return frame.assign(quality_flag=pd.Series(dtype=object))
+    freq = pd.Timedelta(strategy.resample).value
+    bucket = ns // freq
+
+    # Mean per (series, bucket): the frame is sorted on both, so each pair is a run.
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (bucket[1:] != bucket[:-1])])
+    means = np.add.reduceat(frame['value'].to_numpy(), starts) / np.diff(np.r_[starts, len(frame)])
+    observed_series, observed = codes[starts], bucket[starts]
+
+    first = _runs(observed_series)
+    run = np.cumsum(np.r_[True, observed_series[1:] != observed_series[:-1]]) - 1
+    origin = observed[first]
+    lengths = observed[np.r_[first[1:], len(observed)] - 1] - origin + 1
+    grid_start = np.cumsum(lengths) - lengths
+    grid_run = np.repeat(np.arange(len(first)), lengths)
+    grid_bucket = origin[grid_run] + np.arange(lengths.sum()) - grid_start[grid_run]
+    grid_value = np.full(len(grid_bucket), np.nan)
+    grid_value[grid_start[run] + observed - origin[run]] = means
+
+    filled, interpolated = _interpolate(grid_value, grid_run, strategy.interpolate_limit)
+    keep = ~np.isnan(filled)
+    # Holes too long to interpolate are dropped; the bucket after one is flagged 'gap'.
+    gap = keep & np.r_[False, ~keep[:-1] & (grid_run[1:] == grid_run[:-1])]
+    flags = np.where(interpolated, 'interpolated', np.where(gap, 'gap', 'ok')).astype(object)
+    keep &= _emit_mask(pd.Series(pd.to_datetime(grid_bucket * freq, utc=True)), emit)
+    stats['flagged']['interpolated'] = int((interpolated & keep).sum())
+    stats['flagged']['gap'] = int((gap & keep).sum())
+
+    series = frame.iloc[_runs(codes)]
+    rows = grid_run[keep]
+    return pd.DataFrame(
+        {
+            'parcel_id': series['parcel_id'].to_numpy()[rows],
+            'sensor_id': series['sensor_id'].to_numpy()[rows],
+            'metric_type': series['metric_type'].to_numpy()[rows],
+            'timestamp': pd.to_datetime(grid_bucket[keep] * freq, utc=True),
+            'value': filled[keep],
+            'quality_flag': flags[keep],
+            'meta': None,
+        }
+    )
+
+
+def _interpolate(values: np.ndarray, groups: np.ndarray, limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """Linear interpolation of NaN holes of at most `limit` points inside each group."""
+    position = np.arange(len(values), dtype='float64')
+    known = pd.DataFrame({'position': np.where(np.isnan(values), np.nan, position), 'value': values})
+    grouped = known.groupby(groups, sort=False)
+    before, after = grouped.ffill().to_numpy(), grouped.bfill().to_numpy()
+    with np.errstate(invalid='ignore'):
+        fill = np.isnan(values) & (after[:, 0] - before[:, 0] - 1 <= limit)
+    filled = values.copy()
+    ratio = (position[fill] - before[fill, 0]) / (after[fill, 0] - before[fill, 0])
+    filled[fill] = before[fill, 1] + (after[fill, 1] - before[fill, 1]) * ratio
+    return filled, fill
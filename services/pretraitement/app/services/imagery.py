@@ -1,221 +1,358 @@
 from __future__ import annotations
 
-import io
+import asyncio
+import hashlib
+import json
 import logging
 from datetime import datetime, timezone
 from uuid import uuid4
 
-import numpy as np
-import rasterio
-from rasterio.windows import Window
-from sqlalchemy import select
+from collections.abc import AsyncIterator
+
+from agro_common import metrics
+from minio.commonconfig import CopySource
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import get_session
+from ..db import AsyncSessionFactory
 from ..models import PreprocessJob, UavTileMetadata
-from ..schemas import JobStatus
-from ..storage import get_client
+from ..schemas import ImageTilingRequest, JobStatus, TileInfo
+from ..storage import get_client, object_sha256
 from ..config import get_settings
+from .pyramid import write_cog, xyz_tiles
+from .tiling import grid_tiles, run_tiling_pipeline
 
 logger = logging.getLogger(__name__)
 
+TILING_JOB_TYPE = "tile_uav_image"
+
 
-async def create_tile_job(req, session: AsyncSession) -> str:
-    """Create a tiling job and trigger processing."""
+async def create_tile_job(req, session: AsyncSession, upload: dict | None = None) -> str:
+    """Create a pending tiling job; a worker claims it once the caller commits."""
     job_id = f"job_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}_{uuid4().hex[:8]}"
     job = PreprocessJob(
         id=job_id,
-        job_type="tile_uav_image",
+        job_type=TILING_JOB_TYPE,
         status=JobStatus.pending.value,
         payload={
             "source": req.source.model_dump(),
+            "source_sha256": req.source_sha256,
             "parcel_id": req.parcel_id,
             "mission_id": req.mission_id,
             "tile_size": req.tile_size,
             "overlap": req.overlap,
             "target_crs": req.target_crs,
+            "resolution": req.resolution,
+            "output_format": req.output_format,
+            **({"upload": upload} if upload else {}),
         },
     )
     session.add(job)
-
-    # Note: metadata creation removed - will be created after tiling completes
     await session.flush()
-
-    # Start tiling asynchronously
-    import asyncio
-    asyncio.create_task(_process_tiling(job_id, req))
-
     return job_id
 
 
-async def _process_tiling(job_id: str, req):
-    """Process the actual tiling operation."""
-    async for session in get_session():
-        try:
-            # Update job status to processing
-            stmt = select(PreprocessJob).where(PreprocessJob.id == job_id)
-            result = await session.execute(stmt)
-            job = result.scalar_one()
-            job.status = JobStatus.processing.value
-            await session.commit()
-
-            logger.info(f"Starting tiling job {job_id}")
-
-            # Get MinIO client and settings
-            settings = get_settings()
-            minio_client = get_client()
-
-            # Download source image
-            logger.info(
-                f"Downloading source image: {req.source.bucket}/{req.source.object_name}"
-            )
-            response = minio_client.get_object(
-                req.source.bucket, req.source.object_name
-            )
-            image_bytes = response.read()
-            response.close()
-            response.release_conn()
-
-            # Process with rasterio
-            tiles_created = []
-            with rasterio.open(io.BytesIO(image_bytes)) as src:
-                width = src.width
-                height = src.height
-                bands = src.count
-                transform = src.transform
-                crs = src.crs
-
-                logger.info(
-                    f"Image properties: {width}x{height}, {bands} bands, CRS: {crs}"
+def tiling_fingerprint(req, source_sha256: str) -> str:
+    """Identity of a tiling output: same source content and parameters give the same tiles."""
+    key = {
+        "source_sha256": source_sha256,
+        "tile_size": req.tile_size,
+        "overlap": req.overlap,
+        "target_crs": req.target_crs,
+        "resolution": req.resolution,
+        "output_format": req.output_format,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+async def find_reusable_job(session: AsyncSession, fingerprint: str, job_id: str) -> PreprocessJob | None:
+    """Latest completed job with this fingerprint whose tiles are all still its own.
+
+    Re-tiling a mission upserts over its rows (and objects), so a job is only reusable
+    while every row it wrote still carries its job_id.
+    """
+    result = await session.execute(
+        select(PreprocessJob)
+        .where(PreprocessJob.fingerprint == fingerprint)
+        .where(PreprocessJob.status == JobStatus.completed.value)
+        .where(PreprocessJob.id != job_id)
+        .order_by(PreprocessJob.updated_at.desc())
+        .limit(1)
+    )
+    previous = result.scalar_one_or_none()
+    if previous is None:
+        return None
+    remaining = await session.scalar(
+        select(func.count()).select_from(UavTileMetadata).where(UavTileMetadata.job_id == previous.id)
+    )
+    return previous if remaining == (previous.result or {}).get("tiles_created") else None
+
+
+def retarget_tile_path(path: str, previous: dict, req) -> str:
+    """Key of a tile of the job with payload `previous` under `req`'s parcel and mission."""
+    old_mission = previous["mission_id"]
+    rest = path.removeprefix(f"{previous['parcel_id']}/{old_mission}/")
+    if rest.startswith(f"{old_mission}_"):
+        rest = req.mission_id + rest[len(old_mission):]
+    return f"{req.parcel_id}/{req.mission_id}/{rest}"
+
+
+async def reuse_tiles(session: AsyncSession, previous: PreprocessJob, job_id: str, req) -> int:
+    """Copies the tiles of `previous` to this job's parcel/mission without reading the source.
+
+    Objects are copied server-side rather than shared: re-tiling the previous mission
+    overwrites its keys in place, which would silently change the tiles served here.
+    """
+    settings = get_settings()
+    client = get_client()
+    bucket = settings.minio_tiles_bucket
+    in_flight = asyncio.Semaphore(settings.tiling_upload_concurrency)
+
+    async def copy(source_path: str, tile_path: str) -> None:
+        if source_path == tile_path:
+            return
+        async with in_flight, metrics.track("minio", "copy_object"):
+            await asyncio.to_thread(client.copy_object, bucket, tile_path, CopySource(bucket, source_path))
+
+    copied, after = 0, None
+    while True:
+        stmt = (
+            select(UavTileMetadata)
+            .where(UavTileMetadata.job_id == previous.id)
+            .order_by(UavTileMetadata.tile_id)
+            .limit(settings.tiling_metadata_chunk)
+        )
+        if after is not None:
+            stmt = stmt.where(UavTileMetadata.tile_id > after)
+        page = list((await session.execute(stmt)).scalars())
+        if not page:
+            return copied
+        rows = [
+            {
+                "job_id": job_id,
+                "parcel_id": req.parcel_id,
+                "mission_id": req.mission_id,
+                "tile_id": tile.tile_id,
+                "tile_path": retarget_tile_path(tile.tile_path, previous.payload, req),
+                "bounds": tile.bounds,
+                "crs": tile.crs,
+                "resolution": tile.resolution,
+                "generated_at": datetime.now(timezone.utc),
+                "meta": tile.meta,
+            }
+            for tile in page
+        ]
+        await asyncio.gather(*(copy(tile.tile_path, row["tile_path"]) for tile, row in zip(page, rows)))
+        await session.execute(_upsert_tiles_stmt(), rows)
+        copied += len(rows)
+        after = page[-1].tile_id
+        for tile in page:
+            session.expunge(tile)
+
+
+async def perform_tiling(session: AsyncSession, job_id: str, payload: dict, worker_id: str) -> dict:
+    """Worker handler of tile_uav_image jobs: tiles the source and returns the job result.
+
+    Tiles and their metadata are upserted, so a retried job overwrites what an earlier
+    attempt left behind.
+    """
+    req = ImageTilingRequest.model_validate(payload)
+    job = await session.get(PreprocessJob, job_id)
+    logger.info(f"Starting tiling job {job_id}")
+
+    settings = get_settings()
+    minio_client = get_client()
+
+    upload = payload.get("upload") or {}
+    source_sha256 = req.source_sha256 or await asyncio.to_thread(
+        object_sha256, minio_client, req.source.bucket, req.source.object_name
+    )
+    job.fingerprint = tiling_fingerprint(req, source_sha256) if source_sha256 else None
+    # A re-uploaded source is still streamed to staging; only its second stored copy is spared.
+    dedup = {
+        "source_sha256": source_sha256,
+        "storage_bytes_saved": upload.get("size_bytes", 0) if upload.get("reused") else 0,
+    }
+
+    previous = await find_reusable_job(session, job.fingerprint, job_id) if job.fingerprint else None
+    if previous is not None:
+        # Same content, same parameters: the tiles already exist, only their objects are copied.
+        tiles_reused = await reuse_tiles(session, previous, job_id, req)
+        pipeline = previous.result.get("pipeline", {})
+        stage = pipeline.get("stage_total_s", {})
+        logger.info(f"Tiling job {job_id} reused the {tiles_reused} tiles of {previous.id}")
+        return {
+            **{key: value for key, value in previous.result.items() if key not in ("pipeline", "dedup")},
+            "tiles_sample": [
+                {**tile, "path": retarget_tile_path(tile["path"], previous.payload, req)}
+                for tile in previous.result.get("tiles_sample", [])
+            ],
+            "tiles_written": tiles_reused,
+            "dedup": {
+                **dedup,
+                "reused_job": previous.id,
+                "tile_upload_bytes_saved": pipeline.get("bytes_uploaded", 0),
+                "cpu_s_saved": round(stage.get("read", 0) + stage.get("encode_cpu", 0), 3),
+            },
+        }
+    await session.commit()
+
+    # Read -> encode -> upload pipeline; the source is never loaded whole and
+    # the blocking stages run off the event loop.
+    logger.info(
+        f"Tiling source image: {req.source.bucket}/{req.source.object_name} "
+        f"({settings.tiling_source_mode})"
+    )
+    tile_writer = TileMetadataWriter(job_id, req, settings.tiling_metadata_chunk)
+    if req.output_format == "cog":
+        outcome = await asyncio.to_thread(write_cog, settings, minio_client, req)
+        for tile in outcome.tiles:
+            await tile_writer.add(tile, outcome.source)
+    else:
+        produce = xyz_tiles if req.output_format == "xyz" else grid_tiles
+        outcome = await run_tiling_pipeline(
+            settings, minio_client, req, on_tile=tile_writer.add, produce=produce
+        )
+    await tile_writer.flush()
+    tiles_created = outcome.tiles
+    tile_count = len(tiles_created)
+    width, height, crs = outcome.source["width"], outcome.source["height"], outcome.source["crs"]
+    stats = outcome.stats
+
+    logger.info(f"Tiling job {job_id} completed: {tile_count} tiles created")
+    return {
+        "tiles_created": tile_count,
+        "target_bucket": settings.minio_tiles_bucket,
+        "tiles_sample": tiles_created[:5],  # Store first 5 for reference
+        "original_size": {"width": width, "height": height},
+        "crs": str(crs),
+        "output_format": req.output_format,
+        "tiles_written": tile_writer.written,
+        "pipeline": stats.as_dict(),
+        "dedup": {
+            **dedup,
+            "reused_job": None,
+            "tiles_deduplicated": stats.tiles_deduplicated,
+            "tile_upload_bytes_saved": stats.upload_bytes_saved,
+            "cpu_s_saved": round(stats.encode_cpu_saved_s, 3),
+        },
+    }
+
+
+class TileMetadataWriter:
+    """Upserts uav_tiles_meta rows as tiles land, committing every `chunk_size` tiles.
+
+    Each chunk also records progress on the job, so a crash mid-job leaves the tiles
+    written so far listed and visible.
+    """
+
+    def __init__(self, job_id: str, req, chunk_size: int):
+        self.job_id = job_id
+        self.req = req
+        self.chunk_size = chunk_size
+        self.written = 0
+        self._rows: list[dict] = []
+        self._lock = asyncio.Lock()
+
+    async def add(self, tile_info: dict, source: dict) -> None:
+        self._rows.append(
+            {
+                "job_id": self.job_id,
+                "parcel_id": self.req.parcel_id,
+                "mission_id": self.req.mission_id,
+                "tile_id": tile_info["tile_id"],
+                "tile_path": tile_info["path"],
+                "bounds": tile_info["bounds"],
+                "crs": str(tile_info.get("crs") or source["crs"]),
+                "resolution": tile_info.get("resolution"),
+                "generated_at": datetime.now(timezone.utc),
+                "meta": {
+                    "tile_id": tile_info["tile_id"],
+                    "original_size": {"width": source["width"], "height": source["height"]},
+                    "tile_size": self.req.tile_size,
+                    "overlap": self.req.overlap,
+                    "format": self.req.output_format,
+                    **tile_info.get("meta", {}),
+                },
+            }
+        )
+        if len(self._rows) >= self.chunk_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            async with AsyncSessionFactory() as session:
+                await session.execute(_upsert_tiles_stmt(), rows)
+                self.written += len(rows)
+                await session.execute(
+                    update(PreprocessJob)
+                    .where(PreprocessJob.id == self.job_id)
+                    .values(result={"progress": {"tiles_written": self.written}})
                 )
+                await session.commit()
+
+
+def _upsert_tiles_stmt(stmt=None):
+    """INSERT .. ON CONFLICT (parcel_id, mission_id, tile_id) DO UPDATE, for rows or a from_select."""
+    stmt = stmt if stmt is not None else pg_insert(UavTileMetadata)
+    table = UavTileMetadata.__table__
+    key = (table.c.parcel_id, table.c.mission_id, table.c.tile_id)
+    return stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={column: stmt.excluded[column.key] for column in table.c if column not in key and not column.primary_key},
+    )
 
-                # Calculate stride (step size considering overlap)
-                stride = req.tile_size - req.overlap
-
-                # Generate tiles
-                tile_count = 0
-                for i in range(0, height, stride):
-                    for j in range(0, width, stride):
-                        # Calculate window size
-                        window_height = min(req.tile_size, height - i)
-                        window_width = min(req.tile_size, width - j)
-
-                        if window_height < req.tile_size // 2 or window_width < req.tile_size // 2:
-                            continue  # Skip small edge tiles
-
-                        # Read window
-                        window = Window(j, i, window_width, window_height)
-                        tile_data = src.read(window=window)
-
-                        # Calculate tile bounds
-                        tile_transform = src.window_transform(window)
-
-                        # Create tile filename
-                        tile_name = f"{req.mission_id}_tile_{tile_count:04d}.tif"
-                        tile_path = f"{req.parcel_id}/{req.mission_id}/{tile_name}"
-
-                        # Write tile to bytes
-                        tile_bytes = io.BytesIO()
-                        with rasterio.open(
-                            tile_bytes,
-                            "w",
-                            driver="GTiff",
-                            height=window_height,
-                            width=window_width,
-                            count=bands,
-                            dtype=tile_data.dtype,
-                            crs=crs,
-                            transform=tile_transform,
-                            compress="lzw",
-                        ) as dst:
-                            dst.write(tile_data)
-
-                        # Upload tile to MinIO
-                        tile_bytes.seek(0)
-                        minio_client.put_object(
-                            settings.minio_tiles_bucket,
-                            tile_path,
-                            tile_bytes,
-                            length=tile_bytes.getbuffer().nbytes,
-                            content_type="image/tiff",
-                        )
-
-                        tiles_created.append(
-                            {
-                                "tile_id": tile_count,
-                                "path": tile_path,
-                                "bounds": {
-                                    "col_off": j,
-                                    "row_off": i,
-                                    "width": window_width,
-                                    "height": window_height,
-                                },
-                            }
-                        )
-
-                        tile_count += 1
-                        if tile_count % 10 == 0:
-                            logger.info(f"Created {tile_count} tiles so far...")
-
-            logger.info(f"Total tiles created: {tile_count}")
-
-            # Create UavTileMetadata record for each tile
-            for tile_info in tiles_created:
-                tile_meta = UavTileMetadata(
-                    job_id=job_id,
-                    parcel_id=req.parcel_id,
-                    mission_id=req.mission_id,
-                    tile_path=tile_info["path"],
-                    bounds=tile_info["bounds"],
-                    crs=str(crs),
-                    resolution=None,
-                    meta={
-                        "tile_id": tile_info["tile_id"],
-                        "original_size": {"width": width, "height": height},
-                        "tile_size": req.tile_size,
-                        "overlap": req.overlap,
-                    },
-                )
-                session.add(tile_meta)
-
-            # Update job status to completed
-            job.status = JobStatus.completed.value
-            job.result = {
-                "tiles_created": tile_count,
-                "target_bucket": settings.minio_tiles_bucket,
-                "tiles_sample": tiles_created[:5],  # Store first 5 for reference
-                "original_size": {"width": width, "height": height},
-                "crs": str(crs),
-            }
 
-            await session.commit()
-            logger.info(f"Tiling job {job_id} completed: {tile_count} tiles created")
-
-        except Exception as e:
-            logger.error(f"Tiling job {job_id} failed: {e}", exc_info=True)
-            # Update job status to failed
-            stmt = select(PreprocessJob).where(PreprocessJob.id == job_id)
-            result = await session.execute(stmt)
-            job = result.scalar_one()
-            job.status = JobStatus.failed.value
-            job.error = {"message": str(e), "type": type(e).__name__}
-            await session.commit()
-        finally:
-            await session.close()
-            break
-
-
-async def list_tiles(parcel_id: str, mission_id: str, session: AsyncSession) -> list:
-    """List all tiles for a given parcel and mission."""
+def tile_info(tile: UavTileMetadata) -> TileInfo:
+    return TileInfo(
+        tile_id=tile.tile_id,
+        path=tile.tile_path,
+        bounds=tile.bounds,
+        crs=tile.crs,
+        resolution=tile.resolution,
+        job_id=tile.job_id,
+        generated_at=tile.generated_at,
+    )
+
+
+async def list_tiles(
+    parcel_id: str,
+    mission_id: str,
+    session: AsyncSession,
+    after: int | None = None,
+    limit: int = 1000,
+) -> list[UavTileMetadata]:
+    """One keyset page of a mission's tiles, ordered by tile_id (index ux_uav_tiles_meta_parcel_mission_tile)."""
     stmt = (
         select(UavTileMetadata)
         .where(UavTileMetadata.parcel_id == parcel_id)
         .where(UavTileMetadata.mission_id == mission_id)
+        .order_by(UavTileMetadata.tile_id)
+        .limit(limit)
     )
+    if after is not None:
+        stmt = stmt.where(UavTileMetadata.tile_id > after)
     result = await session.execute(stmt)
-    metadata = result.scalar_one_or_none()
-
-    if not metadata or not metadata.meta:
-        return []
-
-    return metadata.meta.get("tiles", [])
+    return list(result.scalars())
+
+
+async def iter_tiles(
+    parcel_id: str,
+    mission_id: str,
+    session: AsyncSession,
+    page_size: int = 1000,
+) -> AsyncIterator[UavTileMetadata]:
+    """Every tile of a mission, one page in memory at a time."""
+    after = None
+    while True:
+        page = await list_tiles(parcel_id, mission_id, session, after=after, limit=page_size)
+        for tile in page:
+            yield tile
+        if len(page) < page_size:
+            return
+        after = page[-1].tile_id
+        session.expunge_all()
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from collections.abc import Sequence
+from datetime import timedelta
 
-from sqlalchemy import select
+from sqlalchemy import case, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..models import JobStatusEnum, PreprocessJob
@@ -46,4 +47,143 @@ async def update_job_status(
     job.result = result_payload
     job.error = error_payload
     await session.flush()
-    return job
\ No newline at end of file
+    return job
+
+# --- Queue --------------------------------------------------------------------------
+# preprocess_jobs is the queue: a job is runnable when pending and its run_after has
+# passed. Every transition below is a single UPDATE, so concurrent workers (in any
+# process or node) never run a job twice.
+
+
+async def claim_job(session: AsyncSession, job_types: Sequence[str], worker_id: str) -> PreprocessJob | None:
+    """Marks the oldest runnable job of one of `job_types` as processing by `worker_id`.
+
+    Rows locked by another claim are skipped rather than waited on. The caller commits.
+    """
+    candidate = (
+        select(PreprocessJob.id)
+        .where(PreprocessJob.status == JobStatusEnum.pending.value)
+        .where(PreprocessJob.job_type.in_(job_types))
+        .where(PreprocessJob.run_after <= func.now())
+        .order_by(PreprocessJob.run_after)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(PreprocessJob)
+        .where(PreprocessJob.id == candidate)
+        .values(
+            status=JobStatusEnum.processing.value,
+            locked_by=worker_id,
+            heartbeat_at=func.now(),
+            attempts=PreprocessJob.attempts + 1,
+            updated_at=func.now(),
+        )
+        .returning(PreprocessJob)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+class LeaseLost(RuntimeError):
+    """The job was requeued or claimed by another worker while this one was running it."""
+
+
+def _owned(job_id: str, worker_id: str):
+    return update(PreprocessJob).where(
+        PreprocessJob.id == job_id,
+        PreprocessJob.status == JobStatusEnum.processing.value,
+        PreprocessJob.locked_by == worker_id,
+    ).execution_options(synchronize_session=False)
+
+
+async def heartbeat(session: AsyncSession, job_id: str, worker_id: str) -> bool:
+    """Extends the lease; False if the job is no longer held by `worker_id`."""
+    result = await session.execute(_owned(job_id, worker_id).values(heartbeat_at=func.now()))
+    return result.rowcount == 1
+
+
+async def save_progress(session: AsyncSession, job_id: str, worker_id: str, result_payload: dict) -> bool:
+    """Stores a running job's partial result; False if the job is no longer held by `worker_id`."""
+    result = await session.execute(_owned(job_id, worker_id).values(result=result_payload))
+    return result.rowcount == 1
+
+
+async def complete_job(session: AsyncSession, job_id: str, worker_id: str, result_payload: dict | None) -> bool:
+    result = await session.execute(
+        _owned(job_id, worker_id).values(
+            status=JobStatusEnum.completed.value,
+            result=result_payload,
+            error=None,
+            locked_by=None,
+            updated_at=func.now(),
+        )
+    )
+    return result.rowcount == 1
+
+
+async def fail_job(
+    session: AsyncSession,
+    job: PreprocessJob,
+    worker_id: str,
+    error_payload: dict,
+    max_attempts: int,
+    backoff_s: float,
+) -> JobStatusEnum:
+    """Requeues the job after an exponential backoff, or fails it once attempts are exhausted."""
+    if job.attempts < max_attempts:
+        status = JobStatusEnum.pending
+        delay = timedelta(seconds=backoff_s * 2 ** (job.attempts - 1))
+        values = {'run_after': func.now() + delay}
+    else:
+        status = JobStatusEnum.failed
+        values = {}
+    await session.execute(
+        _owned(job.id, worker_id).values(
+            status=status.value,
+            error={**error_payload, 'attempt': job.attempts, 'max_attempts': max_attempts},
+            locked_by=None,
+            updated_at=func.now(),
+            **values,
+        )
+    )
+    return status
+
+
+async def release_job(session: AsyncSession, job_id: str, worker_id: str) -> None:
+    """Puts back a job interrupted by a worker shutdown, without counting the attempt."""
+    await session.execute(
+        _owned(job_id, worker_id).values(
+            status=JobStatusEnum.pending.value,
+            attempts=PreprocessJob.attempts - 1,
+            locked_by=None,
+            run_after=func.now(),
+            updated_at=func.now(),
+        )
+    )
+
+
+async def recover_orphans(session: AsyncSession, lease_s: float, max_attempts: int) -> int:
+    """Requeues processing jobs whose worker stopped heartbeating (crash, kill, lost node).
+
+    Jobs left processing before heartbeats existed are judged by updated_at. A job
+    that has used all its attempts is failed instead.
+    """
+    last_seen = func.coalesce(PreprocessJob.heartbeat_at, PreprocessJob.updated_at)
+    exhausted = PreprocessJob.attempts >= max_attempts
+    result = await session.execute(
+        update(PreprocessJob)
+        .where(PreprocessJob.status == JobStatusEnum.processing.value)
+        .where(last_seen < func.now() - timedelta(seconds=lease_s))
+        .values(
+            status=case((exhausted, JobStatusEnum.failed.value), else_=JobStatusEnum.pending.value),
+            error={'message': 'Worker stopped heartbeating', 'type': 'OrphanedJob'},
+            locked_by=None,
+            run_after=func.now(),
+            updated_at=func.now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
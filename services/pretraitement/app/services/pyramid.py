@@ -0,0 +1,248 @@
+"""Multi-resolution outputs of the tiler: Cloud-Optimized GeoTIFF and XYZ/WebMercator pyramid.
+
+Both are produced in a single pass over the source:
+- COG: GDAL's COG driver streams the source once into an internally tiled GeoTIFF and
+  builds the overviews from that copy, so any zoom level is one ranged read.
+- XYZ: only the deepest zoom is warped from the source; each parent tile is the 2x2
+  average of its four children. Tiles are visited depth-first in quadtree order, so at
+  most four tiles per level are held at once whatever the mosaic size.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import math
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from typing import Optional
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from minio import Minio
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.io import DatasetReader
+from rasterio.transform import from_bounds
+from rasterio.warp import calculate_default_transform, reproject, transform_bounds
+
+from agro_common import metrics
+
+from ..config import Settings
+from .tiling import TileJob, TilingOutcome, content_digest, open_source
+from .warp import crs_label, geographic_bounds, plan_for
+
+logger = logging.getLogger(__name__)
+
+WEB_MERCATOR = "EPSG:3857"
+XYZ_TILE_PX = 256
+XYZ_MAX_ZOOM = 24
+_ORIGIN = 20037508.342789244  # half the WebMercator world width, in metres
+COG_CONTENT_TYPE = "image/tiff; application=geotiff; profile=cloud-optimized"
+
+
+# --- XYZ ---------------------------------------------------------------------------
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """(left, bottom, right, top) of an XYZ tile in WebMercator metres."""
+    size = 2 * _ORIGIN / (1 << z)
+    left = -_ORIGIN + x * size
+    top = _ORIGIN - y * size
+    return left, top - size, left + size, top
+
+
+def tiles_covering(bounds: tuple[float, float, float, float], z: int) -> Iterator[tuple[int, int]]:
+    left, bottom, right, top = bounds
+    size = 2 * _ORIGIN / (1 << z)
+    last = (1 << z) - 1
+    x0, x1 = max(int((left + _ORIGIN) // size), 0), min(int((right + _ORIGIN) // size), last)
+    y0, y1 = max(int((_ORIGIN - top) // size), 0), min(int((_ORIGIN - bottom) // size), last)
+    for y in range(y0, y1 + 1):
+        for x in range(x0, x1 + 1):
+            yield x, y
+
+
+def _intersects(a: tuple[float, ...], b: tuple[float, ...]) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def zoom_range(src: DatasetReader) -> tuple[int, int]:
+    """Deepest zoom matching the native resolution, and the zoom where the mosaic fits one tile."""
+    transform, width, height = calculate_default_transform(
+        src.crs, WEB_MERCATOR, src.width, src.height, *src.bounds
+    )
+    resolution = transform.a
+    max_zoom = math.ceil(math.log2(2 * _ORIGIN / (XYZ_TILE_PX * resolution)))
+    max_zoom = min(max(max_zoom, 0), XYZ_MAX_ZOOM)
+    levels = math.ceil(math.log2(max(width, height) / XYZ_TILE_PX)) if max(width, height) > XYZ_TILE_PX else 0
+    return max(max_zoom - levels, 0), max_zoom
+
+
+def _xyz_driver(src: DatasetReader) -> tuple[str, str, str]:
+    if src.count <= 4 and src.dtypes[0] in ("uint8", "uint16"):
+        return "PNG", "image/png", "png"
+    return "GTiff", "image/tiff", "tif"
+
+
+def _downsample(children: list[Optional[np.ndarray]], nodata, dtype, bands: int) -> np.ndarray:
+    """2x2 mosaic of child tiles averaged down to one tile, ignoring nodata pixels."""
+    mosaic = np.full((bands, 2 * XYZ_TILE_PX, 2 * XYZ_TILE_PX), nodata, dtype=dtype)
+    for i, child in enumerate(children):
+        if child is not None:
+            row, col = divmod(i, 2)
+            mosaic[:, row * XYZ_TILE_PX:(row + 1) * XYZ_TILE_PX, col * XYZ_TILE_PX:(col + 1) * XYZ_TILE_PX] = child
+    masked = np.ma.masked_equal(mosaic, nodata)
+    blocks = masked.reshape(bands, XYZ_TILE_PX, 2, XYZ_TILE_PX, 2)
+    averaged = blocks.mean(axis=(2, 4))
+    if np.issubdtype(dtype, np.integer):
+        averaged = np.ma.round(averaged)
+    return averaged.filled(nodata).astype(dtype)
+
+
+def xyz_tiles(src: DatasetReader, req) -> Iterator[TileJob]:
+    """WebMercator XYZ pyramid (output_format='xyz'), objects under {parcel}/{mission}/xyz/{z}/{x}/{y}.
+
+    The pyramid is always EPSG:3857 whatever the request's target_crs.
+    """
+    bands = src.count
+    dtype = np.dtype(src.dtypes[0])
+    nodata = src.nodata if src.nodata is not None else 0
+    source_bounds = transform_bounds(src.crs, WEB_MERCATOR, *src.bounds)
+    min_zoom, max_zoom = zoom_range(src)
+    driver, content_type, extension = _xyz_driver(src)
+    source_bands = rasterio.band(src, list(range(1, bands + 1)))
+    web_mercator = CRS.from_string(WEB_MERCATOR)
+    crs_wkt = web_mercator.to_wkt()
+    counter = itertools.count()
+    logger.info(f"XYZ pyramid: zooms {min_zoom}-{max_zoom}, {driver} tiles")
+
+    def warp(bounds) -> Optional[np.ndarray]:
+        data = np.full((bands, XYZ_TILE_PX, XYZ_TILE_PX), nodata, dtype=dtype)
+        reproject(
+            source_bands,
+            data,
+            dst_transform=from_bounds(*bounds, XYZ_TILE_PX, XYZ_TILE_PX),
+            dst_crs=WEB_MERCATOR,
+            src_nodata=nodata,
+            dst_nodata=nodata,
+            resampling=Resampling.bilinear,
+        )
+        return None if np.all(data == nodata) else data
+
+    def build(z: int, x: int, y: int):
+        bounds = tile_bounds(z, x, y)
+        if not _intersects(bounds, source_bounds):
+            return None
+        if z == max_zoom:
+            data = warp(bounds)
+        else:
+            children = []
+            for dy in (0, 1):
+                for dx in (0, 1):
+                    children.append((yield from build(z + 1, 2 * x + dx, 2 * y + dy)))
+            data = None if all(c is None for c in children) else _downsample(children, nodata, dtype, bands)
+        if data is not None:
+            yield TileJob(
+                info={
+                    "tile_id": next(counter),
+                    "path": f"{req.parcel_id}/{req.mission_id}/xyz/{z}/{x}/{y}.{extension}",
+                    "bounds": {
+                        **dict(zip(("left", "bottom", "right", "top"), bounds)),
+                        **geographic_bounds(web_mercator, bounds),
+                    },
+                    "crs": WEB_MERCATOR,
+                    "resolution": (bounds[2] - bounds[0]) / XYZ_TILE_PX,
+                    "meta": {"format": "xyz", "z": z, "x": x, "y": y},
+                },
+                data=data,
+                crs_wkt=crs_wkt,
+                transform=from_bounds(*bounds, XYZ_TILE_PX, XYZ_TILE_PX),
+                driver=driver,
+                content_type=content_type,
+                # PNG tiles carry no georeferencing: identical pixels are encoded once, then
+                # copied to each tile's own z/x/y key.
+                digest=content_digest(data, driver) if driver == "PNG" else None,
+            )
+        return data
+
+    for x, y in tiles_covering(source_bounds, min_zoom):
+        yield from build(min_zoom, x, y)
+
+
+# --- COG ---------------------------------------------------------------------------
+
+
+def cog_block_size(tile_size: int) -> int:
+    """COG blocks must be a multiple of 16; tile_size is used when it is one."""
+    return tile_size if tile_size % 16 == 0 and 64 <= tile_size <= 4096 else 512
+
+
+def write_cog(settings: Settings, client: Minio, req) -> TilingOutcome:
+    """Single internally tiled COG with overviews on the target_crs grid (output_format='cog').
+
+    Blocking: run in a thread.
+    """
+    outcome = TilingOutcome(tiles=[], source={})
+    stats = outcome.stats
+    started = time.perf_counter()
+    path = f"{req.parcel_id}/{req.mission_id}/{req.mission_id}_cog.tif"
+    fd, local = tempfile.mkstemp(prefix="uav-cog-", suffix=".tif", dir=settings.tiling_tmp_dir)
+    os.close(fd)
+    try:
+        with open_source(settings, client, req.source) as src:
+            outcome.source.update(width=src.width, height=src.height, bands=src.count, crs=src.crs)
+            block = cog_block_size(req.tile_size)
+            plan = plan_for(src, req)
+            # The COG driver warps while it copies, onto the same cached grid as per-tile output.
+            warp_options = {} if plan is None else {
+                "TARGET_SRS": plan.crs.to_wkt(),
+                "RES": plan.resolution,
+                "EXTENT": ",".join(str(v) for v in plan.bounds),
+                "WARP_RESAMPLING": "BILINEAR",
+            }
+            rasterio.shutil.copy(
+                src,
+                local,
+                driver="COG",
+                BLOCKSIZE=block,
+                COMPRESS="DEFLATE",
+                PREDICTOR="YES",
+                OVERVIEWS="AUTO",
+                OVERVIEW_RESAMPLING="AVERAGE",
+                BIGTIFF="IF_SAFER",
+                NUM_THREADS="ALL_CPUS",
+                **warp_options,
+            )
+        stats.read_s = time.perf_counter() - started
+
+        with rasterio.open(local) as cog:
+            overviews = cog.overviews(1)
+            crs, bounds, resolution = cog.crs, cog.bounds, cog.res[0]
+
+        upload_started = time.perf_counter()
+        with metrics.track("minio", "fput_object"):
+            client.fput_object(settings.minio_tiles_bucket, path, local, content_type=COG_CONTENT_TYPE)
+        stats.upload_s = time.perf_counter() - upload_started
+        stats.bytes_uploaded = os.path.getsize(local)
+        stats.tiles = 1
+    finally:
+        os.remove(local)
+        stats.wall_s = time.perf_counter() - started
+
+    outcome.tiles.append(
+        {
+            "tile_id": 0,
+            "path": path,
+            "bounds": {
+                **dict(zip(("left", "bottom", "right", "top"), bounds)),
+                **geographic_bounds(crs, tuple(bounds)),
+            },
+            "crs": crs_label(crs),
+            "resolution": resolution,
+            "meta": {"format": "cog", "block_size": block, "overviews": overviews},
+        }
+    )
+    return outcome
@@ -1,50 +1,295 @@
 from __future__ import annotations
 
-from datetime import datetime
+import asyncio
+import itertools
+import json
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
+import numpy as np
+import pandas as pd
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..models import SensorSeriesNormalized
+from agro_common import metrics, rollups
+
+from ..config import get_settings
+from ..db import engine
+from ..models import PreprocessJob, SensorSeriesNormalized
+from . import cleaning
+from . import jobs as job_service
+
+CLEANING_JOB_TYPE = 'sensor-cleaning'
 
 
 async def perform_cleaning(
     session: AsyncSession,
     job_id: str,
     payload: dict[str, Any],
+    worker_id: str,
 ) -> dict[str, Any]:
-    readings = payload.get('readings') or []
+    """Worker handler of sensor-cleaning jobs.
+
+    Cleans the payload's readings in one pass or, without any, pulls the raw readings
+    of `parcel_id` / `sensorIds` from sensor_readings chunk by chunk (see clean_stream),
+    restricted to [fromTimestamp, toTimestamp).
+    """
+    strategy_name = payload.get('strategy') or 'default'
+    strategy = cleaning.get_strategy(strategy_name)
     parcel_id = payload.get('parcel_id')
+    start = _parse_timestamp(payload.get('fromTimestamp'))
+    end = _parse_timestamp(payload.get('toTimestamp'))
 
-    normalized_count = 0
-    dropped_count = 0
-
-    for entry in readings:
-        try:
-            normalized = SensorSeriesNormalized(
-                job_id=job_id,
-                parcel_id=parcel_id or (entry.get('metadata', {}) or {}).get('parcel_id'),
-                sensor_id=entry['sensor_id'],
-                metric_type=entry['type'],
-                timestamp=datetime.fromisoformat(entry['timestamp'].replace('Z', '+00:00')),
-                value=float(entry['value']),
-                quality_flag=(entry.get('metadata') or {}).get('quality_flag'),
-                meta=entry.get('metadata'),
-            )
-            session.add(normalized)
-            normalized_count += 1
-        except Exception:
-            dropped_count += 1
+    readings = payload.get('readings')
+    if readings:
+        totals, timings = await clean_readings(session, job_id, readings, parcel_id, strategy, start, end)
+    else:
+        settings = get_settings()
+        totals, timings = await clean_stream(
+            session,
+            job_id,
+            worker_id,
+            strategy,
+            parcel_id=parcel_id,
+            sensor_ids=payload.get('sensorIds'),
+            start=start,
+            end=end,
+            chunk_rows=settings.cleaning_chunk_rows,
+            overlap=pd.Timedelta(seconds=settings.cleaning_overlap_s),
+        )
 
-    await session.flush()
+    stats = {key: value for key, value in totals.items() if key != 'normalized'}
     return {
-        'normalized_count': normalized_count,
-        'dropped_count': dropped_count,
+        'normalized_count': totals['normalized'],
+        'dropped_count': sum(stats['dropped'].values()),
         'parcel_id': parcel_id,
+        'metrics': {
+            'strategy': strategy_name,
+            **stats,
+            'timings_s': {step: round(seconds, 3) for step, seconds in timings.items()},
+        },
     }
 
 
+async def clean_readings(
+    session: AsyncSession,
+    job_id: str,
+    readings: list[dict[str, Any]],
+    parcel_id: str | None,
+    strategy: cleaning.CleaningStrategy,
+    start: datetime | None,
+    end: datetime | None,
+) -> tuple[dict[str, Any], dict[str, float]]:
+    """Cleans readings sent with the job (bounded by the request size) in a single pass."""
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    frame = cleaning.between(cleaning.frame_from_readings(readings, parcel_id), start, end)
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # CPU-bound: keep it off the event loop the API and other jobs share.
+    cleaned, stats = await asyncio.to_thread(cleaning.clean_frame, frame, strategy)
+    timings['clean'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    stats['normalized'] = await write_series(session, job_id, cleaned)
+    timings['write'] = time.perf_counter() - started
+    return stats, timings
+
+
+async def clean_stream(
+    session: AsyncSession,
+    job_id: str,
+    worker_id: str,
+    strategy: cleaning.CleaningStrategy,
+    *,
+    parcel_id: str | None,
+    sensor_ids: list[str] | None,
+    start: datetime | None,
+    end: datetime | None,
+    chunk_rows: int,
+    overlap: pd.Timedelta,
+) -> tuple[dict[str, Any], dict[str, float]]:
+    """Pulls raw readings from sensor_readings through a server-side cursor and cleans them chunk by chunk.
+
+    Readings arrive in observed_at order. Each chunk emits the readings before `high`
+    (the last fetched timestamp minus `overlap`, on the resampling grid if any); the
+    `overlap` before and after it stays in memory as context for windowed steps, so
+    memory is bounded by chunk_rows plus the readings of two overlaps. Cleaned rows and
+    the progress (`result.progress.resume_from`) are committed together after every
+    chunk: a retried job resumes after the last committed chunk. The progress is only
+    saved while `worker_id` holds the job; once its lease is lost the chunk is rolled
+    back and LeaseLost raised, so the new owner alone writes from there.
+    """
+    job = await session.get(PreprocessJob, job_id)
+    progress = ((job.result if job is not None else None) or {}).get('progress') or {}
+    totals: dict[str, Any] = progress.get('totals') or {'normalized': 0, 'input': 0, 'dropped': {}, 'flagged': {}}
+    series: set[str] = set(progress.get('series') or ())
+    timings: dict[str, float] = {'load': 0.0, 'clean': 0.0, 'write': 0.0}
+
+    low = _parse_timestamp(progress.get('resume_from')) or start
+    low = pd.Timestamp(low) if low is not None else None
+    fetch_from = low - overlap if low is not None else None
+    if start is not None and fetch_from is not None and fetch_from < pd.Timestamp(start):
+        fetch_from = pd.Timestamp(start)
+
+    async with engine.connect() as connection:
+        raw = await connection.get_raw_connection()
+        driver = raw.driver_connection
+        # One snapshot for the whole pull; the cursor only exists inside a transaction.
+        async with driver.transaction(readonly=True, isolation='repeatable_read'):
+            cursor = await driver.cursor(
+                _RAW_READINGS_SQL,
+                parcel_id,
+                sensor_ids,
+                fetch_from.to_pydatetime() if fetch_from is not None else None,
+                end,
+            )
+            buffer = cleaning.empty_frame()
+            while True:
+                started = time.perf_counter()
+                async with metrics.track('db', 'fetch_sensor_readings'):
+                    records = await cursor.fetch(chunk_rows)
+                timings['load'] += time.perf_counter() - started
+                exhausted = len(records) < chunk_rows
+                if records:
+                    buffer = pd.concat([buffer, _records_frame(records)], ignore_index=True)
+                high = None
+                if not exhausted:
+                    high = buffer['timestamp'].iloc[-1] - overlap
+                    if strategy.resample:
+                        # Whole buckets only: a bucket is averaged once, in the chunk that emits it.
+                        high = high.floor(strategy.resample)
+                    if low is not None and high <= low:
+                        continue
+
+                started = time.perf_counter()
+                cleaned, stats = await asyncio.to_thread(cleaning.clean_frame, buffer, strategy, (low, high))
+                timings['clean'] += time.perf_counter() - started
+
+                started = time.perf_counter()
+                totals['normalized'] += await write_series(session, job_id, cleaned)
+                series.update((cleaned['sensor_id'] + '/' + cleaned['metric_type']).unique())
+                _accumulate(totals, {key: value for key, value in stats.items() if key != 'series'})
+                totals['series'] = len(series)
+                # After the last chunk, resume past everything read: a retry must not write it twice.
+                resume_from = high
+                if resume_from is None and not buffer.empty:
+                    resume_from = buffer['timestamp'].iloc[-1] + pd.Timedelta(1, 'us')
+                if resume_from is not None and not await _save_progress(
+                    session, job_id, worker_id, resume_from, totals, series
+                ):
+                    await session.rollback()
+                    raise job_service.LeaseLost(f"Job {job_id} is no longer held by {worker_id}")
+                await session.commit()
+                timings['write'] += time.perf_counter() - started
+
+                if high is None:
+                    break
+                buffer = buffer[(buffer['timestamp'] >= high - overlap).to_numpy()].reset_index(drop=True)
+                low = high
+    return totals, timings
+
+
+def _accumulate(totals: dict[str, Any], stats: dict[str, Any]) -> None:
+    """Adds one chunk's counters (nested dicts of ints) to the job's totals."""
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _accumulate(totals.setdefault(key, {}), value)
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+async def _save_progress(
+    session: AsyncSession,
+    job_id: str,
+    worker_id: str,
+    resume_from: pd.Timestamp,
+    totals: dict[str, Any],
+    series: set[str],
+) -> bool:
+    progress = {'resume_from': resume_from.isoformat(), 'totals': totals, 'series': sorted(series)}
+    return await job_service.save_progress(session, job_id, worker_id, {'progress': progress})
+
+
+def _parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def _driver_connection(session: AsyncSession):
+    """The asyncpg connection under the session's transaction, for fetch/COPY without ORM rows."""
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    driver = raw.driver_connection
+    if not driver.is_in_transaction():
+        # SQLAlchemy sends BEGIN with its first statement only: without one, a COPY on the
+        # driver connection would autocommit instead of joining the session's transaction.
+        await connection.exec_driver_sql('SELECT 1')
+    return driver
+
+
+def _records_frame(records: list) -> pd.DataFrame:
+    """Cleaning frame of _RAW_READINGS_SQL rows."""
+    columns = list(zip(*records))
+    return pd.DataFrame(
+        {
+            'parcel_id': np.array(columns[4], dtype=object),
+            'sensor_id': np.array(columns[0], dtype=object),
+            'metric_type': np.array(columns[1], dtype=object),
+            'timestamp': pd.to_datetime(list(columns[2]), utc=True),
+            'value': np.array(columns[3], dtype='float64'),
+            'quality_flag': np.array(columns[5], dtype=object),
+            'meta': np.array(columns[6], dtype=object),
+        }
+    )
+
+
+# sensor_readings_full (created by the ingestion consumer) has the same columns in the
+# wide and slim readings layouts. Served by the hypertable's (observed_at DESC) index.
+_RAW_READINGS_SQL = (
+    "SELECT sensor_id, sensor_type, observed_at, value, metadata->>'parcel_id',"
+    " metadata->>'quality_flag', metadata::text"
+    " FROM sensor_readings_full"
+    " WHERE ($1::text IS NULL OR metadata->>'parcel_id' = $1)"
+    " AND ($2::text[] IS NULL OR sensor_id = ANY($2))"
+    " AND ($3::timestamptz IS NULL OR observed_at >= $3)"
+    " AND ($4::timestamptz IS NULL OR observed_at < $4)"
+    " ORDER BY observed_at"
+)
+
+_NORM_COLUMNS = ('job_id', 'parcel_id', 'sensor_id', 'metric_type', 'timestamp', 'value', 'quality_flag', 'metadata')
+
+
+async def write_series(session: AsyncSession, job_id: str, frame: pd.DataFrame) -> int:
+    """Bulk-inserts a cleaned frame into sensor_series_norm with binary COPY, in the session's transaction."""
+    if frame.empty:
+        return 0
+    meta = [
+        value if value is None or isinstance(value, str) else json.dumps(value)
+        for value in frame['meta'].tolist()
+    ]
+    records = zip(
+        itertools.repeat(job_id),
+        frame['parcel_id'].tolist(),
+        frame['sensor_id'].tolist(),
+        frame['metric_type'].tolist(),
+        pd.DatetimeIndex(frame['timestamp']).to_pydatetime(),
+        frame['value'].tolist(),
+        frame['quality_flag'].tolist(),
+        meta,
+    )
+    driver = await _driver_connection(session)
+    async with metrics.track('db', 'COPY'):
+        await driver.copy_records_to_table(
+            SensorSeriesNormalized.__tablename__, records=records, columns=_NORM_COLUMNS
+        )
+    return len(frame)
+
+
 async def fetch_latest_series(
     session: AsyncSession,
     parcel_id: str,
@@ -69,3 +314,33 @@ async def fetch_latest_series(
         }
         for row in rows
     ]
+
+
+async def fetch_rollup_series(
+    session: AsyncSession,
+    sensor_id: str,
+    start: datetime,
+    end: datetime,
+    resolution: timedelta,
+) -> dict[str, Any]:
+    """min/max/avg/count of a sensor per `resolution`, from the coarsest rollup that resolves it."""
+    sql, args, source = rollups.series_query(rollups.SENSOR_READINGS, {'sensor_id': sensor_id}, start, end, resolution)
+    driver = await _driver_connection(session)
+    async with metrics.track('db', 'fetch_sensor_rollup'):
+        records = await driver.fetch(sql, *args)
+    return {
+        'sensor_id': sensor_id,
+        'resolution_s': resolution.total_seconds(),
+        'source': source,
+        'points': [
+            {
+                'metric_type': record['sensor_type'],
+                'timestamp': record['period'].isoformat(),
+                'min': record[3],
+                'max': record[4],
+                'avg': record[5],
+                'count': record[6],
+            }
+            for record in records
+        ],
+    }
@@ -0,0 +1,455 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import warnings
+from collections.abc import Awaitable, Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+import rasterio
+from minio import Minio
+from minio.commonconfig import CopySource
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.io import DatasetReader, MemoryFile
+from rasterio.windows import Window
+
+from agro_common import metrics
+
+from ..config import Settings
+from ..schemas import MinioObjectRef
+from .warp import crs_label, geographic_bounds, plan_for, source_plan, warp_window
+
+logger = logging.getLogger(__name__)
+
+
+class TileWindow(NamedTuple):
+    index: int
+    col_off: int
+    row_off: int
+    width: int
+    height: int
+
+    @property
+    def window(self) -> Window:
+        return Window(self.col_off, self.row_off, self.width, self.height)
+
+    def bounds(self) -> dict:
+        return {
+            "col_off": self.col_off,
+            "row_off": self.row_off,
+            "width": self.width,
+            "height": self.height,
+        }
+
+
+def iter_windows(width: int, height: int, tile_size: int, overlap: int) -> Iterator[TileWindow]:
+    """Tile grid over the source, row-major; edge tiles smaller than half a tile are skipped."""
+    stride = tile_size - overlap
+    if stride <= 0:
+        raise ValueError(f"overlap ({overlap}) must be smaller than tile_size ({tile_size})")
+
+    index = 0
+    for row_off in range(0, height, stride):
+        for col_off in range(0, width, stride):
+            window_height = min(tile_size, height - row_off)
+            window_width = min(tile_size, width - col_off)
+            if window_height < tile_size // 2 or window_width < tile_size // 2:
+                continue
+            yield TileWindow(index, col_off, row_off, window_width, window_height)
+            index += 1
+
+
+def encode_tile(data: np.ndarray, crs, transform, driver: str = "GTiff") -> bytes:
+    """Encodes one (bands, rows, cols) array (LZW GeoTIFF or PNG) held only for the duration of the call."""
+    bands, height, width = data.shape
+    options = {"crs": crs, "transform": transform, "compress": "lzw"} if driver == "GTiff" else {}
+    with MemoryFile() as memfile, warnings.catch_warnings():
+        # XYZ PNG tiles are located by their z/x/y key, not a geotransform.
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        with memfile.open(
+            driver=driver,
+            height=height,
+            width=width,
+            count=bands,
+            dtype=data.dtype,
+            **options,
+        ) as dst:
+            dst.write(data)
+        return memfile.read()
+
+
+class TileJob(NamedTuple):
+    """One tile handed from the reader stage to the encode/upload stages."""
+
+    info: dict  # tile_id, path, bounds (+ optional crs / resolution / meta), stored in uav_tiles_meta
+    data: np.ndarray
+    crs_wkt: Optional[str]
+    transform: Any
+    driver: str = "GTiff"
+    content_type: str = "image/tiff"
+    # Set when the encoded object may be shared with other tiles holding the same pixels.
+    digest: Optional[str] = None
+
+
+def content_digest(data: np.ndarray, driver: str) -> str:
+    """Identity of a tile's pixels, for tiles whose object carries no per-tile georeferencing."""
+    digest = hashlib.sha256(f"{driver}|{data.dtype.str}|{data.shape}".encode())
+    digest.update(np.ascontiguousarray(data).data)
+    return digest.hexdigest()
+
+
+def grid_tiles(src: DatasetReader, req) -> Iterator[TileJob]:
+    """Fixed-size tiles on the target_crs grid (output_format='tiles').
+
+    When the source has to be reprojected, tiles outside its warped footprint are skipped.
+    Every tile gets its own object, even all-nodata ones: a GeoTIFF embeds its own
+    geotransform, so two tiles never share one.
+    """
+    plan = plan_for(src, req)
+    grid = plan or source_plan(src)
+    crs_wkt = grid.crs.to_wkt() if grid.crs else None
+    crs = crs_label(grid.crs)
+    nodata = src.nodata if src.nodata is not None else 0
+    for tile in iter_windows(grid.width, grid.height, req.tile_size, req.overlap):
+        if plan is None:
+            data = src.read(window=tile.window)
+        else:
+            data = warp_window(src, plan, tile.window, nodata)
+            if data is None:
+                continue
+        path = f"{req.parcel_id}/{req.mission_id}/{req.mission_id}_tile_{tile.index:04d}.tif"
+        yield TileJob(
+            info={
+                "tile_id": tile.index,
+                "path": path,
+                "bounds": {**tile.bounds(), **geographic_bounds(grid.crs, grid.window_bounds(tile.window))},
+                "crs": crs,
+                "resolution": grid.resolution,
+            },
+            data=data,
+            crs_wkt=crs_wkt,
+            transform=grid.window_transform(tile.window),
+        )
+
+
+def gdal_env(settings: Settings) -> rasterio.Env:
+    """GDAL options for tiling: a bounded block cache, plus MinIO access for /vsis3/."""
+    options = {
+        "GDAL_CACHEMAX": settings.tiling_gdal_cache_mb,
+        "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    }
+    if settings.tiling_source_mode == "vsis3":
+        options.update(
+            AWS_ACCESS_KEY_ID=settings.minio_access_key,
+            AWS_SECRET_ACCESS_KEY=settings.minio_secret_key,
+            AWS_S3_ENDPOINT=settings.minio_endpoint,
+            AWS_HTTPS="YES" if settings.minio_secure else "NO",
+            AWS_VIRTUAL_HOSTING="FALSE",
+            CPL_VSIL_CURL_ALLOWED_EXTENSIONS=".tif,.tiff,.TIF,.TIFF",
+        )
+    return rasterio.Env(**options)
+
+
+@contextmanager
+def open_source(settings: Settings, client: Minio, source: MinioObjectRef) -> Iterator[DatasetReader]:
+    """Opens the source raster without ever holding it in memory.
+
+    In 'download' mode the object is streamed to a temporary file (deleted on exit);
+    in 'vsis3' mode GDAL issues ranged GETs for the blocks each window touches.
+    Blocking: call from a worker thread.
+    """
+    with gdal_env(settings):
+        if settings.tiling_source_mode == "vsis3":
+            with rasterio.open(f"/vsis3/{source.bucket}/{source.object_name}") as src:
+                yield src
+            return
+
+        suffix = os.path.splitext(source.object_name)[1] or ".tif"
+        fd, path = tempfile.mkstemp(prefix="uav-", suffix=suffix, dir=settings.tiling_tmp_dir)
+        os.close(fd)
+        try:
+            with metrics.track("minio", "fget_object"):
+                client.fget_object(source.bucket, source.object_name, path)
+            with rasterio.open(path) as src:
+                yield src
+        finally:
+            os.remove(path)
+
+
+# --- Pipeline ---------------------------------------------------------------------
+
+_encode_pool: Optional[ProcessPoolExecutor] = None
+_upload_pool: Optional[ThreadPoolExecutor] = None
+_DONE = object()
+
+
+def _encode_executor(settings: Settings) -> ProcessPoolExecutor:
+    global _encode_pool
+    if _encode_pool is None:
+        # spawn: forking a process that runs an event loop and GDAL threads is unsafe.
+        _encode_pool = ProcessPoolExecutor(
+            max_workers=settings.tiling_encode_workers or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _encode_pool
+
+
+def _upload_executor(settings: Settings) -> ThreadPoolExecutor:
+    global _upload_pool
+    if _upload_pool is None:
+        _upload_pool = ThreadPoolExecutor(
+            max_workers=settings.tiling_upload_concurrency, thread_name_prefix="tile-upload"
+        )
+    return _upload_pool
+
+
+def shutdown_executors() -> None:
+    global _encode_pool, _upload_pool
+    if _encode_pool is not None:
+        _encode_pool.shutdown(cancel_futures=True)
+        _encode_pool = None
+    if _upload_pool is not None:
+        _upload_pool.shutdown(cancel_futures=True)
+        _upload_pool = None
+
+
+def _timed_encode(data: np.ndarray, crs_wkt: Optional[str], transform, driver: str) -> tuple[bytes, float]:
+    started = time.process_time()
+    encoded = encode_tile(data, crs_wkt, transform, driver)
+    return encoded, time.process_time() - started
+
+
+@dataclass
+class PipelineStats:
+    """Cumulative time spent in each stage (stages overlap, so they exceed wall time)."""
+
+    tiles: int = 0
+    bytes_uploaded: int = 0
+    # Tiles copied server-side from an object already uploaded with the same pixels, and
+    # what that spared: the encoding and the transfer, not the storage.
+    tiles_deduplicated: int = 0
+    upload_bytes_saved: int = 0
+    encode_cpu_saved_s: float = 0.0
+    read_s: float = 0.0
+    encode_cpu_s: float = 0.0
+    upload_s: float = 0.0
+    wall_s: float = 0.0
+
+    def as_dict(self) -> dict:
+        per_tile = max(self.tiles, 1)
+        return {
+            "tiles": self.tiles,
+            "bytes_uploaded": self.bytes_uploaded,
+            "tiles_deduplicated": self.tiles_deduplicated,
+            "upload_bytes_saved": self.upload_bytes_saved,
+            "encode_cpu_saved_s": round(self.encode_cpu_saved_s, 3),
+            "wall_s": round(self.wall_s, 3),
+            "tiles_per_s": round(self.tiles / self.wall_s, 1) if self.wall_s else None,
+            "stage_total_s": {
+                "read": round(self.read_s, 3),
+                "encode_cpu": round(self.encode_cpu_s, 3),
+                "upload": round(self.upload_s, 3),
+            },
+            "stage_mean_ms": {
+                "read": round(self.read_s / per_tile * 1000, 2),
+                "encode_cpu": round(self.encode_cpu_s / per_tile * 1000, 2),
+                "upload": round(self.upload_s / per_tile * 1000, 2),
+            },
+        }
+
+
+@dataclass
+class TilingOutcome:
+    tiles: list[dict]
+    source: dict
+    stats: PipelineStats = field(default_factory=PipelineStats)
+
+
+# Called with (tile_info, source) as each tile lands in object storage.
+TileCallback = Callable[[dict, dict], Awaitable[Any]]
+# Turns an open source dataset into the tiles to encode and upload.
+TileProducer = Callable[[DatasetReader, Any], Iterator[TileJob]]
+
+
+def _read_tiles(
+    settings: Settings,
+    client: Minio,
+    req,
+    loop: asyncio.AbstractEventLoop,
+    queue: asyncio.Queue,
+    stop: threading.Event,
+    source: dict,
+    stats: PipelineStats,
+    produce: TileProducer,
+) -> None:
+    """Stage 1 (one thread, datasets are not thread-safe): window reads into a bounded queue."""
+
+    def put(item) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    try:
+        with open_source(settings, client, req.source) as src:
+            source.update(width=src.width, height=src.height, bands=src.count, crs=src.crs)
+            logger.info(f"Image properties: {src.width}x{src.height}, {src.count} bands, CRS: {src.crs}")
+            with closing(produce(src, req)) as jobs:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    job = next(jobs, None)
+                    stats.read_s += time.perf_counter() - started
+                    if job is None:
+                        return
+                    put(job)
+    except Exception as exc:  # noqa: BLE001 - handed over to the event loop side
+        put(exc)
+    finally:
+        put(_DONE)
+
+
+async def run_tiling_pipeline(
+    settings: Settings,
+    client: Minio,
+    req,
+    on_tile: Optional[TileCallback] = None,
+    produce: TileProducer = grid_tiles,
+) -> TilingOutcome:
+    """Window read -> process-pool encode -> bounded concurrent upload.
+
+    Only queue hand-offs run on the event loop, so the API stays responsive. At most
+    tiling_read_ahead + tiling_upload_concurrency tiles are held in memory at once.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(settings.tiling_read_ahead)
+    stop = threading.Event()
+    in_flight = asyncio.Semaphore(settings.tiling_upload_concurrency)
+    encode_pool = _encode_executor(settings)
+    upload_pool = _upload_executor(settings)
+    outcome = TilingOutcome(tiles=[], source={})
+    stats = outcome.stats
+    pending: set[asyncio.Task] = set()
+    errors: list[BaseException] = []
+    # content digest -> (tile_id, path, size, encode CPU) of the first tile uploaded with it
+    shared: dict[str, asyncio.Future] = {}
+
+    def upload(tile_path: str, encoded: bytes, content_type: str) -> float:
+        started = time.perf_counter()
+        with metrics.track("minio", "put_object"):
+            client.put_object(
+                settings.minio_tiles_bucket,
+                tile_path,
+                io.BytesIO(encoded),
+                length=len(encoded),
+                content_type=content_type,
+            )
+        return time.perf_counter() - started
+
+    def copy(source_path: str, tile_path: str) -> float:
+        # Server-side copy: XYZ clients look every tile up under its own z/x/y key.
+        started = time.perf_counter()
+        with metrics.track("minio", "copy_object"):
+            client.copy_object(
+                settings.minio_tiles_bucket, tile_path, CopySource(settings.minio_tiles_bucket, source_path)
+            )
+        return time.perf_counter() - started
+
+    async def in_upload_pool(function, *args):
+        running = loop.run_in_executor(upload_pool, function, *args)
+        try:
+            return await asyncio.shield(running)
+        except asyncio.CancelledError:
+            # A started request cannot be interrupted: let it finish so no upload
+            # outlives the failed job.
+            await asyncio.gather(running, return_exceptions=True)
+            raise
+
+    async def process(job: TileJob) -> None:
+        first: Optional[asyncio.Future] = None
+        try:
+            tile_info, content_type, digest = job.info, job.content_type, job.digest
+            if digest and digest in shared:
+                del job
+                first_id, path, size, encode_s = await shared[digest]
+                stats.upload_s += await in_upload_pool(copy, path, tile_info["path"])
+                tile_info["meta"] = {**tile_info.get("meta", {}), "duplicate_of": first_id}
+                stats.tiles_deduplicated += 1
+                stats.upload_bytes_saved += size
+                stats.encode_cpu_saved_s += encode_s
+            else:
+                if digest:
+                    first = shared[digest] = loop.create_future()
+                encoded, encode_s = await loop.run_in_executor(
+                    encode_pool, _timed_encode, job.data, job.crs_wkt, job.transform, job.driver
+                )
+                del job
+                upload_s = await in_upload_pool(upload, tile_info["path"], encoded, content_type)
+                stats.encode_cpu_s += encode_s
+                stats.upload_s += upload_s
+                stats.bytes_uploaded += len(encoded)
+                if first is not None:
+                    first.set_result((tile_info["tile_id"], tile_info["path"], len(encoded), encode_s))
+            stats.tiles += 1
+            outcome.tiles.append(tile_info)
+            if on_tile is not None:
+                await on_tile(tile_info, outcome.source)
+            if stats.tiles % 100 == 0:
+                logger.info(f"Created {stats.tiles} tiles so far...")
+        except BaseException as exc:
+            if first is not None and not first.done():
+                # Duplicates waiting on this tile fail with it; marked retrieved so an
+                # unawaited failure is not logged twice.
+                if isinstance(exc, asyncio.CancelledError):
+                    first.cancel()
+                else:
+                    first.set_exception(exc)
+                    first.exception()
+            errors.append(exc)
+            raise
+        finally:
+            in_flight.release()
+
+    started = time.perf_counter()
+    reader = loop.run_in_executor(
+        None, _read_tiles, settings, client, req, loop, queue, stop, outcome.source, stats, produce
+    )
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            if errors:
+                raise errors[0]
+            await in_flight.acquire()
+            task = asyncio.create_task(process(item))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+        await reader
+    except BaseException:
+        stop.set()
+        cancelled = list(pending)
+        for task in cancelled:
+            task.cancel()
+        await asyncio.gather(*cancelled, return_exceptions=True)
+        # Unblock the reader if it is waiting on a full queue, then let it exit.
+        while not reader.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+        raise
+    finally:
+        stats.wall_s = time.perf_counter() - started
+
+    outcome.tiles.sort(key=lambda tile: tile["tile_id"])
+    return outcome
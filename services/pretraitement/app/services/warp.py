@@ -0,0 +1,129 @@
+"""Reprojection of the tiler's source to the request's target_crs.
+
+The destination grid (transform, size, resolution) depends only on the source grid and
+on (target CRS, resolution), so it is computed once per combination and cached. Every
+tile is then a window of that shared grid: its source footprint is read and warped on
+its own, so tiles line up exactly and no reprojected copy of the mosaic is ever made.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import numpy as np
+from affine import Affine
+from rasterio import windows
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.io import DatasetReader
+from rasterio.warp import calculate_default_transform, reproject, transform_bounds
+from rasterio.windows import Window
+
+GEOGRAPHIC = "EPSG:4326"
+_GEOGRAPHIC_CRS = CRS.from_user_input(GEOGRAPHIC)
+# Source pixels read beyond a tile's footprint so bilinear sampling has neighbours at its edges.
+_SOURCE_PAD = 2
+
+
+class WarpPlan(NamedTuple):
+    """Destination grid: a tile is a Window of (width, height) placed by transform."""
+
+    crs: CRS
+    transform: Affine
+    width: int
+    height: int
+
+    @property
+    def resolution(self) -> float:
+        return abs(self.transform.a)
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        return windows.bounds(Window(0, 0, self.width, self.height), self.transform)
+
+    def window_transform(self, window: Window) -> Affine:
+        return windows.transform(window, self.transform)
+
+    def window_bounds(self, window: Window) -> tuple[float, float, float, float]:
+        return windows.bounds(window, self.transform)
+
+
+@lru_cache(maxsize=64)
+def warp_plan(
+    src_crs_wkt: str,
+    dst_crs: str,
+    resolution: Optional[float],
+    width: int,
+    height: int,
+    bounds: tuple[float, float, float, float],
+) -> WarpPlan:
+    """Destination grid for a source grid; resolution=None keeps the source's ground sampling."""
+    dst = CRS.from_user_input(dst_crs)
+    transform, dst_width, dst_height = calculate_default_transform(
+        CRS.from_wkt(src_crs_wkt), dst, width, height, *bounds, resolution=resolution
+    )
+    return WarpPlan(dst, transform, dst_width, dst_height)
+
+
+def plan_for(src: DatasetReader, req) -> Optional[WarpPlan]:
+    """Warp plan from the source to req.target_crs / req.resolution; None when no warp is needed."""
+    resolution = getattr(req, "resolution", None)
+    if not req.target_crs or src.crs is None:
+        return None
+    if CRS.from_user_input(req.target_crs) == src.crs and resolution is None:
+        return None
+    return warp_plan(src.crs.to_wkt(), req.target_crs, resolution, src.width, src.height, tuple(src.bounds))
+
+
+def source_plan(src: DatasetReader) -> WarpPlan:
+    """The source's own grid, for code that handles warped and unwarped sources alike."""
+    return WarpPlan(src.crs, src.transform, src.width, src.height)
+
+
+def warp_window(src: DatasetReader, plan: WarpPlan, window: Window, nodata) -> Optional[np.ndarray]:
+    """One tile of the destination grid, warped from its source footprint; None if it holds no data."""
+    footprint = transform_bounds(plan.crs, src.crs, *plan.window_bounds(window), densify_pts=21)
+    source = windows.from_bounds(*footprint, transform=src.transform)
+    source = Window(
+        source.col_off - _SOURCE_PAD,
+        source.row_off - _SOURCE_PAD,
+        source.width + 2 * _SOURCE_PAD,
+        source.height + 2 * _SOURCE_PAD,
+    ).round_offsets(op="floor").round_lengths(op="ceil")
+    try:
+        source = source.intersection(Window(0, 0, src.width, src.height))
+    except windows.WindowError:
+        return None
+
+    data = np.full((src.count, int(window.height), int(window.width)), nodata, dtype=src.dtypes[0])
+    reproject(
+        src.read(window=source),
+        data,
+        src_transform=src.window_transform(source),
+        src_crs=src.crs,
+        src_nodata=src.nodata,
+        dst_transform=plan.window_transform(window),
+        dst_crs=plan.crs,
+        dst_nodata=nodata,
+        resampling=Resampling.bilinear,
+    )
+    return None if np.all(data == nodata) else data
+
+
+def geographic_bounds(
+    crs: Optional[CRS], bounds: tuple[float, float, float, float]
+) -> dict[str, float]:
+    """west/south/east/north in EPSG:4326 for bounds expressed in `crs` (empty if ungeoreferenced)."""
+    if crs is None:
+        return {}
+    if crs != _GEOGRAPHIC_CRS:
+        bounds = transform_bounds(crs, GEOGRAPHIC, *bounds, densify_pts=21)
+    return dict(zip(("west", "south", "east", "north"), bounds))
+
+
+def crs_label(crs: Optional[CRS]) -> Optional[str]:
+    """Short CRS identifier (uav_tiles_meta.crs is 32 chars): 'EPSG:xxxx' when there is one."""
+    if crs is None:
+        return None
+    epsg = crs.to_epsg()
+    return f"EPSG:{epsg}" if epsg else crs.to_string()[:32]
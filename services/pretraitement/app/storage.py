@@ -3,9 +3,12 @@ from __future__ import annotations
 import asyncio
 import io
 import logging
+from pathlib import PurePosixPath
 from typing import Optional
 
+from agro_common import metrics
 from minio import Minio
+from minio.error import S3Error
 
 from .config import Settings, get_settings
 
@@ -29,7 +32,8 @@ def get_client(settings: Optional[Settings] = None) -> Minio:
 
 
 async def ensure_bucket(client: Minio, bucket_name: str) -> None:
-    exists = await asyncio.to_thread(client.bucket_exists, bucket_name)
+    async with metrics.track("minio", "bucket_exists"):
+        exists = await asyncio.to_thread(client.bucket_exists, bucket_name)
     if not exists:
         logger.info("Creating MinIO bucket %s", bucket_name)
         await asyncio.to_thread(client.make_bucket, bucket_name)
@@ -44,14 +48,39 @@ async def upload_bytes(
 ) -> None:
     stream = io.BytesIO(data)
     length = len(data)
-    await asyncio.to_thread(
-        client.put_object,
-        bucket,
-        object_name,
-        stream,
-        length,
-        content_type=content_type,
-    )
+    async with metrics.track("minio", "put_object"):
+        await asyncio.to_thread(
+            client.put_object,
+            bucket,
+            object_name,
+            stream,
+            length,
+            content_type=content_type,
+        )
+
+
+def content_addressed_name(digest: str, filename: str) -> str:
+    """Raw object key derived from the content, so a retried upload lands on the same object."""
+    suffix = PurePosixPath(filename).suffix.lower() or ".tif"
+    return f"sha256/{digest[:2]}/{digest}{suffix}"
+
+
+def object_exists(client: Minio, bucket: str, object_name: str) -> bool:
+    try:
+        with metrics.track("minio", "stat_object"):
+            client.stat_object(bucket, object_name)
+    except S3Error as exc:
+        if exc.code in ("NoSuchKey", "NoSuchObject", "NotFound"):
+            return False
+        raise
+    return True
+
+
+def object_sha256(client: Minio, bucket: str, object_name: str) -> Optional[str]:
+    """Content hash recorded at upload time (x-amz-meta-sha256); None for objects stored otherwise."""
+    with metrics.track("minio", "stat_object"):
+        stat = client.stat_object(bucket, object_name)
+    return (stat.metadata or {}).get("x-amz-meta-sha256")
 
 
 async def ensure_default_buckets(settings: Settings) -> None:
@@ -0,0 +1,88 @@
+"""Runs JOB_WORKER_PROCESSES standalone job workers, e.g. on dedicated tiling nodes.
+
+Every worker is a separate (spawned) process with its own event loop, SQLAlchemy
+engine and tile-encoding pool, claiming from the shared preprocess_jobs queue. Run it
+with JOB_WORKER_EMBEDDED=false on the API so only these processes execute jobs:
+
+    python -m app.supervisor
+
+A worker that keeps crashing shortly after starting is restarted with exponential
+backoff and given up after JOB_WORKER_RESTART_MAX_FAILURES (see agro_common.supervision).
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import signal
+import sys
+
+from agro_common.supervision import RestartPolicy, supervise
+
+from .config import get_settings
+from .db import engine, init_db
+from .logging import configure_logging
+
+logger = logging.getLogger("pretraitement.supervisor")
+
+
+def _run_worker(worker_id: int, stop_event) -> None:
+    # Shutdown is coordinated by the supervisor through stop_event.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from .workers import serve
+
+    asyncio.run(serve(stop_event=stop_event, worker_id=worker_id, init_schema=False))
+
+
+async def _prepare_schema() -> None:
+    await init_db()
+    await engine.dispose()
+
+
+def _start_worker(ctx, worker_id: int, stop_event):
+    process = ctx.Process(target=_run_worker, args=(worker_id, stop_event), name=f"job-worker-{worker_id}")
+    process.start()
+    return process
+
+
+def main() -> None:
+    settings = get_settings()
+    configure_logging(settings.log_level)
+    workers = settings.job_worker_processes
+    asyncio.run(_prepare_schema())
+
+    ctx = mp.get_context("spawn")
+    stop_event = ctx.Event()
+
+    def request_stop(signum, _frame):
+        logger.info("Received signal %s, stopping %d workers", signum, workers)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    policy = RestartPolicy(
+        backoff_s=settings.job_worker_restart_backoff_s,
+        backoff_max_s=settings.job_worker_restart_backoff_max_s,
+        min_uptime_s=settings.job_worker_restart_min_uptime_s,
+        max_failures=settings.job_worker_restart_max_failures,
+    )
+    logger.info("Starting %d job workers", workers)
+    # A dead worker's jobs are requeued by the other workers once their lease expires.
+    processes, abandoned = supervise(
+        lambda worker_id: _start_worker(ctx, worker_id, stop_event), workers, stop_event, policy, logger
+    )
+
+    # Running jobs get JOB_SHUTDOWN_TIMEOUT_S to finish before being released.
+    for worker_id, process in processes.items():
+        process.join(timeout=settings.job_shutdown_timeout_s + 10)
+        if process.is_alive():
+            logger.warning("Worker %d did not stop in time, terminating", worker_id)
+            process.terminate()
+    if abandoned:
+        # Non-zero exit, so the container's restart policy takes over.
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Streaming multipart uploads: request body -> MinIO multipart upload, in bounded memory.
+
+The multipart body is parsed as it arrives (python-multipart). File bytes are hashed and
+handed to a bounded queue drained by a worker thread running put_object(length=-1), which
+uploads one part_size part at a time. Memory per upload is bounded whatever the file size,
+but a part is held several times over (see upload_memory_bound_mb).
+
+The object is written under a staging key; once its SHA-256 is known it is copied
+server-side to its content-addressed key (or dropped if that key already exists).
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import queue
+from collections import deque
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Optional
+from uuid import uuid4
+
+from minio import Minio
+from minio.commonconfig import ComposeSource
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from agro_common import metrics
+
+from .config import Settings
+from .storage import content_addressed_name, object_exists
+
+logger = logging.getLogger(__name__)
+
+# Form fields are small (ids, sizes, CRS); anything bigger is not a form field.
+MAX_FIELD_BYTES = 64 * 1024
+# Largest body chunk uvicorn hands over: one socket read of the asyncio transport.
+REQUEST_CHUNK_BYTES = 256 * 1024
+# Parser, hashing and server buffers, plus allocator slack, measured on top of the parts.
+UPLOAD_OVERHEAD_MB = 24
+_EOF = object()
+
+
+class UploadError(ValueError):
+    """Malformed multipart request (maps to 400)."""
+
+
+def upload_memory_bound_mb(settings: Settings) -> float:
+    """Most memory one streamed upload holds, in MiB, whatever the file size.
+
+    put_object(length=-1) runs UPLOAD_PARALLEL_PARTS upload threads, and each keeps its last
+    part referenced until it picks up the next one, so up to twice that many parts sit in
+    the pool. Add the part waiting for a slot and the one being read, which is held twice
+    (the buffered chunks and their copy in _QueueReader.read, then that copy and minio's
+    slice of it), the queued request chunks and a fixed overhead.
+    """
+    parts = (2 * settings.upload_parallel_parts + 3) * settings.upload_part_size_mb
+    queued = settings.upload_queue_chunks * REQUEST_CHUNK_BYTES / (1024 * 1024)
+    return parts + queued + UPLOAD_OVERHEAD_MB
+
+
+class _QueueReader:
+    """File-like view of a queue of chunks, read by put_object in its worker thread.
+
+    Chunks are kept as received and joined once per read(), rather than appended to a
+    buffer that is then sliced and copied again.
+    """
+
+    def __init__(self, chunks: queue.Queue):
+        self._chunks = chunks
+        self._pending: deque[bytes] = deque()
+        self._pending_size = 0
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or self._pending_size < size):
+            item = self._chunks.get()
+            if item is _EOF:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                self._pending.append(item)
+                self._pending_size += len(item)
+        if size < 0 or size > self._pending_size:
+            size = self._pending_size
+        taken, needed = [], size
+        while needed:
+            chunk = self._pending.popleft()
+            if len(chunk) > needed:
+                self._pending.appendleft(chunk[needed:])
+                chunk = chunk[:needed]
+            taken.append(chunk)
+            needed -= len(chunk)
+        self._pending_size -= size
+        return b"".join(taken)
+
+
+class MinioStreamWriter:
+    """Feeds chunks from the event loop to a put_object running in a worker thread.
+
+    write() only awaits when the queue is full, so a slow MinIO backs pressure up to
+    the client instead of buffering the request in memory.
+    """
+
+    def __init__(self, client: Minio, settings: Settings, bucket: str, object_name: str, content_type: str):
+        self.bucket = bucket
+        self.object_name = object_name
+        self._chunks: queue.Queue = queue.Queue(settings.upload_queue_chunks)
+        self._done: asyncio.Future = asyncio.get_running_loop().run_in_executor(
+            None,
+            self._upload,
+            client,
+            content_type,
+            settings.upload_part_size_mb * 1024 * 1024,
+            settings.upload_parallel_parts,
+        )
+
+    def _upload(self, client: Minio, content_type: str, part_size: int, parallel: int):
+        with metrics.track("minio", "put_object_stream"):
+            return client.put_object(
+                self.bucket,
+                self.object_name,
+                _QueueReader(self._chunks),
+                length=-1,
+                part_size=part_size,
+                num_parallel_uploads=parallel,
+                content_type=content_type,
+            )
+
+    def _put_blocking(self, item) -> None:
+        # Gives up once the upload thread has ended, which would otherwise never drain the queue.
+        while not self._done.done():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    async def _put(self, item) -> None:
+        try:
+            self._chunks.put_nowait(item)
+        except queue.Full:
+            await asyncio.to_thread(self._put_blocking, item)
+        if self._done.done() and item is not _EOF:
+            await self._done  # the upload ended early: surface its error
+
+    async def write(self, chunk: bytes) -> None:
+        await self._put(chunk)
+
+    async def close(self):
+        await self._put(_EOF)
+        return await self._done
+
+    async def abort(self, exc: BaseException) -> None:
+        """Fails the reader so put_object aborts its multipart upload, then waits for it."""
+        if not self._done.done():
+            await self._put(exc)
+        try:
+            await self._done
+        except BaseException:  # noqa: BLE001 - the upload is being abandoned
+            pass
+
+
+@dataclass
+class StreamedUpload:
+    """A multipart request whose single file part went straight to object storage."""
+
+    fields: dict[str, str] = field(default_factory=dict)
+    field_name: Optional[str] = None
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+    bucket: Optional[str] = None
+    object_name: Optional[str] = None
+    size: int = 0
+    sha256: Optional[str] = None
+
+
+class _Part:
+    def __init__(self):
+        self.headers: dict[bytes, bytes] = {}
+        self.header_name = b""
+        self.header_value = b""
+        self.name: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.data = bytearray()
+
+
+async def receive_upload(
+    request: Request,
+    client: Minio,
+    settings: Settings,
+    bucket: str,
+    file_field: str = "file",
+) -> StreamedUpload:
+    """Parses a multipart request as it streams in, uploading `file_field` to a staging object.
+
+    Other parts are read as small text fields. The staging object is
+    `incoming/<uuid>`; see promote_upload() for the content-addressed key.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data request")
+
+    result = StreamedUpload()
+    digest = hashlib.sha256()
+    writer: Optional[MinioStreamWriter] = None
+    # Callbacks run synchronously inside parser.write(); they record events that the
+    # loop below acts on, so writes to MinIO can be awaited.
+    events: list[tuple[str, _Part, bytes]] = []
+    part = _Part()
+
+    def on_part_begin():
+        nonlocal part
+        part = _Part()
+
+    def on_header_field(data, start, end):
+        part.header_name += data[start:end]
+
+    def on_header_value(data, start, end):
+        part.header_value += data[start:end]
+
+    def on_header_end():
+        part.headers[part.header_name.lower()] = part.header_value
+        part.header_name, part.header_value = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadError('Content-Disposition must carry a "name"')
+        part.name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            part.filename = options[b"filename"].decode("utf-8", "replace")
+        events.append(("start", part, b""))
+
+    def on_part_data(data, start, end):
+        events.append(("data", part, bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", part, b""))
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+
+    async def handle(kind: str, current: _Part, data: bytes) -> None:
+        nonlocal writer
+        is_file = current.name == file_field and current.filename is not None
+        if kind == "start" and is_file:
+            if result.object_name is not None:
+                raise UploadError(f"Only one '{file_field}' part is accepted")
+            result.field_name = current.name
+            result.filename = current.filename
+            result.content_type = current.headers.get(b"content-type", b"application/octet-stream").decode()
+            result.bucket = bucket
+            result.object_name = f"incoming/{uuid4().hex}"
+            writer = MinioStreamWriter(client, settings, bucket, result.object_name, result.content_type)
+        elif kind == "data" and is_file:
+            digest.update(data)
+            result.size += len(data)
+            await writer.write(data)
+        elif kind == "end" and is_file:
+            await writer.close()
+            writer = None
+        elif kind == "data":
+            if len(current.data) + len(data) > MAX_FIELD_BYTES:
+                raise UploadError(f"Field '{current.name}' exceeds {MAX_FIELD_BYTES} bytes")
+            current.data += data
+        elif kind == "end":
+            result.fields[current.name] = current.data.decode("utf-8", "replace")
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in events:
+                await handle(*event)
+            events.clear()
+        parser.finalize()
+        for event in events:
+            await handle(*event)
+        if writer is not None:
+            raise UploadError("Multipart body ended inside the file part")
+    except BaseException as exc:
+        if writer is not None:
+            await writer.abort(exc if isinstance(exc, Exception) else UploadError("upload interrupted"))
+        if result.object_name is not None and writer is None:
+            # The staging object was completed before the failure: do not leave it behind.
+            await asyncio.to_thread(_remove_quietly, client, bucket, result.object_name)
+        raise
+
+    if result.object_name is None:
+        raise UploadError(f"Missing file part '{file_field}'")
+    result.sha256 = digest.hexdigest()
+    return result
+
+
+def _remove_quietly(client: Minio, bucket: str, object_name: str) -> None:
+    try:
+        client.remove_object(bucket, object_name)
+    except Exception as exc:  # noqa: BLE001 - best effort cleanup
+        logger.warning("Could not remove staging object %s/%s: %s", bucket, object_name, exc)
+
+
+async def object_chunks(client: Minio, bucket: str, object_name: str, chunk_size: int = 1024 * 1024):
+    """An object's bytes, read chunk by chunk in worker threads."""
+    response = await asyncio.to_thread(client.get_object, bucket, object_name)
+    try:
+        while chunk := await asyncio.to_thread(response.read, chunk_size):
+            yield chunk
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def multipart_stream(field_name: str, filename: str, content_type: str, chunks) -> tuple[str, AsyncIterator[bytes]]:
+    """(Content-Type header, body) of a one-file multipart request streamed from `chunks`."""
+    boundary = uuid4().hex
+    quoted = filename.replace("\\", "\\\\").replace('"', '\\"')
+
+    async def body():
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{quoted}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        async for chunk in chunks:
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    return f"multipart/form-data; boundary={boundary}", body()
+
+
+def promote_upload(client: Minio, upload: StreamedUpload) -> bool:
+    """Moves the staging object to its content-addressed key; True if that content was already stored.
+
+    The copy is server-side (multipart upload-part-copy), so no bytes go through this
+    service. Blocking: run in a worker thread.
+    """
+    staging = upload.object_name
+    final = content_addressed_name(upload.sha256, upload.filename or "upload")
+    reused = object_exists(client, upload.bucket, final)
+    if not reused:
+        with metrics.track("minio", "compose_object"):
+            client.compose_object(
+                upload.bucket,
+                final,
+                [ComposeSource(upload.bucket, staging)],
+                metadata={
+                    "Content-Type": upload.content_type or "application/octet-stream",
+                    "sha256": upload.sha256,
+                    "filename": upload.filename or "",
+                },
+            )
+    _remove_quietly(client, upload.bucket, staging)
+    upload.object_name = final
+    return reused
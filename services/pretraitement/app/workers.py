@@ -1,62 +1,245 @@
+"""Job execution: workers claim pending preprocess_jobs rows and run their handler.
+
+A JobRunner lives in one process: the API's (JOB_WORKER_EMBEDDED) or one of the
+processes started by `python -m app.supervisor`, on this node or another one. It claims
+jobs with FOR UPDATE SKIP LOCKED, at most JOB_CONCURRENCY[job_type] at a time per type,
+heartbeats each running job, retries failures with exponential backoff and requeues
+jobs whose worker stopped heartbeating.
+"""
 from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Any, Awaitable, Callable
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from agro_common import metrics
 
-from .db import AsyncSessionFactory
-from .models import JobStatusEnum
+from .config import Settings, get_settings
+from .db import AsyncSessionFactory, engine, init_db
+from .logging import configure_logging
+from .models import JobStatusEnum, PreprocessJob
 from .services import imagery as imagery_service
 from .services import jobs as job_service
 from .services import sensors as sensors_service
+from .services.tiling import shutdown_executors
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
-HandlerType = Callable[[AsyncSession, str, dict[str, Any]], Awaitable[dict[str, Any]]]
+# (session, job_id, payload, worker_id) -> result
+HandlerType = Callable[[AsyncSession, str, dict[str, Any], str], Awaitable[dict[str, Any]]]
 
+HANDLERS: dict[str, HandlerType] = {
+    sensors_service.CLEANING_JOB_TYPE: sensors_service.perform_cleaning,
+    imagery_service.TILING_JOB_TYPE: imagery_service.perform_tiling,
+}
 
-async def _execute_job(job_id: str, handler: HandlerType, payload: dict[str, Any]) -> None:
-    async with AsyncSessionFactory() as session:
-        job = await job_service.get_job(session, job_id)
-        if job is None:
-            logger.warning("Job %s not found", job_id)
-            return
 
-        await job_service.update_job_status(session, job, JobStatusEnum.processing)
-        await session.commit()
+class JobRunner:
+    """Claims and runs jobs in the current event loop until stopped."""
 
-        try:
-            result_payload = await handler(session, job_id, payload)
-            await job_service.update_job_status(
-                session,
-                job,
-                JobStatusEnum.completed,
-                result_payload=result_payload,
-            )
-        except Exception as exc:  # noqa: BLE001
-            logger.exception("Job %s failed", job_id)
-            await job_service.update_job_status(
-                session,
-                job,
-                JobStatusEnum.failed,
-                error_payload={'message': str(exc)},
+    def __init__(self, settings: Settings, worker_id: Optional[str] = None, handlers: dict[str, HandlerType] = HANDLERS):
+        self.settings = settings
+        self.worker_id = (worker_id or f"{socket.gethostname()}:{os.getpid()}")[:64]
+        self.handlers = handlers
+        self.limits = {job_type: settings.job_concurrency.get(job_type, 1) for job_type in handlers}
+        self.running: dict[str, set[asyncio.Task]] = {job_type: set() for job_type in handlers}
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def busy(self) -> int:
+        return sum(len(tasks) for tasks in self.running.values())
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+
+    async def run(self, stop_event=None) -> None:
+        """Claim loop; stop_event is an optional threading/multiprocessing Event."""
+        loop = asyncio.get_running_loop()
+        next_recovery = loop.time()
+        logger.info("Job worker %s started, limits %s", self.worker_id, self.limits)
+        while not self._stopping and not (stop_event is not None and stop_event.is_set()):
+            self._wake.clear()
+            try:
+                if loop.time() >= next_recovery:
+                    next_recovery = loop.time() + self.settings.job_lease_s / 2
+                    await self._recover()
+                await self._claim_available()
+            except Exception:  # noqa: BLE001 - e.g. database unavailable: retry on the next tick
+                logger.exception("Job worker %s could not poll the queue", self.worker_id)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.settings.job_poll_interval_s)
+            except asyncio.TimeoutError:
+                pass
+        await self._drain()
+        logger.info("Job worker %s stopped", self.worker_id)
+
+    async def _recover(self) -> None:
+        async with AsyncSessionFactory() as session:
+            recovered = await job_service.recover_orphans(
+                session, self.settings.job_lease_s, self.settings.job_max_attempts
             )
+            await session.commit()
+        if recovered:
+            logger.warning("Requeued %d orphaned jobs", recovered)
+
+    async def _claim_available(self) -> None:
+        while not self._stopping:
+            free = [job_type for job_type, tasks in self.running.items() if len(tasks) < self.limits[job_type]]
+            if not free:
+                return
+            async with AsyncSessionFactory() as session:
+                job = await job_service.claim_job(session, free, self.worker_id)
+                await session.commit()
+            if job is None:
+                return
+            task = asyncio.create_task(self._run_job(job), name=f"job-{job.id}")
+            self.running[job.job_type].add(task)
+            task.add_done_callback(lambda done, job_type=job.job_type: self._finished(job_type, done))
+
+    def _finished(self, job_type: str, task: asyncio.Task) -> None:
+        self.running[job_type].discard(task)
+        self.wake()
+
+    async def _run_job(self, job: PreprocessJob) -> None:
+        logger.info("Job %s (%s) claimed by %s, attempt %d", job.id, job.job_type, self.worker_id, job.attempts)
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, asyncio.current_task()))
+        started = time.perf_counter()
+        outcome = JobStatusEnum.failed.value
+        try:
+            async with AsyncSessionFactory() as session:
+                try:
+                    result_payload = await self.handlers[job.job_type](
+                        session, job.id, job.payload or {}, self.worker_id
+                    )
+                    if await job_service.complete_job(session, job.id, self.worker_id, result_payload):
+                        outcome = JobStatusEnum.completed.value
+                        await session.commit()
+                    else:
+                        # What the handler wrote since its last commit belongs to the new owner's run.
+                        logger.warning("Job %s finished after losing its lease; result discarded", job.id)
+                        outcome = 'released'
+                        await session.rollback()
+                except asyncio.CancelledError:
+                    await session.rollback()
+                    raise
+                except job_service.LeaseLost:
+                    logger.warning("Job %s lost its lease to another worker; stopped", job.id)
+                    outcome = 'released'
+                    await session.rollback()
+                except Exception as exc:  # noqa: BLE001
+                    logger.exception("Job %s failed (attempt %d/%d)", job.id, job.attempts, self.settings.job_max_attempts)
+                    await session.rollback()
+                    status = await job_service.fail_job(
+                        session,
+                        job,
+                        self.worker_id,
+                        {'message': str(exc), 'type': type(exc).__name__},
+                        self.settings.job_max_attempts,
+                        self.settings.job_retry_backoff_s,
+                    )
+                    await session.commit()
+                    outcome = 'retry' if status is JobStatusEnum.pending else status.value
+        except asyncio.CancelledError:
+            # Shutdown or lost lease: the guarded UPDATE only releases a job still held here.
+            outcome = 'released'
+            await asyncio.shield(self._release(job.id))
+            raise
         finally:
+            heartbeat.cancel()
+            metrics.observe_job(job.job_type, outcome, time.perf_counter() - started)
+
+    async def _release(self, job_id: str) -> None:
+        async with AsyncSessionFactory() as session:
+            await job_service.release_job(session, job_id, self.worker_id)
             await session.commit()
 
+    async def _heartbeat(self, job_id: str, task: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(self.settings.job_heartbeat_s)
+            try:
+                async with AsyncSessionFactory() as session:
+                    held = await job_service.heartbeat(session, job_id, self.worker_id)
+                    await session.commit()
+            except Exception:  # noqa: BLE001 - the lease outlives a few missed beats
+                logger.warning("Heartbeat of job %s failed", job_id, exc_info=True)
+                continue
+            if not held:
+                logger.warning("Job %s is no longer held by %s, cancelling it", job_id, self.worker_id)
+                task.cancel()
+                return
+
+    async def _drain(self) -> None:
+        tasks = [task for tasks in self.running.values() for task in tasks]
+        if not tasks:
+            return
+        logger.info("Waiting up to %.0fs for %d running jobs", self.settings.job_shutdown_timeout_s, len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=self.settings.job_shutdown_timeout_s)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+_runner: Optional[JobRunner] = None
+_runner_task: Optional[asyncio.Task] = None
+
+
+def start_embedded(settings: Settings) -> None:
+    """Runs a JobRunner in the API's event loop (see lifespan in app.main)."""
+    global _runner, _runner_task
+    _runner = JobRunner(settings)
+    _runner_task = asyncio.create_task(_runner.run(), name="job-runner")
+    metrics.gauge_function("pretraitement_jobs_running", "Jobs running in this process", lambda: _runner.busy)
+
+
+async def stop_embedded() -> None:
+    global _runner, _runner_task
+    if _runner is None:
+        return
+    _runner.stop()
+    await _runner_task
+    _runner, _runner_task = None, None
+
+
+def notify() -> None:
+    """Wakes this process's runner after a job was committed; other workers find it on their next poll."""
+    if _runner is not None:
+        _runner.wake()
+
 
-def _schedule(job_id: str, handler: HandlerType, payload: dict[str, Any]) -> None:
+async def serve(stop_event=None, worker_id: int = 0, init_schema: bool = True) -> None:
+    """One standalone worker process: runs jobs until stop_event is set."""
+    settings = get_settings()
+    configure_logging(settings.log_level)
+    metrics.configure("pretraitement-worker", enabled=settings.metrics_enabled)
+    metrics.serve(settings.worker_metrics_port + worker_id)
+    if init_schema:
+        await init_db()
+    runner = JobRunner(settings)
+    metrics.gauge_function("pretraitement_jobs_running", "Jobs running in this process", lambda: runner.busy)
     try:
-        asyncio.create_task(_execute_job(job_id, handler, payload))
-    except RuntimeError:
-        loop = asyncio.get_event_loop()
-        loop.create_task(_execute_job(job_id, handler, payload))
+        await runner.run(stop_event)
+    finally:
+        shutdown_executors()
+        await engine.dispose()
 
 
-def schedule_sensor_cleaning(job_id: str, payload: dict[str, Any]) -> None:
-    _schedule(job_id, sensors_service.perform_cleaning, payload)
+def main() -> None:
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    asyncio.run(serve(stop_event))
 
 
-def schedule_imagery_tiling(job_id: str, payload: dict[str, Any]) -> None:
-    _schedule(job_id, imagery_service.perform_tiling, payload)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Bytes transferred and time-to-first-pixel: per-tile objects vs COG vs XYZ pyramid.
+
+Each output is produced by the service's own code (grid_tiles / xyz_tiles through
+run_tiling_pipeline, write_cog) into a local directory standing in for the bucket.
+Two client views are then served from each layout:
+
+- overview: the whole mosaic at ~1024 px wide (dashboard parcel view);
+- detail:   a full-resolution 512x512 window at the centre (vision service crop).
+
+COG reads go through GDAL with a counting opener, so bytes and round trips are what
+GDAL actually requests; contiguous reads are merged into one ranged GET. Object
+layouts fetch whole objects. Network time is modelled from --rtt-ms, --mbps and
+--parallel (concurrent GETs for object layouts; COG range reads are sequential).
+
+    cd services/pretraitement
+    python benchmarks/bench_output_formats.py --size 8192
+"""
+import argparse
+import asyncio
+import io
+import math
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "common"))
+
+import numpy as np  # noqa: E402
+import rasterio  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+from rasterio.warp import transform_bounds  # noqa: E402
+from rasterio.windows import Window  # noqa: E402
+
+from app.config import Settings  # noqa: E402
+from app.schemas import ImageTilingRequest, MinioObjectRef  # noqa: E402
+from app.services.pyramid import WEB_MERCATOR, tiles_covering, write_cog, xyz_tiles  # noqa: E402
+from app.services.tiling import grid_tiles, run_tiling_pipeline, shutdown_executors  # noqa: E402
+
+
+def create_raster(path: str, size: int) -> None:
+    """Smooth gradients plus noise: compresses like imagery, unlike pure noise."""
+    yy, xx = np.mgrid[0:512, 0:512]
+    with rasterio.open(
+        path, "w", driver="GTiff", width=size, height=size, count=3, dtype="uint8",
+        crs="EPSG:32631", transform=from_origin(500000, 4800000, 0.05, 0.05),
+        tiled=True, blockxsize=512, blockysize=512,
+    ) as dst:
+        rng = np.random.default_rng(0)
+        for row in range(0, size, 512):
+            for col in range(0, size, 512):
+                base = (xx + col + yy + row) / (2 * size) * 200
+                block = np.stack([base, base * 0.8 + 20, 255 - base]) + rng.normal(0, 6, (3, 512, 512))
+                dst.write(np.clip(block, 1, 255).astype("uint8"), window=Window(col, row, 512, 512))
+
+
+class DirClient:
+    """Local stand-in for the MinIO client: objects are files under `root`."""
+
+    def __init__(self, root: str, source: str):
+        self.root = root
+        self.source = source
+
+    def _path(self, object_name: str) -> str:
+        path = os.path.join(self.root, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def fget_object(self, bucket, object_name, file_path):
+        shutil.copyfile(self.source, file_path)
+
+    def put_object(self, bucket, object_name, data, length, content_type=None):
+        with open(self._path(object_name), "wb") as handle:
+            handle.write(data.read())
+
+    def fput_object(self, bucket, object_name, file_path, content_type=None):
+        shutil.copyfile(file_path, self._path(object_name))
+
+
+class RangeLog:
+    """rasterio opener recording every read GDAL issues."""
+
+    def __init__(self):
+        self.reads = []
+
+    def __call__(self, path, mode="rb"):
+        log = self.reads
+
+        class Counting(io.FileIO):
+            def read(self, size=-1):
+                offset = self.tell()
+                data = super().read(size)
+                log.append((offset, len(data)))
+                return data
+
+            def readinto(self, buffer):
+                offset = self.tell()
+                count = super().readinto(buffer)
+                log.append((offset, count))
+                return count
+
+        return Counting(path, "r")
+
+    def requests(self) -> tuple[int, int]:
+        """(ranged GETs after merging contiguous reads, bytes)."""
+        merged, end = 0, None
+        for offset, count in sorted(self.reads):
+            if end is None or offset > end:
+                merged += 1
+            end = max(end or 0, offset + count)
+        return merged, sum(count for _, count in self.reads)
+
+
+def object_view(sizes: list[int], args) -> dict:
+    bandwidth = args.mbps * 1e6 / 8
+    rounds = math.ceil(len(sizes) / args.parallel)
+    return {
+        "requests": len(sizes),
+        "bytes": sum(sizes),
+        "first_ms": (args.rtt_ms / 1000 + sizes[0] / bandwidth) * 1000,
+        "complete_ms": (rounds * args.rtt_ms / 1000 + sum(sizes) / bandwidth) * 1000,
+    }
+
+
+def cog_view(path: str, read, args) -> dict:
+    log = RangeLog()
+    with rasterio.open(path, opener=log) as ds:
+        read(ds)
+    requests, nbytes = log.requests()
+    seconds = requests * args.rtt_ms / 1000 + nbytes / (args.mbps * 1e6 / 8)
+    return {"requests": requests, "bytes": nbytes, "first_ms": seconds * 1000, "complete_ms": seconds * 1000}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=8192)
+    parser.add_argument("--tile-size", type=int, default=512)
+    parser.add_argument("--rtt-ms", type=float, default=30.0)
+    parser.add_argument("--mbps", type=float, default=100.0)
+    parser.add_argument("--parallel", type=int, default=6)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, "source.tif")
+    bucket = os.path.join(workdir, "bucket")
+    try:
+        create_raster(source, args.size)
+        client = DirClient(bucket, source)
+        settings = Settings(TILING_TMP_DIR=workdir)
+
+        def request(fmt: str) -> ImageTilingRequest:
+            return ImageTilingRequest(
+                source=MinioObjectRef(bucket="uav-raw", object_name="source.tif"),
+                parcel_id="P", mission_id="M", tile_size=args.tile_size, output_format=fmt,
+            )
+
+        tiles = asyncio.run(run_tiling_pipeline(settings, client, request("tiles"), produce=grid_tiles)).tiles
+        xyz = asyncio.run(run_tiling_pipeline(settings, client, request("xyz"), produce=xyz_tiles)).tiles
+        cog = write_cog(settings, client, request("cog")).tiles[0]
+        shutdown_executors()
+
+        def size(path: str) -> int:
+            return os.path.getsize(os.path.join(bucket, path))
+
+        centre = args.size // 2 - 256
+        detail = Window(centre, centre, 512, 512)
+        with rasterio.open(source) as src:
+            detail_bounds = transform_bounds(src.crs, WEB_MERCATOR, *src.window_bounds(detail))
+            overview_shape = (src.count, round(src.height * 1024 / src.width), 1024)
+
+        zooms = sorted({t["meta"]["z"] for t in xyz})
+        overview_zoom = next((z for z in zooms if 2 ** (z - zooms[0]) * 256 >= 1024), zooms[-1])
+        xyz_by_key = {(t["meta"]["z"], t["meta"]["x"], t["meta"]["y"]): t["path"] for t in xyz}
+
+        def overlaps(b: dict) -> bool:
+            return (
+                b["col_off"] < detail.col_off + detail.width and detail.col_off < b["col_off"] + b["width"]
+                and b["row_off"] < detail.row_off + detail.height and detail.row_off < b["row_off"] + b["height"]
+            )
+
+        rows = [
+            ("tiles", "overview", object_view([size(t["path"]) for t in tiles], args)),
+            ("tiles", "detail", object_view([size(t["path"]) for t in tiles if overlaps(t["bounds"])], args)),
+            ("xyz", "overview", object_view(
+                [size(p) for (z, _, _), p in sorted(xyz_by_key.items()) if z == overview_zoom], args)),
+            ("xyz", "detail", object_view(
+                [size(xyz_by_key[(zooms[-1], x, y)]) for x, y in tiles_covering(detail_bounds, zooms[-1])
+                 if (zooms[-1], x, y) in xyz_by_key], args)),
+            ("cog", "overview", cog_view(
+                os.path.join(bucket, cog["path"]), lambda ds: ds.read(out_shape=overview_shape), args)),
+            ("cog", "detail", cog_view(
+                os.path.join(bucket, cog["path"]), lambda ds: ds.read(window=detail), args)),
+        ]
+
+        print(f"source {args.size}x{args.size}x3 uint8, rtt {args.rtt_ms} ms, {args.mbps} Mbit/s, {args.parallel} parallel GETs")
+        print(f"{'layout':<6} | {'view':<8} | {'requests':>8} | {'KiB':>9} | {'first px ms':>11} | {'complete ms':>11}")
+        for layout, view, r in rows:
+            print(
+                f"{layout:<6} | {view:<8} | {r['requests']:>8} | {r['bytes'] / 1024:>9.0f} "
+                f"| {r['first_ms']:>11.0f} | {r['complete_ms']:>11.0f}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
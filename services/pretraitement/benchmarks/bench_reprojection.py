@@ -0,0 +1,133 @@
+"""Reprojection strategies for tiling to target_crs, on a synthetic UTM mosaic.
+
+- cached-plan: what grid_tiles does. The destination grid comes from the cached
+  warp_plan; each tile warps its own source footprint onto a window of that grid.
+- per-tile:    every tile recomputes its own destination grid from its source window
+  (calculate_default_transform) and warps it. Tiles do not share a grid, so neighbours
+  neither line up nor share a resolution, and empty corners are still emitted.
+- mosaic-first: the whole source is reprojected into a temporary GeoTIFF, which is
+  then cut into tiles.
+
+Each strategy runs in a fresh process and only produces the tile arrays (no encoding
+or upload), so the numbers isolate the warp. The report gives wall time, peak RSS and
+temporary disk use.
+
+    cd services/pretraitement
+    python benchmarks/bench_reprojection.py --size 8192 --target-crs EPSG:4326
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "common"))
+
+import numpy as np  # noqa: E402
+import rasterio  # noqa: E402
+from rasterio.enums import Resampling  # noqa: E402
+from rasterio.warp import calculate_default_transform, reproject  # noqa: E402
+
+from app.schemas import ImageTilingRequest, MinioObjectRef  # noqa: E402
+from app.services.tiling import grid_tiles, iter_windows  # noqa: E402
+from bench_output_formats import create_raster  # noqa: E402
+
+
+def cached_plan(source: str, workdir: str, req) -> int:
+    with rasterio.open(source) as src:
+        return sum(1 for _ in grid_tiles(src, req))
+
+
+def per_tile(source: str, workdir: str, req) -> int:
+    tiles = 0
+    with rasterio.open(source) as src:
+        for tile in iter_windows(src.width, src.height, req.tile_size, req.overlap):
+            transform, width, height = calculate_default_transform(
+                src.crs, req.target_crs, tile.width, tile.height, *src.window_bounds(tile.window)
+            )
+            data = np.zeros((src.count, height, width), dtype=src.dtypes[0])
+            reproject(
+                src.read(window=tile.window),
+                data,
+                src_transform=src.window_transform(tile.window),
+                src_crs=src.crs,
+                dst_transform=transform,
+                dst_crs=req.target_crs,
+                resampling=Resampling.bilinear,
+            )
+            tiles += 1
+    return tiles
+
+
+def mosaic_first(source: str, workdir: str, req) -> int:
+    warped = os.path.join(workdir, "warped.tif")
+    with rasterio.open(source) as src:
+        transform, width, height = calculate_default_transform(
+            src.crs, req.target_crs, src.width, src.height, *src.bounds
+        )
+        profile = dict(src.profile, crs=req.target_crs, transform=transform, width=width, height=height)
+        with rasterio.open(warped, "w", **profile) as dst:
+            reproject(
+                rasterio.band(src, list(range(1, src.count + 1))),
+                rasterio.band(dst, list(range(1, src.count + 1))),
+                resampling=Resampling.bilinear,
+            )
+    tiles = 0
+    with rasterio.open(warped) as mosaic:
+        for tile in iter_windows(mosaic.width, mosaic.height, req.tile_size, req.overlap):
+            mosaic.read(window=tile.window)
+            tiles += 1
+    return tiles
+
+
+STRATEGIES = {"cached-plan": cached_plan, "per-tile": per_tile, "mosaic-first": mosaic_first}
+
+
+def run(name: str, source: str, req, results) -> None:
+    workdir = tempfile.mkdtemp(dir=os.path.dirname(source))
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    tiles = STRATEGIES[name](source, workdir, req)
+    elapsed = time.perf_counter() - started
+    disk = sum(f.stat().st_size for f in Path(workdir).iterdir())
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    shutil.rmtree(workdir)
+    results.put((name, tiles, elapsed, (peak - before) / 1024, disk / 1024 ** 2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=8192)
+    parser.add_argument("--tile-size", type=int, default=512)
+    parser.add_argument("--target-crs", default="EPSG:4326")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, "source.tif")
+    req = ImageTilingRequest(
+        source=MinioObjectRef(bucket="uav-raw", object_name="source.tif"),
+        parcel_id="P", mission_id="M", tile_size=args.tile_size, target_crs=args.target_crs,
+    )
+    context = multiprocessing.get_context("spawn")
+    try:
+        create_raster(source, args.size)
+        results = context.Queue()
+        print(f"source {args.size}x{args.size}x3 uint8 EPSG:32631 -> {args.target_crs}, {args.tile_size}px tiles")
+        print(f"{'strategy':<12} | {'tiles':>5} | {'wall s':>7} | {'tiles/s':>7} | {'RSS +MiB':>8} | {'tmp MiB':>7}")
+        for name in STRATEGIES:
+            child = context.Process(target=run, args=(name, source, req, results))
+            child.start()
+            _, tiles, elapsed, rss, disk = results.get()
+            child.join()
+            print(f"{name:<12} | {tiles:>5} | {elapsed:>7.2f} | {tiles / elapsed:>7.1f} | {rss:>8.1f} | {disk:>7.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
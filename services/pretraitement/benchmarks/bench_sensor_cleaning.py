@@ -0,0 +1,123 @@
+"""Sensor cleaning throughput: the vectorized engine against the per-reading loop it replaced.
+
+Generates N readings over many sensors (10-minute sampling with jitter) and injects
+known defects: out-of-range values, duplicate timestamps, spikes and gaps. Each
+strategy's wall time and counters are reported, with how many injected spikes were
+caught. `loop` is the former perform_cleaning body (one parsed timestamp and one ORM
+object per reading, no actual cleaning), without the database.
+
+    cd services/pretraitement
+    python benchmarks/bench_sensor_cleaning.py --readings 1000000
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "common"))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app.models import SensorSeriesNormalized  # noqa: E402
+from app.services.cleaning import STRATEGIES, clean_frame  # noqa: E402
+
+METRICS = ("temperature", "humidite", "luminosite")
+
+
+def synthetic(readings: int, sensors: int, seed: int = 0) -> pd.DataFrame:
+    """About `readings` readings over `sensors` x METRICS series; `spike` marks injected spikes."""
+    rng = np.random.default_rng(seed)
+    series = sensors * len(METRICS)
+    per_series = readings // series
+    n = per_series * series
+    sensor = np.repeat(np.arange(sensors), per_series * len(METRICS))
+    metric = np.tile(np.repeat(np.arange(len(METRICS)), per_series), sensors)
+    step = np.tile(np.arange(per_series), series)
+    timestamp = np.datetime64("2025-01-01T00:00:00", "s") + step * 600 + rng.integers(-30, 30, n)
+    day = 2 * np.pi * step / 144
+    value = np.choose(metric, [20 + 8 * np.sin(day), 60 + 20 * np.cos(day), 50000 + 40000 * np.sin(day)])
+    value = value + np.choose(metric, [0.3, 1.0, 500.0]) * rng.standard_normal(n)
+
+    spike = rng.random(n) < 0.002
+    value[spike] += np.choose(metric[spike], [15.0, 30.0, 60000.0]) * rng.choice([-1, 1], spike.sum())
+    out_of_range = rng.random(n) < 0.001
+    value[out_of_range] = 1e6
+    spike &= ~out_of_range
+    # Gaps: ~0.5% of the readings go missing in runs of 12 (two hours).
+    holes = np.zeros(n, dtype=bool)
+    holes[: n // 12 * 12] = np.repeat(rng.random(n // 12) < 0.005, 12)
+
+    frame = pd.DataFrame(
+        {
+            "parcel_id": "P-001",
+            "sensor_id": np.char.add("sensor-", sensor.astype(str)).astype(object),
+            "metric_type": np.array(METRICS, dtype=object)[metric],
+            "timestamp": pd.to_datetime(timestamp, utc=True),
+            "value": value,
+            "quality_flag": None,
+            "meta": None,
+            "spike": spike,
+        }
+    )[~holes]
+    # 0.1% of the readings are delivered twice, and delivery order is shuffled.
+    frame = pd.concat([frame, frame.sample(frac=0.001, random_state=seed)])
+    return frame.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def legacy_loop(readings: list[dict]) -> int:
+    count = 0
+    for entry in readings:
+        SensorSeriesNormalized(
+            job_id="bench",
+            parcel_id="P-001",
+            sensor_id=entry["sensor_id"],
+            metric_type=entry["type"],
+            timestamp=datetime.fromisoformat(entry["timestamp"].replace("Z", "+00:00")),
+            value=float(entry["value"]),
+            quality_flag=None,
+            meta=None,
+        )
+        count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--loop-sample", type=int, default=100_000, help="readings timed for the legacy loop")
+    args = parser.parse_args()
+
+    frame = synthetic(args.readings, args.sensors)
+    spikes = int(frame["spike"].sum())
+    print(f"{len(frame)} readings, {args.sensors * len(METRICS)} series, {spikes} injected spikes")
+
+    sample = frame.head(args.loop_sample)
+    readings = [
+        {"sensor_id": s, "type": m, "timestamp": t.isoformat(), "value": v}
+        for s, m, t, v in zip(sample["sensor_id"], sample["metric_type"], sample["timestamp"], sample["value"])
+    ]
+    started = time.perf_counter()
+    legacy_loop(readings)
+    loop_rate = len(readings) / (time.perf_counter() - started)
+    print(f"{'loop':<15} | {len(frame) / loop_rate:>7.2f} s (extrapolated from {len(readings)}) | no cleaning")
+
+    for name, strategy in STRATEGIES.items():
+        started = time.perf_counter()
+        cleaned, stats = clean_frame(frame, strategy)
+        elapsed = time.perf_counter() - started
+        caught = ""
+        if "spike" in cleaned:
+            missed = int((cleaned["spike"] & (cleaned["quality_flag"] != "outlier")).sum())
+            caught = f" | spikes caught {spikes - missed}/{spikes}" if strategy.outlier_window else ""
+        print(
+            f"{name:<15} | {elapsed:>7.2f} s | {len(frame) / elapsed / 1e6:.2f} M/s | out {stats['output']}"
+            f" | dropped {stats['dropped']} | flagged {stats['flagged']}{caught}"
+        )
+
+
+if __name__ == "__main__":
+    main()
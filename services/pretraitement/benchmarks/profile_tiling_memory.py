@@ -0,0 +1,155 @@
+"""Peak memory of UAV tiling against a synthetic multi-GB GeoTIFF.
+
+The raster is written sparse (only a diagonal band of blocks holds data), so a
+4+ GB logical image is created in seconds and takes little disk. The tiling path
+under test is the service's own `run_tiling_pipeline`, with a local stand-in for
+the MinIO client (fget_object copies the file, put_object drains the stream).
+
+    cd services/pretraitement
+    python benchmarks/profile_tiling_memory.py --size 32768 --bands 4
+
+Reports the peak RSS growth and the worst event-loop lag during tiling, next to
+the logical raster size and the per-tile array size; the old path needed at least
+the full raster in memory and blocked the loop for the whole job.
+Encoding happens in worker processes, so their memory is reported separately.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "common"))
+
+import numpy as np  # noqa: E402
+import rasterio  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+from rasterio.windows import Window  # noqa: E402
+
+from app.config import Settings  # noqa: E402
+from app.schemas import ImageTilingRequest, MinioObjectRef  # noqa: E402
+from app.services.tiling import run_tiling_pipeline, shutdown_executors  # noqa: E402
+
+BLOCK = 512
+
+
+def create_raster(path: str, size: int, bands: int) -> None:
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": bands,
+        "dtype": "uint16",
+        "crs": "EPSG:32631",
+        "transform": from_origin(500000, 4800000, 0.05, 0.05),
+        "tiled": True,
+        "blockxsize": BLOCK,
+        "blockysize": BLOCK,
+        "sparse_ok": True,
+        "bigtiff": "YES",
+    }
+    rng = np.random.default_rng(0)
+    block = rng.integers(0, 4096, size=(bands, BLOCK, BLOCK), dtype=np.uint16)
+    with rasterio.open(path, "w", **profile) as dst:
+        for offset in range(0, size, BLOCK):
+            dst.write(block, window=Window(offset, offset, BLOCK, BLOCK))
+
+
+class LocalClient:
+    def __init__(self, source_path: str):
+        self.source_path = source_path
+        self.uploaded_bytes = 0
+        self.uploads = 0
+
+    def fget_object(self, bucket, object_name, file_path):
+        shutil.copyfile(self.source_path, file_path)
+
+    def put_object(self, bucket, object_name, data, length, content_type=None):
+        while data.read(1 << 20):
+            pass
+        self.uploaded_bytes += length
+        self.uploads += 1
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+async def tile_with_lag_probe(settings, client, req):
+    """Runs the pipeline while a probe measures how late the event loop wakes up."""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+
+    async def probe():
+        nonlocal worst
+        while True:
+            due = loop.time() + 0.01
+            await asyncio.sleep(0.01)
+            worst = max(worst, loop.time() - due)
+
+    task = asyncio.create_task(probe())
+    try:
+        return await run_tiling_pipeline(settings, client, req), worst
+    finally:
+        task.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=32768, help="raster width/height in pixels")
+    parser.add_argument("--bands", type=int, default=4)
+    parser.add_argument("--tile-size", type=int, default=512)
+    parser.add_argument("--workdir", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(dir=args.workdir)
+    source = os.path.join(workdir, "synthetic.tif")
+    try:
+        # Created in a child process so its buffers do not count towards our peak RSS.
+        child = multiprocessing.get_context("spawn").Process(
+            target=create_raster, args=(source, args.size, args.bands)
+        )
+        child.start()
+        child.join()
+
+        logical_gb = args.size * args.size * args.bands * 2 / 1024 ** 3
+        tile_mb = args.tile_size * args.tile_size * args.bands * 2 / 1024 ** 2
+        settings = Settings(TILING_SOURCE_MODE="download", TILING_TMP_DIR=workdir)
+        req = ImageTilingRequest(
+            source=MinioObjectRef(bucket="uav-raw", object_name="synthetic.tif"),
+            parcel_id="P-bench",
+            mission_id="M-bench",
+            tile_size=args.tile_size,
+        )
+        client = LocalClient(source)
+
+        baseline = peak_rss_mb()
+        started = time.perf_counter()
+        outcome, loop_lag = asyncio.run(tile_with_lag_probe(settings, client, req))
+        elapsed = time.perf_counter() - started
+        growth = peak_rss_mb() - baseline
+        shutdown_executors()
+        tiles = outcome.tiles
+
+        print(f"raster          : {args.size}x{args.size}x{args.bands} uint16 = {logical_gb:.2f} GiB logical")
+        print(f"tiles           : {len(tiles)} in {elapsed:.1f}s ({len(tiles) / elapsed:.0f} tiles/s)")
+        print(f"max loop lag    : {loop_lag * 1000:.1f} ms")
+        print(f"tile array      : {tile_mb:.1f} MiB")
+        print(f"GDAL cache cap  : {settings.tiling_gdal_cache_mb} MiB")
+        in_flight = settings.tiling_read_ahead + settings.tiling_upload_concurrency
+        print(f"in-flight bound : {in_flight} tiles = {in_flight * tile_mb:.0f} MiB")
+        print(f"peak RSS growth : {growth:.1f} MiB")
+        print(f"encoder peak RSS: {peak_rss_mb(resource.RUSAGE_CHILDREN):.1f} MiB (largest child)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Peak memory of a streamed multipart upload: a 2 GiB file under a 256 MiB RSS cap.
+
+Runs the service's own upload path (`receive_to_raw_bucket`, as used by
+POST /imagery/upload and POST /process-image) behind uvicorn in a child process,
+against a local S3 stand-in that speaks just enough of the protocol for minio-py
+(multipart upload, part copy, stat, delete) and discards the bytes. The client
+generates the multipart body on the fly, so nothing here holds the file either.
+
+    cd services/pretraitement
+    python benchmarks/profile_upload_memory.py --size-mb 2048 --cap-mb 256
+
+Exits non-zero if the server's peak RSS exceeds the cap, its growth over idle exceeds
+upload_memory_bound_mb() for the UPLOAD_* settings in the environment, or the stored
+size/hash does not match what was sent.
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "common"))
+
+CHUNK = 1024 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeS3(BaseHTTPRequestHandler):
+    """Objects are kept as sizes and headers only."""
+
+    objects: dict = {}
+    uploads: dict = {}
+    received = 0
+    lock = threading.Lock()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status=200, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _drain(self) -> int:
+        remaining = int(self.headers.get("Content-Length", 0))
+        total = remaining
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, CHUNK)))
+        with FakeS3.lock:
+            FakeS3.received += total
+        return total
+
+    def _key(self):
+        url = urlparse(self.path)
+        return url.path.lstrip("/"), parse_qs(url.query, keep_blank_values=True)
+
+    def do_GET(self):
+        key, query = self._key()
+        if "location" in query:
+            return self._reply(body=b"<LocationConstraint>us-east-1</LocationConstraint>")
+        self._reply(404)
+
+    def do_HEAD(self):
+        key, _ = self._key()
+        if key not in self.objects:
+            return self._reply(404)
+        size, meta = self.objects[key]
+        self.send_response(200)
+        for name, value in {"ETag": '"x"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT", **meta}.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+
+    def do_POST(self):
+        key, query = self._key()
+        self._drain()
+        if "uploads" in query:
+            upload_id = os.urandom(8).hex()
+            meta = {k: v for k, v in self.headers.items() if k.lower().startswith("x-amz-meta-")}
+            self.uploads[upload_id] = (key, 0, meta)
+            body = f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            return self._reply(body=body.encode())
+        upload_id = query["uploadId"][0]
+        key, size, meta = self.uploads.pop(upload_id)
+        self.objects[key] = (size, meta)
+        body = f"<CompleteMultipartUploadResult><Key>{key}</Key><ETag>\"x\"</ETag></CompleteMultipartUploadResult>"
+        self._reply(body=body.encode())
+
+    def do_PUT(self):
+        key, query = self._key()
+        size = self._drain()
+        copy_source = self.headers.get("x-amz-copy-source")
+        if copy_source:
+            source = copy_source.lstrip("/")
+            size = self.objects[source][0]
+        if "uploadId" in query:
+            upload_id = query["uploadId"][0]
+            target, total, meta = self.uploads[upload_id]
+            self.uploads[upload_id] = (target, total + size, meta)
+            if copy_source:
+                body = b'<CopyPartResult><ETag>"x"</ETag><LastModified>2024-01-01T00:00:00Z</LastModified></CopyPartResult>'
+                return self._reply(body=body)
+            return self._reply(headers={"ETag": '"x"'})
+        meta = {k: v for k, v in self.headers.items() if k.lower().startswith("x-amz-meta-")}
+        self.objects[key] = (size, meta)
+        if copy_source:
+            body = b'<CopyObjectResult><ETag>"x"</ETag><LastModified>2024-01-01T00:00:00Z</LastModified></CopyObjectResult>'
+            return self._reply(body=body)
+        self._reply(headers={"ETag": '"x"'})
+
+    def do_DELETE(self):
+        key, _ = self._key()
+        self.objects.pop(key, None)
+        self._reply(204)
+
+
+def run_s3(port: int, ready) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeS3)
+    ready.set()
+    server.serve_forever()
+
+
+def run_app(port: int, s3_port: int, ready) -> None:
+    os.environ.update(MINIO_ENDPOINT=f"127.0.0.1:{s3_port}", METRICS_ENABLED="false")
+    import resource
+
+    import uvicorn
+    from fastapi import FastAPI, Request
+
+    from app.api.imagery import receive_to_raw_bucket
+
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        stored, reused, _ = await receive_to_raw_bucket(request)
+        return {"object_name": stored.object_name, "size": stored.size, "sha256": stored.sha256, "reused": reused}
+
+    @app.get("/rss")
+    async def rss():
+        return {"peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=lambda: (time.sleep(1), ready.set()), daemon=True).start()
+    server.run()
+
+
+def body(size: int, boundary: str, digest):
+    yield (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="synthetic.tif"\r\n'
+        "Content-Type: image/tiff\r\n\r\n"
+    ).encode()
+    block = os.urandom(CHUNK)
+    sent = 0
+    while sent < size:
+        chunk = block[: min(CHUNK, size - sent)]
+        digest.update(chunk)
+        sent += len(chunk)
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--cap-mb", type=int, default=256)
+    args = parser.parse_args()
+
+    import httpx
+
+    from app.config import get_settings
+    from app.uploads import upload_memory_bound_mb
+
+    bound = upload_memory_bound_mb(get_settings())
+
+    context = multiprocessing.get_context("spawn")
+    s3_port, app_port = free_port(), free_port()
+    s3_ready, app_ready = context.Event(), context.Event()
+    s3 = context.Process(target=run_s3, args=(s3_port, s3_ready), daemon=True)
+    s3.start()
+    s3_ready.wait()
+    server = context.Process(target=run_app, args=(app_port, s3_port, app_ready), daemon=True)
+    server.start()
+    app_ready.wait()
+
+    base = f"http://127.0.0.1:{app_port}"
+    try:
+        with httpx.Client(timeout=None) as client:
+            baseline = client.get(f"{base}/rss").json()["peak_mb"]
+            size = args.size_mb * 1024 * 1024
+            digest = hashlib.sha256()
+            boundary = "bench" + os.urandom(8).hex()
+            started = time.perf_counter()
+            response = client.post(
+                f"{base}/upload",
+                content=body(size, boundary, digest),
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+            )
+            elapsed = time.perf_counter() - started
+            response.raise_for_status()
+            stored = response.json()
+            peak = client.get(f"{base}/rss").json()["peak_mb"]
+    finally:
+        server.terminate()
+        s3.terminate()
+
+    ok_content = stored["size"] == size and stored["sha256"] == digest.hexdigest()
+    ok_memory = peak <= args.cap_mb and peak - baseline <= bound
+    print(f"uploaded        : {size / 1024 ** 3:.2f} GiB in {elapsed:.1f}s ({size / elapsed / 1024 ** 2:.0f} MiB/s)")
+    print(f"stored as       : {stored['object_name']} ({'size and sha256 match' if ok_content else 'MISMATCH'})")
+    print(f"server peak RSS : {peak:.0f} MiB (idle {baseline:.0f} MiB, cap {args.cap_mb} MiB)")
+    print(f"upload overhead : {peak - baseline:.0f} MiB (bound {bound:.0f} MiB)")
+    if not (ok_content and ok_memory):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
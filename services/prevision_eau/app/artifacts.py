@@ -0,0 +1,134 @@
+"""Stockage versionné des modèles entraînés.
+
+Chaque entraînement écrit un artefact immuable ``<capteur>/<modèle>/<version>.bin``
+(et ses métadonnées d'entraînement, ``<version>.json``) puis met à jour le pointeur
+``<capteur>/<modèle>/LATEST`` qui contient la version courante. Une version déjà
+publiée n'est jamais réécrite : l'API peut donc garder un modèle chargé en cache
+tant que sa version est la dernière.
+"""
+import abc
+import io
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from agro_common import metrics
+
+from app import config
+
+
+def new_version() -> str:
+    """Version triable chronologiquement (UTC, à la microseconde)."""
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def artifact_key(sensor_id: str, model: str, version: str) -> str:
+    return f"{sensor_id}/{model}/{version}.bin"
+
+
+def meta_key(sensor_id: str, model: str, version: str) -> str:
+    return f"{sensor_id}/{model}/{version}.json"
+
+
+def latest_key(sensor_id: str, model: str) -> str:
+    return f"{sensor_id}/{model}/LATEST"
+
+
+class ArtifactStore(abc.ABC):
+    """Publication et lecture des versions ; les sous-classes fournissent get/put."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Contenu de l'objet, ou None s'il n'existe pas."""
+
+    @abc.abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """Écrit (ou remplace) l'objet."""
+
+    def publish(self, sensor_id: str, model: str, data: bytes, meta: Optional[dict] = None) -> str:
+        """Écrit une nouvelle version (et ses métadonnées) puis la désigne comme la dernière."""
+        version = new_version()
+        self.put(artifact_key(sensor_id, model, version), data)
+        if meta is not None:
+            self.put(meta_key(sensor_id, model, version), json.dumps(meta).encode())
+        self.put(latest_key(sensor_id, model), version.encode())
+        return version
+
+    def latest_version(self, sensor_id: str, model: str) -> Optional[str]:
+        data = self.get(latest_key(sensor_id, model))
+        return data.decode().strip() if data else None
+
+    def load(self, sensor_id: str, model: str, version: str) -> Optional[bytes]:
+        return self.get(artifact_key(sensor_id, model, version))
+
+    def load_meta(self, sensor_id: str, model: str, version: str) -> Optional[dict]:
+        data = self.get(meta_key(sensor_id, model, version))
+        return json.loads(data) if data else None
+
+
+class LocalArtifactStore(ArtifactStore):
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return (self.root / key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Écriture puis renommage : un lecteur ne voit jamais un fichier à moitié écrit.
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+
+class MinioArtifactStore(ArtifactStore):
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+        self._bucket_checked = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        from minio.error import S3Error
+
+        try:
+            with metrics.track("minio", "get_object"):
+                response = self.client.get_object(self.bucket, key)
+                try:
+                    return response.read()
+                finally:
+                    response.close()
+                    response.release_conn()
+        except S3Error as exc:
+            if exc.code in ("NoSuchKey", "NoSuchObject", "NoSuchBucket", "NotFound"):
+                return None
+            raise
+
+    def put(self, key: str, data: bytes) -> None:
+        if not self._bucket_checked:
+            if not self.client.bucket_exists(self.bucket):
+                self.client.make_bucket(self.bucket)
+            self._bucket_checked = True
+        with metrics.track("minio", "put_object"):
+            self.client.put_object(self.bucket, key, io.BytesIO(data), len(data))
+
+
+def get_store() -> ArtifactStore:
+    if config.FORECAST_ARTIFACT_STORE == "minio":
+        from minio import Minio
+
+        client = Minio(
+            config.MINIO_ENDPOINT,
+            access_key=config.MINIO_ACCESS_KEY,
+            secret_key=config.MINIO_SECRET_KEY,
+            secure=config.MINIO_SECURE,
+        )
+        return MinioArtifactStore(client, config.FORECAST_ARTIFACT_BUCKET)
+    if config.FORECAST_ARTIFACT_STORE == "local":
+        return LocalArtifactStore(config.FORECAST_ARTIFACT_DIR)
+    raise RuntimeError(f"FORECAST_ARTIFACT_STORE inconnu : {config.FORECAST_ARTIFACT_STORE!r}")
@@ -0,0 +1,258 @@
+"""Prévision nocturne de tout le parc de capteurs.
+
+    python -m app.batch_forecast                          # tous les capteurs, tous les modèles
+    python -m app.batch_forecast --model prophet --workers 4 --report /tmp/rapport.json
+
+Les capteurs de `sensor_measurements` sont répartis sur un pool de processus (un par
+cœur disponible par défaut, sans dépasser la mémoire de la machine divisée par la
+limite par processus). Chaque processus met à jour les modèles d'un capteur
+(réentraînement à chaud, complet ou aucun : voir forecasting.update ; les nouvelles
+versions sont publiées et l'API les sert) et renvoie les prévisions ; le processus
+principal les écrit dans `water_forecasts` par paquets, avec COPY. Un rapport donne,
+par capteur et par modèle, la mise à jour faite, son temps d'entraînement et
+l'éventuelle erreur, la durée totale et le calcul épargné par rapport à des
+réentraînements complets (estimé d'après le dernier réentraînement complet).
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from app import config, forecasting
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+logger = logging.getLogger("prevision.batch")
+
+_store = None
+_started = None
+
+
+@dataclass
+class SensorRun:
+    sensor_id: str
+    model: str
+    action: Optional[str] = None
+    fit_s: float = 0.0
+    full_estimate_s: float = 0.0
+    new_points: int = 0
+    drift: Optional[float] = None
+    version: Optional[str] = None
+    error: Optional[str] = None
+    # Prévision (ds, yhat) et nom du modèle pour water_forecasts ; jamais dans le rapport
+    forecast: object = field(default=None, repr=False)
+    model_used: Optional[str] = None
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers(memory_mb):
+    """Un processus par cœur disponible, dans la limite de la mémoire physique."""
+    physical_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2 ** 20
+    return max(1, min(available_cores(), physical_mb // memory_mb))
+
+
+def _init_worker(memory_mb, started):
+    global _store, _started
+    # Plafond du segment de données (tas + allocations anonymes) : un capteur qui le
+    # dépasse échoue en MemoryError sans emporter la machine. RLIMIT_AS ne convient pas :
+    # torch réserve à lui seul plusieurs Go d'espace d'adressage sans les utiliser.
+    limit = memory_mb * 2 ** 20
+    resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+    # Un thread de calcul par processus : le parallélisme vient du pool
+    config.FORECAST_LSTM_THREADS = 1
+    from app.artifacts import get_store
+
+    _store = get_store()
+    _started = started
+
+
+def _run_sensor(sensor_id, models, hours, force_full):
+    from app.database import get_sensor_data
+
+    # Si le processus meurt pendant ce capteur, le processus principal saura lequel
+    _started.put(sensor_id)
+
+    full_history = []
+
+    def load_history(start):
+        # L'historique complet n'est lu qu'une fois par capteur, quel que soit le nombre de modèles
+        if start is not None:
+            return get_sensor_data(sensor_id, start)
+        if not full_history:
+            full_history.append(get_sensor_data(sensor_id))
+        return full_history[0]
+
+    runs = []
+    for model in models:
+        run = SensorRun(sensor_id, model)
+        try:
+            result, run.forecast, run.model_used = forecasting.fit_and_forecast(
+                _store, sensor_id, model, load_history, hours, force_full=force_full
+            )
+            run.action, run.version, run.fit_s = result.action, result.version, result.fit_s
+            run.full_estimate_s, run.new_points, run.drift = result.full_estimate_s, result.new_points, result.drift
+        except Exception as exc:  # un capteur en échec n'arrête pas la nuit
+            run.error = f"{type(exc).__name__}: {exc}"
+        runs.append(run)
+    return runs
+
+
+def _flush(pending):
+    from app.database import write_forecasts
+
+    if pending:
+        write_forecasts([(run.sensor_id, run.model_used, run.forecast) for run in pending])
+        logger.info("%d prévisions écrites dans water_forecasts", len(pending))
+        pending.clear()
+
+
+def _drain(queue):
+    items = set()
+    while not queue.empty():
+        items.add(queue.get())
+    return items
+
+
+def run_fleet(sensor_ids, models, hours, workers, memory_mb, force_full=False, flush_every=200):
+    """Prévoit chaque capteur avec chaque modèle ; renvoie la liste des SensorRun.
+
+    Un processus tué (OOM killer, abandon natif…) casse tout le pool : les capteurs
+    qu'il n'avait pas encore commencés repartent dans un nouveau pool, et ceux en
+    cours sont rejoués un par un, chacun seul dans son pool, pour que seul le
+    capteur fautif soit compté en échec.
+    """
+    runs, pending = [], []
+    context = multiprocessing.get_context("spawn")
+    started = context.SimpleQueue()
+    todo, isolated = list(sensor_ids), []
+    while todo or isolated:
+        if todo:
+            batch, size, todo = todo, workers, []
+        else:
+            batch, size = [isolated.pop(0)], 1
+        broken = {}
+        with ProcessPoolExecutor(size, mp_context=context, initializer=_init_worker,
+                                 initargs=(memory_mb, started)) as pool:
+            futures = {pool.submit(_run_sensor, sensor_id, models, hours, force_full): sensor_id for sensor_id in batch}
+            for future in as_completed(futures):
+                try:
+                    sensor_runs = future.result()
+                except BrokenProcessPool as exc:
+                    broken[futures[future]] = exc
+                    continue
+                for run in sensor_runs:
+                    if run.error:
+                        logger.warning("%s / %s : échec (%s)", run.sensor_id, run.model, run.error)
+                    else:
+                        pending.append(run)
+                runs.extend(sensor_runs)
+                if len(pending) >= flush_every:
+                    _flush(pending)
+        in_flight = _drain(started) & set(broken)
+        if not broken:
+            continue
+        if size == 1 or not in_flight:
+            # Capteur fautif isolé, ou processus mort avant tout capteur (initialisation)
+            for sensor_id, exc in broken.items():
+                logger.warning("%s : processus tué (%s)", sensor_id, exc)
+                runs.extend(SensorRun(sensor_id, model, error=f"BrokenProcessPool: {exc}") for model in models)
+            continue
+        logger.warning("Pool cassé pendant %s : %d capteurs rejoués seuls, %d relancés",
+                       ", ".join(sorted(in_flight)), len(in_flight), len(broken) - len(in_flight))
+        isolated.extend(sorted(in_flight))
+        todo = [sensor_id for sensor_id in batch if sensor_id in broken and sensor_id not in in_flight]
+    _flush(pending)
+    return runs
+
+
+def report(runs, wall_s, workers):
+    failures = [run for run in runs if run.error]
+    fit_s = sum(run.fit_s for run in runs)
+    full_estimate_s = sum(run.full_estimate_s for run in runs)
+    summary = {
+        "sensors": len({run.sensor_id for run in runs}),
+        "forecasts": len(runs) - len(failures),
+        "failures": len(failures),
+        "workers": workers,
+        "wall_clock_s": round(wall_s, 1),
+        "actions": {
+            action: sum(1 for run in runs if run.action == action) for action in ("full", "warm", "skip")
+        },
+        "fit_s_total": round(fit_s, 1),
+        # Temps qu'auraient coûté des réentraînements complets de tous les modèles
+        "fit_s_full_estimate": round(full_estimate_s, 1),
+        "saved_pct": round(100 * (1 - fit_s / full_estimate_s), 1) if full_estimate_s else 0.0,
+        "runs": [
+            {key: value for key, value in asdict(run).items() if key not in ("forecast", "model_used")}
+            for run in sorted(runs, key=lambda run: (run.sensor_id, run.model))
+        ],
+    }
+    for run in summary["runs"]:
+        for key in ("fit_s", "full_estimate_s", "drift"):
+            if run[key] is not None:
+                run[key] = round(run[key], 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensor", action="append", help="capteur à prévoir (répétable ; défaut : tous)")
+    parser.add_argument("--model", action="append", choices=forecasting.MODELS, help="modèle (répétable ; défaut : tous)")
+    parser.add_argument("--days", type=int, default=config.FORECAST_DAYS, help="jours prévus")
+    parser.add_argument("--workers", type=int, default=config.FORECAST_BATCH_WORKERS or None,
+                        help="processus (défaut : cœurs disponibles)")
+    parser.add_argument("--memory-mb", type=int, default=config.FORECAST_WORKER_MEMORY_MB,
+                        help="mémoire maximale par processus")
+    parser.add_argument("--full", action="store_true", help="réentraînement complet de tous les modèles")
+    parser.add_argument("--report", help="fichier JSON du rapport détaillé")
+    args = parser.parse_args()
+
+    from app.database import list_sensors
+
+    sensor_ids = args.sensor or list_sensors()
+    models = args.model or list(forecasting.MODELS)
+    workers = args.workers or default_workers(args.memory_mb)
+    logger.info("%d capteurs, modèles %s, %d processus (%d Mo max chacun)",
+                len(sensor_ids), ", ".join(models), workers, args.memory_mb)
+
+    started = time.perf_counter()
+    runs = run_fleet(sensor_ids, models, 24 * args.days, workers, args.memory_mb, force_full=args.full)
+    summary = report(runs, time.perf_counter() - started, workers)
+
+    for run in summary["runs"]:
+        if run["error"]:
+            status = f"échec : {run['error']}"
+        else:
+            status = f"{run['action']:<4} version {run['version']} ({run['new_points']} nouvelles mesures, dérive {run['drift']})"
+        logger.info("%-30s %-8s %7.2f s  %s", run["sensor_id"], run["model"], run["fit_s"], status)
+    logger.info(
+        "%d capteurs, %d prévisions, %d échecs en %.1f s (%.1f s d'entraînement cumulé, %d processus)",
+        summary["sensors"], summary["forecasts"], summary["failures"], summary["wall_clock_s"],
+        summary["fit_s_total"], workers,
+    )
+    logger.info(
+        "Mises à jour : %(full)d complètes, %(warm)d à chaud, %(skip)d inutiles", summary["actions"]
+    )
+    logger.info(
+        "Entraînement : %.1f s au lieu de ~%.1f s en réentraînements complets (%.0f %% épargnés)",
+        summary["fit_s_total"], summary["fit_s_full_estimate"], summary["saved_pct"],
+    )
+    if args.report:
+        with open(args.report, "w") as handle:
+            json.dump(summary, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+
+# --- Artefacts des modèles (entraînés hors ligne par `python -m app.train`) ---
+# "local" : fichiers sous FORECAST_ARTIFACT_DIR ; "minio" : bucket FORECAST_ARTIFACT_BUCKET.
+FORECAST_ARTIFACT_STORE = os.getenv("FORECAST_ARTIFACT_STORE", "local").lower()
+FORECAST_ARTIFACT_DIR = os.getenv("FORECAST_ARTIFACT_DIR", "/app/artifacts")
+FORECAST_ARTIFACT_BUCKET = os.getenv("FORECAST_ARTIFACT_BUCKET", "forecast-models")
+
+MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "minio:9000")
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() == "true"
+
+# --- Inférence ---
+# Modèles chargés gardés en mémoire, clé (capteur, modèle, version).
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "64"))
+# Durée pendant laquelle la "dernière version" d'un modèle est reprise du cache
+# avant de relire le pointeur LATEST dans le stockage.
+FORECAST_LATEST_TTL_S = float(os.getenv("FORECAST_LATEST_TTL_S", "60"))
+FORECAST_DEFAULT_MODEL = os.getenv("FORECAST_DEFAULT_MODEL", "lstm").lower()
+FORECAST_DAYS = int(os.getenv("FORECAST_DAYS", "7"))
+# Capteur d'humidité du sol associé à une parcelle.
+FORECAST_SENSOR_ID = os.getenv("FORECAST_SENSOR_ID", "capteur_parcelle_{parcelle_id}")
+
+# --- Entraînement ---
+# Nombre maximal d'époques : l'entraînement s'arrête après FORECAST_LSTM_PATIENCE
+# époques sans amélioration de la perte de validation.
+FORECAST_LSTM_EPOCHS = int(os.getenv("FORECAST_LSTM_EPOCHS", "50"))
+FORECAST_LSTM_PATIENCE = int(os.getenv("FORECAST_LSTM_PATIENCE", "5"))
+# Heures prédites par passe du LSTM (168 : les 7 jours d'un coup ; 1 : pas à pas).
+FORECAST_LSTM_HORIZON = int(os.getenv("FORECAST_LSTM_HORIZON", "168"))
+# Époques maximales d'un réentraînement à chaud (à partir du modèle précédent).
+FORECAST_LSTM_FINETUNE_EPOCHS = int(os.getenv("FORECAST_LSTM_FINETUNE_EPOCHS", "10"))
+FORECAST_LSTM_BATCH_SIZE = int(os.getenv("FORECAST_LSTM_BATCH_SIZE", "64"))
+# Threads de calcul de torch (0 : valeur par défaut de torch, un par cœur).
+FORECAST_LSTM_THREADS = int(os.getenv("FORECAST_LSTM_THREADS", "0"))
+
+# --- Prévision de tout le parc (python -m app.batch_forecast) ---
+# Processus du pool (0 : un par cœur disponible, dans la limite de la mémoire).
+FORECAST_BATCH_WORKERS = int(os.getenv("FORECAST_BATCH_WORKERS", "0"))
+# Plafond du segment de données de chaque processus (torch et Prophet chargés : ~0,9 Go).
+FORECAST_WORKER_MEMORY_MB = int(os.getenv("FORECAST_WORKER_MEMORY_MB", "2048"))
+
+# --- Mises à jour incrémentales ---
+# Réentraînement dès que ce nombre de nouvelles mesures est atteint…
+FORECAST_RETRAIN_MIN_POINTS = int(os.getenv("FORECAST_RETRAIN_MIN_POINTS", "24"))
+# …ou dès que l'erreur du modèle sur les nouvelles mesures dépasse ce multiple de
+# celle d'une prévision naïve saisonnière (la valeur 24 h plus tôt).
+FORECAST_DRIFT_RATIO = float(os.getenv("FORECAST_DRIFT_RATIO", "1.0"))
+# Historique relu pour un réentraînement à chaud du LSTM (avant les nouvelles mesures).
+FORECAST_WARM_HISTORY_DAYS = int(os.getenv("FORECAST_WARM_HISTORY_DAYS", "14"))
+# Réentraînement complet après ce nombre de mises à jour à chaud successives.
+FORECAST_MAX_WARM_UPDATES = int(os.getenv("FORECAST_MAX_WARM_UPDATES", "30"))
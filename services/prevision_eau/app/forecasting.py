@@ -0,0 +1,307 @@
+"""Moteur de prévision : les modèles sont entraînés hors ligne, l'API ne fait que de l'inférence.
+
+`python -m app.train` entraîne les modèles et publie leurs artefacts versionnés
+(voir app/artifacts.py). À chaque requête, le moteur résout la dernière version du
+modèle demandé, le reprend du cache LRU (clé capteur, modèle, version) ou le charge
+depuis le stockage, lit les dernières mesures du capteur et lance la prédiction.
+Publier une nouvelle version suffit à la faire servir, au plus FORECAST_LATEST_TTL_S
+secondes plus tard ; les anciennes versions sortent du cache d'elles-mêmes.
+
+Les mises à jour sont incrémentales (`update`) : un modèle n'est réentraîné que si
+assez de mesures sont arrivées depuis son entraînement ou si son erreur dérive, et
+alors à chaud, à partir de la version précédente. Un réentraînement complet n'a
+lieu qu'au premier entraînement, après FORECAST_MAX_WARM_UPDATES mises à jour à
+chaud, ou quand le réentraînement à chaud est impossible.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.artifacts import ArtifactStore
+
+logger = logging.getLogger(__name__)
+
+MODELS = ("lstm", "prophet")
+
+
+class ModelNotFound(LookupError):
+    """Aucun modèle entraîné pour ce capteur."""
+
+
+def _loader(model):
+    # Imports paresseux : torch et prophet ne sont chargés que s'ils servent
+    if model == "lstm":
+        from app.model_lstm import LSTMForecaster
+        return LSTMForecaster
+    if model == "prophet":
+        from app.model_prophet import ProphetForecaster
+        return ProphetForecaster
+    raise ValueError(f"Modèle inconnu : {model!r} (attendu : {', '.join(MODELS)})")
+
+
+def _trainer(model):
+    if model == "lstm":
+        from app.model_lstm import train_lstm
+        return lambda df: train_lstm(
+            df,
+            epochs=config.FORECAST_LSTM_EPOCHS,
+            batch_size=config.FORECAST_LSTM_BATCH_SIZE,
+            patience=config.FORECAST_LSTM_PATIENCE,
+            num_threads=config.FORECAST_LSTM_THREADS or None,
+            horizon=config.FORECAST_LSTM_HORIZON,
+        )
+    if model == "prophet":
+        from app.model_prophet import train_prophet
+        return train_prophet
+    raise ValueError(f"Modèle inconnu : {model!r} (attendu : {', '.join(MODELS)})")
+
+
+def _warm_trainer(model):
+    if model == "lstm":
+        from app.model_lstm import finetune_lstm
+        return lambda artifact, df: finetune_lstm(
+            artifact,
+            df,
+            epochs=config.FORECAST_LSTM_FINETUNE_EPOCHS,
+            batch_size=config.FORECAST_LSTM_BATCH_SIZE,
+            num_threads=config.FORECAST_LSTM_THREADS or None,
+        )
+    if model == "prophet":
+        from app.model_prophet import warm_start_prophet
+        return warm_start_prophet
+    raise ValueError(f"Modèle inconnu : {model!r} (attendu : {', '.join(MODELS)})")
+
+
+@dataclass
+class Update:
+    action: str  # "full", "warm" ou "skip"
+    version: str
+    fit_s: float
+    new_points: int
+    # Erreur du modèle précédent sur les nouvelles mesures / erreur naïve saisonnière
+    drift: Optional[float]
+    # Coût estimé d'un réentraînement complet sur tout l'historique à la place
+    full_estimate_s: float
+    forecaster: object = field(default=None, repr=False)
+    history: object = field(default=None, repr=False)
+
+
+def drift_ratio(forecaster, before, after, season=24):
+    """Erreur de `forecaster` sur les mesures `after` arrivées depuis son entraînement.
+
+    Rapportée à celle d'une prévision naïve saisonnière (la mesure `season` heures
+    plus tôt) sur les mêmes `season` premières heures : au-delà de 1, le modèle fait
+    moins bien que « comme hier ». None si les données ne suffisent pas à conclure.
+    """
+    actual = after['soil_humidity'].values[:season].astype(float)
+    if len(actual) == 0 or len(before) < max(getattr(forecaster, "train_window", 1), season):
+        return None
+    try:
+        predicted = forecaster.predict(before, len(actual))['yhat'].values
+    except ValueError:
+        return None
+    naive = before['soil_humidity'].values[-season:][:len(actual)].astype(float)
+    naive_mae = np.mean(np.abs(naive - actual))
+    if naive_mae == 0:
+        return None
+    return float(np.mean(np.abs(predicted - actual)) / naive_mae)
+
+
+def _last_time(history):
+    return pd.Timestamp(pd.to_datetime(history['time']).max()).isoformat()
+
+
+def _full_update(store, sensor_id, model, history, new_points, drift=None):
+    if history.empty:
+        raise ValueError("aucune mesure")
+    started = time.perf_counter()
+    artifact = _trainer(model)(history)
+    fit_s = time.perf_counter() - started
+    if artifact is None:
+        raise ValueError(f"historique trop court pour {model} ({len(history)} mesures)")
+    meta = {
+        "mode": "full",
+        "trained_until": _last_time(history),
+        "points": len(history),
+        "fit_s": fit_s,
+        # Référence pour estimer le coût d'un réentraînement complet plus tard
+        "full_fit_s": fit_s,
+        "full_points": len(history),
+        "warm_updates": 0,
+    }
+    version = store.publish(sensor_id, model, artifact, meta)
+    return Update("full", version, fit_s, new_points, drift, fit_s, _loader(model)(artifact), history)
+
+
+def update(store: ArtifactStore, sensor_id, model, load_history, force_full=False):
+    """Met à jour le modèle `model` d'un capteur au moindre coût et renvoie un Update.
+
+    `load_history(start)` renvoie les mesures (time, soil_humidity) depuis `start`,
+    tout l'historique si `start` vaut None.
+    """
+    version = store.latest_version(sensor_id, model)
+    meta = store.load_meta(sensor_id, model, version) if version else None
+    artifact = None
+    if meta is not None and not force_full and meta["warm_updates"] < config.FORECAST_MAX_WARM_UPDATES:
+        artifact = store.load(sensor_id, model, version)
+        if artifact is None:
+            logger.warning("%s / %s : artefact %s introuvable, réentraînement complet", sensor_id, model, version)
+    if artifact is None:
+        history = load_history(None)
+        new_points = len(history)
+        if meta is not None:
+            new_points = int((pd.to_datetime(history['time']) > pd.Timestamp(meta["trained_until"])).sum())
+        return _full_update(store, sensor_id, model, history, new_points)
+
+    # Seul l'historique récent est lu : les nouvelles mesures et quelques jours avant
+    trained_until = pd.Timestamp(meta["trained_until"])
+    recent = load_history(trained_until - pd.Timedelta(days=config.FORECAST_WARM_HISTORY_DAYS))
+    is_new = pd.to_datetime(recent['time']) > trained_until
+    before, after = recent[~is_new], recent[is_new]
+    forecaster = _loader(model)(artifact)
+    drift = drift_ratio(forecaster, before, after)
+    points = meta["points"] + len(after)
+    full_estimate_s = meta["full_fit_s"] * points / meta["full_points"]
+
+    drifted = drift is not None and drift > config.FORECAST_DRIFT_RATIO
+    if len(after) < config.FORECAST_RETRAIN_MIN_POINTS and not drifted:
+        return Update("skip", version, 0.0, len(after), drift, full_estimate_s, forecaster, recent)
+
+    # Prophet a besoin de tout l'historique pour sa tendance ; le LSTM, de l'historique récent
+    history = recent if model == "lstm" else load_history(None)
+    started = time.perf_counter()
+    warm_artifact = _warm_trainer(model)(artifact, history)
+    fit_s = time.perf_counter() - started
+    if warm_artifact is None:
+        logger.info("%s / %s : réentraînement à chaud impossible, réentraînement complet", sensor_id, model)
+        return _full_update(store, sensor_id, model, load_history(None), len(after), drift)
+
+    meta = dict(
+        meta,
+        mode="warm",
+        trained_until=_last_time(history),
+        points=points,
+        fit_s=fit_s,
+        warm_updates=meta["warm_updates"] + 1,
+        base_version=version,
+    )
+    version = store.publish(sensor_id, model, warm_artifact, meta)
+    return Update("warm", version, fit_s, len(after), drift, full_estimate_s, _loader(model)(warm_artifact), history)
+
+
+def train(store: ArtifactStore, sensor_id, model, history):
+    """Entraînement complet de `model` sur `history` ; renvoie la version publiée, ou None."""
+    try:
+        return _full_update(store, sensor_id, model, history, len(history)).version
+    except ValueError:
+        return None
+
+
+def fit_and_forecast(store: ArtifactStore, sensor_id, model, load_history, hours, force_full=False):
+    """Met à jour `model` (voir `update`) puis prévoit `hours` heures après la dernière mesure.
+
+    Renvoie (Update, DataFrame ds/yhat, nom du modèle) ; ValueError si l'historique
+    est trop court pour entraîner le modèle.
+    """
+    result = update(store, sensor_id, model, load_history, force_full=force_full)
+    return result, result.forecaster.predict(result.history, hours), result.forecaster.name
+
+
+class ForecastEngine:
+    def __init__(self, store: ArtifactStore, recent_history, cache_size=None, latest_ttl=None, recent_histories=None):
+        """`recent_history(sensor_id, points)` renvoie les dernières mesures (time, soil_humidity) ;
+        `recent_histories(sensor_ids, points)` fait de même pour plusieurs capteurs (dict par capteur).
+        """
+        self.store = store
+        self.recent_history = recent_history
+        self.recent_histories = recent_histories or (
+            lambda sensor_ids, points: {sensor_id: recent_history(sensor_id, points) for sensor_id in sensor_ids}
+        )
+        self.cache_size = config.FORECAST_CACHE_SIZE if cache_size is None else cache_size
+        self.latest_ttl = config.FORECAST_LATEST_TTL_S if latest_ttl is None else latest_ttl
+        self._models = OrderedDict()  # (capteur, modèle, version) -> forecaster
+        self._latest = {}  # (capteur, modèle) -> (version, instant de lecture)
+        self._lock = threading.Lock()
+
+    def latest_version(self, sensor_id, model):
+        key = (sensor_id, model)
+        cached = self._latest.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.latest_ttl:
+            return cached[0]
+        version = self.store.latest_version(sensor_id, model)
+        if version is None:
+            raise ModelNotFound(f"Aucun modèle {model} entraîné pour le capteur {sensor_id}")
+        self._latest[key] = (version, time.monotonic())
+        return version
+
+    def get_model(self, sensor_id, model, version):
+        key = (sensor_id, model, version)
+        with self._lock:
+            forecaster = self._models.get(key)
+            if forecaster is not None:
+                self._models.move_to_end(key)
+                return forecaster
+
+        # Chargement hors du verrou : deux requêtes simultanées peuvent charger le même
+        # modèle, mais un chargement lent ne bloque pas les modèles déjà en cache.
+        loader = _loader(model)
+        artifact = self.store.load(sensor_id, model, version)
+        if artifact is None:
+            raise ModelNotFound(f"Artefact {model} {version} introuvable pour le capteur {sensor_id}")
+        forecaster = loader(artifact)
+        logger.info("Modèle %s %s chargé pour %s", model, version, sensor_id)
+
+        with self._lock:
+            self._models[key] = forecaster
+            self._models.move_to_end(key)
+            while len(self._models) > self.cache_size:
+                self._models.popitem(last=False)
+        return forecaster
+
+    def forecast(self, sensor_id, model, hours):
+        """Prévision horaire (DataFrame ds, yhat) et version du modèle utilisé."""
+        version = self.latest_version(sensor_id, model)
+        forecaster = self.get_model(sensor_id, model, version)
+        context_points = getattr(forecaster, "train_window", 1)
+        history = self.recent_history(sensor_id, context_points)
+        return forecaster.predict(history, hours), forecaster.name, version
+
+    def forecast_many(self, sensor_ids, model, hours):
+        """Prévisions de plusieurs capteurs : {capteur: (DataFrame ds/yhat, nom du modèle, version)}.
+
+        Les modèles LSTM de tous les capteurs sont calculés en un seul lot de tenseurs.
+        Les capteurs sans modèle entraîné ou sans assez de mesures sont absents du résultat.
+        """
+        loaded = {}
+        for sensor_id in sensor_ids:
+            try:
+                version = self.latest_version(sensor_id, model)
+                loaded[sensor_id] = (self.get_model(sensor_id, model, version), version)
+            except ModelNotFound as exc:
+                logger.warning("%s", exc)
+        if not loaded:
+            return {}
+
+        context_points = max(getattr(forecaster, "train_window", 1) for forecaster, _ in loaded.values())
+        histories = self.recent_histories(list(loaded), context_points)
+        ready = [
+            sensor_id for sensor_id, (forecaster, _) in loaded.items()
+            if len(histories.get(sensor_id, ())) >= getattr(forecaster, "train_window", 1)
+        ]
+        if model == "lstm":
+            from app.model_lstm import predict_batch
+
+            frames = predict_batch([loaded[s][0] for s in ready], [histories[s] for s in ready], hours)
+        else:
+            frames = [loaded[s][0].predict(histories[s], hours) for s in ready]
+        return {
+            sensor_id: (frame, loaded[sensor_id][0].name, loaded[sensor_id][1])
+            for sensor_id, frame in zip(ready, frames)
+        }
@@ -19,6 +19,9 @@ def init_db():
     # 2. Conversion en Hypertable (Spécialité TimescaleDB pour la performance)
     convert_sensors_hypertable = "SELECT create_hypertable('sensor_measurements', 'time', if_not_exists => TRUE);"
 
+    # Index pour lire les dernières mesures d'un capteur (contexte du LSTM à chaque requête)
+    create_sensors_index = "CREATE INDEX IF NOT EXISTS idx_sensor_measurements_sensor_time ON sensor_measurements (sensor_id, time DESC);"
+
     # 3. Table OUTPUT : Tes Prévisions (Ce que tu envoies au Service 6)
     create_forecast_table = """
     CREATE TABLE IF NOT EXISTS water_forecasts (
@@ -43,6 +46,9 @@ def init_db():
             
             conn.execute(text(convert_sensors_hypertable))
             print(" - Optimisation TimescaleDB appliquée (Input).")
+
+            conn.execute(text(create_sensors_index))
+            print(" - Index (sensor_id, time) créé.")
             
             conn.execute(text(create_forecast_table))
             print(" - Table 'water_forecasts' créée.")
@@ -1,25 +1,51 @@
-from fastapi import FastAPI, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-import random
-from datetime import datetime, timedelta
-from app.database import get_db
+from fastapi import FastAPI, HTTPException, Query
+from agro_common import metrics
+from app import config
+from app.artifacts import get_store
+from app.database import get_recent_humidity, get_recent_humidity_many
+from app.forecasting import MODELS, ForecastEngine, ModelNotFound
+
+app = FastAPI(title="PrevisionEau API (LSTM/Prophet)", version="1.2.0")
+metrics.instrument_fastapi(app, "prevision-eau")
+
+# Modèles entraînés hors ligne (python -m app.train) ; l'API ne fait que de l'inférence
+engine = ForecastEngine(get_store(), get_recent_humidity, recent_histories=get_recent_humidity_many)
+
+
+def indice_stress(humidite):
+    """Indice de stress hydrique (0 à 100) : 100 pour un sol sec, 0 pour un sol saturé."""
+    return min(max(100.0 - humidite, 0.0), 100.0)
 
-app = FastAPI(title="PrevisionEau API (LSTM/Prophet)", version="1.1.0")
 
 @app.get("/parcelle/{parcelle_id}")
-def get_forecast(parcelle_id: str, db: Session = Depends(get_db)):
+def get_forecast(parcelle_id: str, model: str = Query(config.FORECAST_DEFAULT_MODEL, enum=list(MODELS))):
     """
-    Simule une prédiction LSTM/Prophet sur 7 jours.
+    Prévision LSTM/Prophet de l'humidité du sol sur FORECAST_DAYS jours.
     Calcule le risque de stress hydrique futur.
     """
-    # 1. Simulation d'une tendance de stress (0 à 100)
-    # Dans un vrai système, on utiliserait Prophet ici sur les données de TimescaleDB
-    hsi_futur = round(random.uniform(10.0, 85.0), 1)
-    
-    # 2. Détermination du jour critique
-    jours_avant_stress = random.randint(1, 7)
-    date_critique = (datetime.now() + timedelta(days=jours_avant_stress)).strftime("%d/%m/%Y")
+    if model not in MODELS:
+        raise HTTPException(status_code=422, detail=f"Modèle inconnu : {model} (attendu : {', '.join(MODELS)})")
+    sensor_id = config.FORECAST_SENSOR_ID.format(parcelle_id=parcelle_id)
+    try:
+        forecast, model_name, version = engine.forecast(sensor_id, model, 24 * config.FORECAST_DAYS)
+    except ModelNotFound as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except ValueError as exc:
+        # Pas assez de mesures récentes pour amorcer la prévision
+        raise HTTPException(status_code=409, detail=str(exc))
+
+    # 1. Moyenne journalière de l'humidité prévue, convertie en indice de stress
+    journalier = forecast.groupby(forecast['ds'].dt.date)['yhat'].mean()
+    previsions = [
+        {"date": jour.strftime("%d/%m/%Y"), "humidite_prevue": round(float(humidite), 1),
+         "hsi": round(indice_stress(humidite), 1)}
+        for jour, humidite in journalier.items()
+    ]
+    pire_jour = max(previsions, key=lambda jour: jour["hsi"])
+    hsi_futur = pire_jour["hsi"]
+
+    # 2. Détermination du jour critique : premier jour en stress, sinon le plus sec
+    date_critique = next((jour["date"] for jour in previsions if jour["hsi"] > 60), pire_jour["date"])
 
     tendance = "Stable"
     if hsi_futur > 60:
@@ -27,16 +53,19 @@ def get_forecast(parcelle_id: str, db: Session = Depends(get_db)):
         message = f"Risque de stress hydrique élevé prévu pour le {date_critique}"
     elif hsi_futur < 30:
         tendance = "Favorable"
-        message = "Conditions optimales prévues pour les 7 prochains jours"
+        message = f"Conditions optimales prévues pour les {config.FORECAST_DAYS} prochains jours"
     else:
         message = "Vigilance modérée sur l'évapotranspiration"
 
     return {
         "parcelle_id": parcelle_id,
-        "forecast_period": "7 jours",
+        "sensor_id": sensor_id,
+        "forecast_period": f"{config.FORECAST_DAYS} jours",
         "hsi_forecast": hsi_futur,
         "tendance": tendance,
         "date_critique": date_critique,
         "conseil_anticipatif": message,
-        "modele_utilise": "LSTM / Prophet (Simulation)"
-    }
\ No newline at end of file
+        "modele_utilise": model_name,
+        "modele_version": version,
+        "previsions": previsions,
+    }
@@ -1,3 +1,4 @@
+import io
 import torch
 import torch.nn as nn
 import numpy as np
@@ -5,109 +6,289 @@ import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 from app.database import get_sensor_data
 
+# Taille de la fenêtre glissante : 24 heures d'historique pour deviner l'heure suivante
+TRAIN_WINDOW = 24
+FEATURE_RANGE = (-1, 1)
+
 # --- 1. LE CERVEAU (Architecture du Réseau de Neurones) ---
 class LSTMModel(nn.Module):
     def __init__(self, input_size=1, hidden_layer_size=50, output_size=1):
         super().__init__()
         self.hidden_layer_size = hidden_layer_size
-        # La couche LSTM (Mémoire à long terme)
-        self.lstm = nn.LSTM(input_size, hidden_layer_size)
+        # La couche LSTM (Mémoire à long terme), entrées rangées (lot, temps, variables)
+        self.lstm = nn.LSTM(input_size, hidden_layer_size, batch_first=True)
         # La couche linéaire (Pour donner la réponse finale)
         self.linear = nn.Linear(hidden_layer_size, output_size)
-        self.hidden_cell = (torch.zeros(1,1,self.hidden_layer_size),
-                            torch.zeros(1,1,self.hidden_layer_size))
 
     def forward(self, input_seq):
-        lstm_out, self.hidden_cell = self.lstm(input_seq.view(len(input_seq) ,1, -1), self.hidden_cell)
-        predictions = self.linear(lstm_out.view(len(input_seq), -1))
-        return predictions[-1]
+        """`input_seq` : (lot, fenêtre) ou (lot, fenêtre, 1) ; renvoie les `output_size`
+        valeurs suivantes, (lot, output_size).
+
+        L'état caché part de zéro pour chaque fenêtre (état par défaut de nn.LSTM).
+        """
+        if input_seq.dim() == 2:
+            input_seq = input_seq.unsqueeze(-1)
+        lstm_out, _ = self.lstm(input_seq)
+        return self.linear(lstm_out[:, -1])
+
+def sliding_windows(series, window, horizon=1):
+    """Fenêtres (entrée, cible) de `series` sans copie : vues décalées du même tenseur.
+
+    Renvoie `inputs` (N, window) et `labels` (N, horizon) avec N = len(series) - window - horizon + 1.
+    """
+    windows = series.unfold(0, window + horizon, 1)
+    return windows[:, :window], windows[:, window:]
+
+# --- 2. ENTRAÎNEMENT (hors ligne, voir app/train.py) ---
+def fit_lstm(series, epochs=50, batch_size=64, lr=0.005, patience=5, validation_split=0.1, num_threads=None, seed=0,
+             horizon=1, init_state=None):
+    """Entraîne le réseau par mini-lots sur une série déjà normalisée (tenseur 1D).
+
+    Avec `horizon` > 1, le réseau prédit directement les `horizon` valeurs suivantes
+    en une passe (prévision multi-horizon) au lieu de la seule valeur suivante.
+    `init_state` (poids d'un modèle précédent) démarre l'entraînement à chaud.
+
+    Les dernières `validation_split` fenêtres (les plus récentes) servent à la
+    validation, séparées de l'entraînement par `horizon` fenêtres pour que leurs
+    cibles ne se chevauchent pas : l'entraînement s'arrête après `patience` époques
+    sans amélioration et le modèle garde les poids de la meilleure époque. Renvoie
+    (modèle, historique), l'historique listant par époque la perte d'entraînement et
+    de validation.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    torch.manual_seed(seed)
+
+    inputs, labels = sliding_windows(series, TRAIN_WINDOW, horizon)
+    n_val = int(len(inputs) * validation_split) if len(inputs) > 1 else 0
+    # Les cibles des `horizon` dernières fenêtres d'entraînement chevaucheraient celles
+    # de la validation : elles sont écartées pour que la validation reste inédite
+    if n_val and len(inputs) - n_val - horizon < 1:
+        n_val = 0
+    n_train = len(inputs) - n_val - (horizon if n_val else 0)
+    train_x, train_y = inputs[:n_train], labels[:n_train]
+    val_x, val_y = inputs[len(inputs) - n_val:], labels[len(inputs) - n_val:]
+
+    model = LSTMModel(output_size=horizon)
+    if init_state is not None:
+        model.load_state_dict(init_state)
+    loss_function = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+
+    history = []
+    best_loss, best_state, stale = float('inf'), None, 0
+    for epoch in range(epochs):
+        model.train()
+        train_loss = 0.0
+        for batch in torch.randperm(n_train).split(batch_size):
+            optimizer.zero_grad()
+            single_loss = loss_function(model(train_x[batch]), train_y[batch])
+            single_loss.backward()
+            optimizer.step()
+            train_loss += single_loss.item() * len(batch)
+        train_loss /= n_train
+
+        model.eval()
+        with torch.inference_mode():
+            val_loss = loss_function(model(val_x), val_y).item() if n_val else train_loss
+        history.append((train_loss, val_loss))
+        print(f"   - Époque {epoch+1}/{epochs} : perte {train_loss:.5f}, validation {val_loss:.5f}")
+
+        if val_loss < best_loss:
+            best_loss, stale = val_loss, 0
+            best_state = {name: value.clone() for name, value in model.state_dict().items()}
+        else:
+            stale += 1
+            if stale >= patience:
+                print(f"[LSTM] Arrêt anticipé : pas d'amélioration depuis {patience} époques.")
+                break
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    model.eval()
+    return model, history
+
+def train_lstm(df, epochs=50, batch_size=64, patience=5, num_threads=None, horizon=1):
+    """Entraîne le réseau sur l'historique `df` (colonnes time, soil_humidity).
+
+    `horizon` : nombre d'heures prédites par passe (1 : prévision pas à pas).
+
+    Renvoie l'artefact sérialisé (poids + paramètres de normalisation), ou None si
+    l'historique est trop court.
+    """
+    # On ne garde que l'humidité (C'est ce qu'on veut prédire)
+    data = df['soil_humidity'].values.astype(float)
+    if len(data) < TRAIN_WINDOW + horizon:
+        return None
+
+    # B. Normalisation (Mise à l'échelle entre -1 et 1)
+    # Les réseaux de neurones détestent les grands nombres comme "55.4"
+    scaler = MinMaxScaler(feature_range=FEATURE_RANGE)
+    data_normalized = torch.FloatTensor(scaler.fit_transform(data.reshape(-1, 1))).view(-1)
+
+    print(f"[LSTM] Apprentissage en cours (jusqu'à {epochs} époques, lots de {batch_size}, horizon {horizon} h)...")
+    model, _ = fit_lstm(data_normalized, epochs=epochs, batch_size=batch_size, patience=patience,
+                        num_threads=num_threads, horizon=horizon)
+
+    return _serialize(model, TRAIN_WINDOW, horizon, float(scaler.data_min_[0]), float(scaler.data_max_[0]))
+
+def finetune_lstm(artifact, df, epochs=10, batch_size=64, patience=3, num_threads=None, lr=0.001):
+    """Réentraînement à chaud : repart des poids de `artifact` et les ajuste sur `df`.
+
+    `df` ne contient que l'historique récent (nouvelles mesures et quelques jours
+    avant) : le coût ne dépend plus de l'âge des données. La normalisation du modèle
+    précédent est conservée ; renvoie None si `df` est trop court ou sort de ses
+    bornes (un réentraînement complet est alors nécessaire).
+    """
+    checkpoint = torch.load(io.BytesIO(artifact), map_location='cpu', weights_only=True)
+    horizon, train_window = checkpoint.get('horizon', 1), checkpoint['train_window']
+    data = df['soil_humidity'].values.astype(float)
+    if len(data) < train_window + horizon + 1:
+        return None
+    data_min, data_max = checkpoint['data_min'], checkpoint['data_max']
+    if data.min() < data_min or data.max() > data_max:
+        return None
+
+    scaler = MinMaxScaler(feature_range=FEATURE_RANGE).fit(np.array([[data_min], [data_max]]))
+    data_normalized = torch.FloatTensor(scaler.transform(data.reshape(-1, 1))).view(-1)
+    print(f"[LSTM] Réentraînement à chaud sur {len(data)} mesures (jusqu'à {epochs} époques)...")
+    model, _ = fit_lstm(data_normalized, epochs=epochs, batch_size=batch_size, lr=lr, patience=patience,
+                        num_threads=num_threads, horizon=horizon, init_state=checkpoint['state_dict'])
+    return _serialize(model, train_window, horizon, data_min, data_max)
+
+def _serialize(model, train_window, horizon, data_min, data_max):
+    # F. Sérialisation : les poids et les bornes du scaler suffisent à refaire l'inférence
+    buffer = io.BytesIO()
+    torch.save({
+        'state_dict': model.state_dict(),
+        'hidden_layer_size': model.hidden_layer_size,
+        'train_window': train_window,
+        'horizon': horizon,
+        'data_min': data_min,
+        'data_max': data_max,
+    }, buffer)
+    return buffer.getvalue()
+
+# --- 3. INFÉRENCE (à chaque requête, sur un modèle déjà chargé) ---
+def _rollout(step, window, hours):
+    """Enchaîne les passes du réseau jusqu'à couvrir `hours` heures.
+
+    `step` prend des fenêtres (lot, fenêtre) et renvoie les valeurs suivantes (lot, horizon) :
+    une seule passe suffit quand l'horizon du modèle couvre la période demandée, sinon
+    chaque passe repart des dernières valeurs prédites.
+    """
+    size = window.shape[1]
+    outputs, produced = [], 0
+    with torch.inference_mode():
+        while produced < hours:
+            predicted = step(window)
+            outputs.append(predicted)
+            produced += predicted.shape[1]
+            window = torch.cat((window, predicted), dim=1)[:, -size:]
+    return torch.cat(outputs, dim=1)[:, :hours]
+
+def _stacked_forward(weights, inputs):
+    """LSTMModel.forward de S modèles différents en un seul calcul.
+
+    `weights` : poids des S modèles empilés (dimension 0) ; `inputs` : (S, fenêtre), la
+    ligne i passant par le modèle i. Les portes suivent l'ordre de nn.LSTM (i, f, g, o).
+    """
+    n, hidden = inputs.shape[0], weights['lstm.weight_hh_l0'].shape[2]
+    bias = (weights['lstm.bias_ih_l0'] + weights['lstm.bias_hh_l0']).unsqueeze(-1)
+    h = inputs.new_zeros(n, hidden, 1)
+    c = inputs.new_zeros(n, hidden, 1)
+    for t in range(inputs.shape[1]):
+        gates = torch.baddbmm(bias, weights['lstm.weight_hh_l0'], h)
+        gates += weights['lstm.weight_ih_l0'] * inputs[:, t].view(n, 1, 1)
+        i, f, g, o = gates.chunk(4, dim=1)
+        c = torch.sigmoid(f) * c + torch.sigmoid(i) * torch.tanh(g)
+        h = torch.sigmoid(o) * torch.tanh(c)
+    return torch.baddbmm(weights['linear.bias'].unsqueeze(-1), weights['linear.weight'], h).squeeze(-1)
+
+def _future_dates(history, hours):
+    last_date = pd.to_datetime(history['time'].iloc[-1])
+    return pd.date_range(start=last_date + pd.Timedelta(hours=1), periods=hours, freq='h')
+
+class LSTMForecaster:
+    """Modèle LSTM chargé depuis un artefact, prêt pour l'inférence.
+
+    Le modèle ne garde aucun état entre deux appels : une même instance sert plusieurs
+    requêtes en parallèle.
+    """
+    name = "LSTM_PyTorch"
+
+    def __init__(self, artifact):
+        checkpoint = torch.load(io.BytesIO(artifact), map_location='cpu', weights_only=True)
+        # Les artefacts antérieurs au multi-horizon prédisent une heure par passe
+        self.horizon = checkpoint.get('horizon', 1)
+        self.model = LSTMModel(hidden_layer_size=checkpoint['hidden_layer_size'], output_size=self.horizon)
+        self.model.load_state_dict(checkpoint['state_dict'])
+        self.model.eval()
+        self.train_window = checkpoint['train_window']
+        # Le scaler est reconstruit à partir des bornes vues à l'entraînement
+        self.scaler = MinMaxScaler(feature_range=FEATURE_RANGE)
+        self.scaler.fit(np.array([[checkpoint['data_min']], [checkpoint['data_max']]]))
+
+    def _context(self, history):
+        if len(history) < self.train_window:
+            raise ValueError(f"{self.train_window} mesures nécessaires, {len(history)} disponibles")
+        return history['soil_humidity'].values[-self.train_window:].astype(float)
+
+    def predict(self, history, hours):
+        """Prévision heure par heure après la dernière mesure de `history` (time, soil_humidity)."""
+        values = self._context(history)
+        window = torch.FloatTensor(self.scaler.transform(values.reshape(-1, 1))).view(1, -1)
+        predictions = _rollout(self.model, window, hours).numpy()
+
+        # G. Dénormalisation (Revenir aux vraies valeurs d'humidité)
+        actual_predictions = self.scaler.inverse_transform(predictions.reshape(-1, 1))
+        return pd.DataFrame({'ds': _future_dates(history, hours), 'yhat': actual_predictions.flatten()})
 
-# --- 2. LA FONCTION PRINCIPALE ---
+def predict_batch(forecasters, histories, hours):
+    """Prévisions de plusieurs capteurs, chacun avec son modèle, en un seul lot de tenseurs.
+
+    `forecasters` et `histories` sont alignés (un modèle et un historique par capteur).
+    Les modèles de même forme (fenêtre, horizon, taille cachée) sont empilés et
+    calculés ensemble ; renvoie les DataFrames (ds, yhat) dans l'ordre des entrées.
+    """
+    groups = {}
+    for position, forecaster in enumerate(forecasters):
+        shape = (forecaster.train_window, forecaster.horizon, forecaster.model.hidden_layer_size)
+        groups.setdefault(shape, []).append(position)
+
+    results = [None] * len(forecasters)
+    for (train_window, _, _), positions in groups.items():
+        members = [forecasters[i] for i in positions]
+        states = [member.model.state_dict() for member in members]
+        weights = {name: torch.stack([state[name] for state in states]) for name in states[0]}
+        # Normalisation propre à chaque capteur : x * scale_ + min_ (MinMaxScaler)
+        scale = torch.FloatTensor([member.scaler.scale_[0] for member in members]).view(-1, 1)
+        offset = torch.FloatTensor([member.scaler.min_[0] for member in members]).view(-1, 1)
+        values = np.stack([member._context(histories[i]) for member, i in zip(members, positions)])
+        window = torch.FloatTensor(values) * scale + offset
+        predictions = ((_rollout(lambda w: _stacked_forward(weights, w), window, hours) - offset) / scale).numpy()
+        for row, i in enumerate(positions):
+            results[i] = pd.DataFrame({'ds': _future_dates(histories[i], hours), 'yhat': predictions[row]})
+    return results
+
+# --- 4. LA FONCTION PRINCIPALE (entraînement + prédiction d'un coup) ---
 def run_lstm_model(sensor_id, days_to_predict=7):
     print(f"[LSTM] Démarrage du réseau de neurones pour {sensor_id}...")
-    
+
     # A. Récupération des données
     df = get_sensor_data(sensor_id)
     if df.empty:
         return None
-    
-    # On ne garde que l'humidité (C'est ce qu'on veut prédire)
-    data = df['soil_humidity'].values.astype(float)
-    
-    # B. Normalisation (Mise à l'échelle entre -1 et 1)
-    # Les réseaux de neurones détestent les grands nombres comme "55.4"
-    scaler = MinMaxScaler(feature_range=(-1, 1))
-    data_normalized = scaler.fit_transform(data.reshape(-1, 1))
-    data_normalized = torch.FloatTensor(data_normalized).view(-1)
-    
-    # C. Préparation de l'entraînement
-    # On découpe l'historique en petits morceaux de 24h pour apprendre
-    train_window = 24
-    def create_inout_sequences(input_data, tw):
-        inout_seq = []
-        L = len(input_data)
-        for i in range(L-tw):
-            train_seq = input_data[i:i+tw]
-            train_label = input_data[i+tw:i+tw+1]
-            inout_seq.append((train_seq ,train_label))
-        return inout_seq
-
-    train_inout_seq = create_inout_sequences(data_normalized, train_window)
-
-    # D. Initialisation du Modèle
-    model = LSTMModel()
-    loss_function = nn.MSELoss()
-    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
-    
-    # E. Entraînement (Training)
-    epochs = 3 # On met 3 tours pour que ce soit rapide à tester (mets 50 pour le vrai projet)
-    print(f"[LSTM] Apprentissage en cours ({epochs} époques)...")
-    
-    for i in range(epochs):
-        for seq, labels in train_inout_seq:
-            optimizer.zero_grad()
-            model.hidden_cell = (torch.zeros(1, 1, model.hidden_layer_size),
-                            torch.zeros(1, 1, model.hidden_layer_size))
-            
-            y_pred = model(seq)
-            single_loss = loss_function(y_pred, labels)
-            single_loss.backward()
-            optimizer.step()
-        
-        if i%1 == 0:
-            print(f"   - Époque {i+1}/{epochs} terminée.")
 
-    # F. Prédiction (Forecasting)
+    artifact = train_lstm(df, horizon=24 * days_to_predict)
+    if artifact is None:
+        return None
+
     print(f"[LSTM] Prédiction des {days_to_predict} prochains jours...")
-    fut_pred = 24 * days_to_predict # 7 jours * 24 heures
-    
-    # On prend les 24 dernières heures connues pour commencer à deviner
-    test_inputs = data_normalized[-train_window:].tolist()
-    
-    model.eval()
-    for i in range(fut_pred):
-        seq = torch.FloatTensor(test_inputs[-train_window:])
-        with torch.no_grad():
-            model.hidden_cell = (torch.zeros(1, 1, model.hidden_layer_size),
-                            torch.zeros(1, 1, model.hidden_layer_size))
-            test_inputs.append(model(seq).item())
-
-    # G. Dénormalisation (Revenir aux vraies valeurs d'humidité)
-    actual_predictions = scaler.inverse_transform(np.array(test_inputs[train_window:] ).reshape(-1, 1))
-    
-    # Création du tableau de résultat avec les dates futures
-    last_date = pd.to_datetime(df['time'].iloc[-1])
-    future_dates = pd.date_range(start=last_date, periods=fut_pred, freq='h')
-    
-    result_df = pd.DataFrame({
-        'ds': future_dates,
-        'yhat': actual_predictions.flatten()
-    })
-    
-    return result_df
+    return LSTMForecaster(artifact).predict(df, 24 * days_to_predict)
 
 # --- BLOC DE TEST ---
 if __name__ == "__main__":
     result = run_lstm_model('capteur_parcelle_A', days_to_predict=1) # Juste 1 jour pour tester vite
     print("\n--- RÉSULTAT LSTM (PYTORCH) ---")
-    print(result.head())
\ No newline at end of file
+    print(result.head())
@@ -1,42 +1,100 @@
 import pandas as pd
 from prophet import Prophet
+from prophet.serialize import model_from_json, model_to_json
 from app.database import get_sensor_data
 import logging
 
 # On rend Prophet un peu moins bavard dans la console
 logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
 
-def run_prophet_model(sensor_id, days_to_predict=7):
-    print(f"[Prophet] Entraînement en cours pour {sensor_id}...")
+# --- ENTRAÎNEMENT (hors ligne, voir app/train.py) ---
+def train_prophet(df):
+    """Entraîne Prophet sur l'historique `df` (colonnes time, soil_humidity).
 
-    # 1. Récupération des données depuis la BDD
-    df = get_sensor_data(sensor_id)
-    
+    Renvoie l'artefact sérialisé (JSON de Prophet), ou None si l'historique est vide.
+    """
     if df.empty:
-        print("Aucune donnée trouvée !")
         return None
 
-    # 2. Préparation pour Prophet
     # Prophet est très strict : il veut deux colonnes nommées exactement 'ds' (date) et 'y' (valeur)
     # Le .dt.tz_localize(None) sert à retirer le fuseau horaire qui gêne parfois Prophet
-    df['time'] = pd.to_datetime(df['time']).dt.tz_localize(None)
-    
-    training_data = df.rename(columns={'time': 'ds', 'soil_humidity': 'y'})
+    training_data = pd.DataFrame({
+        'ds': pd.to_datetime(df['time']).dt.tz_localize(None),
+        'y': df['soil_humidity'].values,
+    })
 
-    # 3. Création et Entraînement du modèle
     model = Prophet(daily_seasonality=True) # On lui dit que l'humidité change chaque jour (cycle jour/nuit)
     model.fit(training_data)
+    return model_to_json(model).encode()
 
-    # 4. Prédiction
-    print(f"[Prophet] Calcul des prévisions sur {days_to_predict} jours...")
-    future = model.make_future_dataframe(periods=days_to_predict, freq='h') # 'h' pour heures
-    forecast = model.predict(future)
+def _warm_start_params(model):
+    """Paramètres ajustés d'un modèle Prophet, au format attendu par fit(init=...)."""
+    return {
+        'k': model.params['k'][0][0],
+        'm': model.params['m'][0][0],
+        'sigma_obs': model.params['sigma_obs'][0][0],
+        'delta': model.params['delta'][0],
+        'beta': model.params['beta'][0],
+    }
+
+def warm_start_prophet(artifact, df):
+    """Réentraînement à chaud : l'optimisation repart des paramètres de `artifact`.
+
+    Prophet a besoin de tout l'historique pour sa tendance, mais converge en bien
+    moins d'itérations qu'en partant de zéro.
+    """
+    if df.empty:
+        return None
+    previous = model_from_json(artifact.decode())
+    training_data = pd.DataFrame({
+        'ds': pd.to_datetime(df['time']).dt.tz_localize(None),
+        'y': df['soil_humidity'].values,
+    })
+    model = Prophet(daily_seasonality=True)
+    model.fit(training_data, init=_warm_start_params(previous))
+    return model_to_json(model).encode()
+
+# --- INFÉRENCE (à chaque requête, sur un modèle déjà chargé) ---
+class ProphetForecaster:
+    """Modèle Prophet chargé depuis un artefact, prêt pour l'inférence."""
+    name = "Prophet"
+
+    def __init__(self, artifact):
+        self.model = model_from_json(artifact.decode())
+        # Seul yhat est utilisé : on saute l'échantillonnage des intervalles d'incertitude,
+        # qui représente l'essentiel du temps de predict()
+        self.model.uncertainty_samples = 0
+        self.last_date = self.model.history['ds'].max()
+
+    def predict(self, history, hours):
+        """Prévision heure par heure après la dernière mesure connue.
 
-    # 5. On ne garde que la fin (les jours futurs)
-    # On retourne juste la date (ds) et la prédiction (yhat)
-    future_forecast = forecast.tail(days_to_predict * 24)[['ds', 'yhat']]
-    
-    return future_forecast
+        `history` est facultatif : Prophet n'a besoin que des dates à prédire. Sans
+        historique, la prévision démarre après la fin des données d'entraînement.
+        """
+        last_date = self.last_date
+        if history is not None and not history.empty:
+            last_date = pd.to_datetime(history['time'].iloc[-1]).tz_localize(None)
+        future = pd.DataFrame({
+            'ds': pd.date_range(start=last_date + pd.Timedelta(hours=1), periods=hours, freq='h'),
+        })
+        return self.model.predict(future)[['ds', 'yhat']]
+
+# --- LA FONCTION PRINCIPALE (entraînement + prédiction d'un coup) ---
+def run_prophet_model(sensor_id, days_to_predict=7):
+    print(f"[Prophet] Entraînement en cours pour {sensor_id}...")
+
+    # 1. Récupération des données depuis la BDD
+    df = get_sensor_data(sensor_id)
+
+    if df.empty:
+        print("Aucune donnée trouvée !")
+        return None
+
+    artifact = train_prophet(df)
+
+    print(f"[Prophet] Calcul des prévisions sur {days_to_predict} jours...")
+    return ProphetForecaster(artifact).predict(None, days_to_predict * 24)
 
 # --- BLOC DE TEST ---
 # Ce code ne s'exécute que si tu lances le fichier directement
@@ -44,4 +102,4 @@ if __name__ == "__main__":
     result = run_prophet_model('capteur_parcelle_A')
     print("\n--- RÉSULTAT DU TEST ---")
     print(result.head()) # Affiche les 5 premières prédictions
-    print("...")
\ No newline at end of file
+    print("...")
@@ -0,0 +1,46 @@
+"""Entraînement hors ligne des modèles de prévision.
+
+    python -m app.train                       # tous les capteurs, tous les modèles
+    python -m app.train --sensor capteur_parcelle_A --model lstm --full
+
+Les modèles sont mis à jour de façon incrémentale (voir forecasting.update), ou
+entièrement réentraînés avec --full. Chaque modèle entraîné est publié comme
+nouvelle version dans le stockage d'artefacts ; l'API la sert dès qu'elle relit le
+pointeur LATEST.
+"""
+import argparse
+import logging
+
+from app import forecasting
+from app.artifacts import get_store
+from app.database import get_sensor_data, list_sensors
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+logger = logging.getLogger("prevision.train")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensor", action="append", help="capteur à entraîner (répétable ; défaut : tous)")
+    parser.add_argument("--model", action="append", choices=forecasting.MODELS, help="modèle (répétable ; défaut : tous)")
+    parser.add_argument("--full", action="store_true", help="réentraînement complet, même sans nouvelles mesures")
+    args = parser.parse_args()
+
+    store = get_store()
+    for sensor_id in args.sensor or list_sensors():
+        for model in args.model or forecasting.MODELS:
+            try:
+                result = forecasting.update(
+                    store, sensor_id, model, lambda start: get_sensor_data(sensor_id, start), force_full=args.full
+                )
+            except ValueError as exc:
+                logger.warning("%s : %s ignoré (%s)", sensor_id, model, exc)
+                continue
+            logger.info(
+                "%s : %s %s, version %s (%d nouvelles mesures, %.1f s)",
+                sensor_id, model, result.action, result.version, result.new_points, result.fit_s,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Latence de GET /parcelle/{id} avec des modèles entraînés hors ligne.
+
+Entraîne LSTM et Prophet sur 60 jours de mesures horaires synthétiques (comme
+app/seed_data.py), publie les artefacts dans un dossier temporaire, puis mesure la
+requête complète (résolution de version, cache LRU, inférence 7 jours, JSON) via
+le TestClient FastAPI. Les dernières mesures sont servies depuis la mémoire : la
+lecture SQL indexée des 24 dernières mesures n'est pas comptée.
+
+    cd services/prevision_eau
+    PYTHONPATH=../common python benchmarks/bench_forecast.py --requests 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def make_history(days):
+    dates = pd.date_range(end=pd.Timestamp.now(tz="UTC").floor("h"), periods=days * 24, freq="h")
+    hours = np.arange(len(dates))
+    # Cycle jour/nuit + assèchement lent + bruit
+    humidity = 55 + 10 * np.sin(2 * np.pi * hours / 24) - hours / len(dates) * 15 + np.random.normal(0, 2, len(dates))
+    return pd.DataFrame({"time": dates, "soil_humidity": humidity})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--days", type=int, default=60, help="jours d'historique d'entraînement")
+    args = parser.parse_args()
+
+    os.environ["FORECAST_ARTIFACT_STORE"] = "local"
+    os.environ["FORECAST_ARTIFACT_DIR"] = tempfile.mkdtemp(prefix="forecast-artifacts-")
+
+    from fastapi.testclient import TestClient
+
+    from app import forecasting, main as api
+    from app.artifacts import get_store
+
+    history = make_history(args.days)
+    store = get_store()
+    sensor_id = api.config.FORECAST_SENSOR_ID.format(parcelle_id="A")
+    for model in forecasting.MODELS:
+        started = time.perf_counter()
+        forecasting.train(store, sensor_id, model, history)
+        print(f"entraînement {model:>7} : {time.perf_counter() - started:6.1f} s ({len(history)} mesures)")
+
+    api.engine.recent_history = lambda sensor, points: history.tail(points)
+    client = TestClient(api.app)
+    print(f"{'modèle':>7} | {'1re requête':>11} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7}")
+    for model in forecasting.MODELS:
+        started = time.perf_counter()
+        response = client.get("/parcelle/A", params={"model": model})
+        response.raise_for_status()
+        cold = time.perf_counter() - started
+        latencies = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            client.get("/parcelle/A", params={"model": model}).raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{model:>7} | {cold * 1000:>8.0f} ms | {p50:>7.1f} | {p95:>7.1f} | {p99:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Calcul épargné par les mises à jour incrémentales (forecasting.update) vs réentraînements complets.
+
+Simule --days-live jours de production sur un capteur : après un entraînement
+complet initial sur --days jours, de nouvelles mesures arrivent toutes les heures
+et les modèles sont mis à jour à chaque arrivée, avec une rupture de niveau (sol
+irrigué) au milieu. Deux politiques voient les mêmes données :
+
+- « complet » : réentraînement complet à chaque mise à jour (l'ancien comportement) ;
+- « incrémental » : forecasting.update (rien tant qu'il y a moins de
+  FORECAST_RETRAIN_MIN_POINTS nouvelles mesures et pas de dérive, sinon à chaud).
+
+On compare le temps d'entraînement cumulé et l'erreur moyenne des prévisions des
+24 heures suivant chaque mise à jour.
+
+    cd services/prevision_eau
+    PYTHONPATH=../common python benchmarks/bench_incremental.py --model lstm --days-live 3 --every 6
+"""
+import argparse
+import contextlib
+import io
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import forecasting  # noqa: E402
+from app.artifacts import LocalArtifactStore  # noqa: E402
+
+logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+logging.getLogger("prophet").setLevel(logging.WARNING)
+
+
+def make_history(hours, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=pd.Timestamp("2026-06-01", tz="UTC"), periods=hours, freq="h")
+    t = np.arange(hours)
+    humidity = 55 + 10 * np.sin(2 * np.pi * t / 24) - (t % (24 * 30)) / (24 * 30) * 15 + rng.normal(0, 2, hours)
+    return pd.DataFrame({"time": dates, "soil_humidity": humidity})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", choices=forecasting.MODELS, default="lstm")
+    parser.add_argument("--days", type=int, default=60, help="historique du premier entraînement")
+    parser.add_argument("--days-live", type=int, default=3, help="jours simulés après l'entraînement initial")
+    parser.add_argument("--every", type=int, default=1, help="heures entre deux mises à jour")
+    args = parser.parse_args()
+
+    initial = args.days * 24
+    live = args.days_live * 24
+    data = make_history(initial + live + 24)
+    # Rupture de niveau au milieu de la période simulée (irrigation) : à détecter comme dérive
+    shift_at = initial + live // 2
+    data.loc[shift_at:, "soil_humidity"] += 12
+
+    stores = {policy: LocalArtifactStore(tempfile.mkdtemp(prefix=f"bench-{policy}-")) for policy in ("complet", "incrémental")}
+    totals = {policy: {"fit_s": 0.0, "errors": [], "actions": {}} for policy in stores}
+    sensor_id = "capteur_bench"
+
+    for end in range(initial, initial + live + 1, args.every):
+        seen = data.iloc[:end]
+        actual = data["soil_humidity"].values[end:end + 24]
+
+        def load_history(start):
+            return seen if start is None else seen[seen["time"] >= start]
+
+        for policy, store in stores.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                result = forecasting.update(store, sensor_id, args.model, load_history, force_full=policy == "complet")
+                elapsed = time.perf_counter() - started
+            forecast = result.forecaster.predict(result.history, 24)["yhat"].values
+            total = totals[policy]
+            total["fit_s"] += result.fit_s
+            total["errors"].append(float(np.mean(np.abs(forecast - actual))))
+            total["actions"][result.action] = total["actions"].get(result.action, 0) + 1
+            if policy == "incrémental" and result.action != "skip":
+                hour = end - initial
+                print(f"  h+{hour:<3} {result.action:<4} {result.new_points:>3} nouvelles mesures, "
+                      f"dérive {result.drift if result.drift is None else round(result.drift, 2)}, "
+                      f"entraînement {result.fit_s:.2f} s (complet estimé {result.full_estimate_s:.2f} s), "
+                      f"mise à jour {elapsed:.2f} s")
+
+    print()
+    print(f"{args.model}, {initial} mesures initiales, {live // args.every + 1} mises à jour sur {args.days_live} jours "
+          f"(toutes les {args.every} h), rupture de +12 points à h+{shift_at - initial}")
+    print(f"{'politique':>12} | {'entraînement s':>14} | {'erreur 24 h':>11} | mises à jour")
+    for policy, total in totals.items():
+        actions = ", ".join(f"{count} {action}" for action, count in sorted(total["actions"].items()))
+        print(f"{policy:>12} | {total['fit_s']:>14.1f} | {np.mean(total['errors']):>11.2f} | {actions}")
+    saved = 1 - totals["incrémental"]["fit_s"] / totals["complet"]["fit_s"]
+    print(f"calcul épargné : {100 * saved:.0f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Prévision LSTM multi-horizon directe vs pas à pas, et inférence par lot sur N capteurs.
+
+1. Entraîne sur la même série synthétique (60 jours horaires moins les 7 derniers,
+   gardés pour le test) un LSTM pas à pas (horizon 1, 168 passes pour 7 jours) et
+   un LSTM direct (horizon 168, une passe), et compare leur erreur sur les 7 jours
+   de test et leur latence.
+2. Prévoit 7 jours pour --sensors capteurs (un modèle par capteur : le modèle direct
+   aux poids légèrement bruités, avec une normalisation et un historique propres) :
+   une boucle de predict() par capteur vs predict_batch() en un seul lot, résultats
+   comparés.
+
+    cd services/prevision_eau
+    PYTHONPATH=../common python benchmarks/bench_lstm_horizon.py --sensors 500
+"""
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.model_lstm import LSTMForecaster, predict_batch, train_lstm  # noqa: E402
+
+HOURS = 7 * 24
+
+
+def make_history(days, seed=0, level=55.0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=pd.Timestamp.now(tz="UTC").floor("h"), periods=days * 24, freq="h")
+    hours = np.arange(len(dates))
+    humidity = level + 10 * np.sin(2 * np.pi * hours / 24) - hours / len(dates) * 15 + rng.normal(0, 2, len(dates))
+    return pd.DataFrame({"time": dates, "soil_humidity": humidity})
+
+
+def timed(function, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--sensors", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads")
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    history = make_history(args.days)
+    train, test = history.iloc[:-HOURS], history.iloc[-HOURS:]
+    print(f"{len(train)} mesures d'entraînement, {HOURS} de test, {torch.get_num_threads()} thread(s) torch")
+
+    models = {}
+    for label, horizon in (("pas à pas", 1), ("direct", HOURS)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            artifact, fit_time = timed(lambda: train_lstm(train, horizon=horizon))
+        forecaster = LSTMForecaster(artifact)
+        forecast, latency = timed(lambda: forecaster.predict(train, HOURS), repeat=20)
+        mae = float(np.mean(np.abs(forecast["yhat"].values - test["soil_humidity"].values)))
+        models[label] = (artifact, latency)
+        print(f"{label:>10} (horizon {horizon:>3}) : entraînement {fit_time:5.1f} s, "
+              f"prévision 7 j {latency * 1000:6.1f} ms, erreur absolue moyenne {mae:.2f} pts d'humidité")
+
+    # Un modèle et un historique par capteur
+    torch.manual_seed(0)
+    forecasters, histories = [], []
+    for i in range(args.sensors):
+        forecaster = LSTMForecaster(models["direct"][0])
+        with torch.no_grad():
+            for parameter in forecaster.model.parameters():
+                parameter.add_(torch.randn_like(parameter) * 0.01)
+        forecasters.append(forecaster)
+        histories.append(make_history(2, seed=i + 1, level=40 + i % 30))
+
+    looped, loop_time = timed(lambda: [f.predict(h, HOURS) for f, h in zip(forecasters, histories)])
+    batched, batch_time = timed(lambda: predict_batch(forecasters, histories, HOURS), repeat=3)
+    gap = max(float(np.max(np.abs(a["yhat"].values - b["yhat"].values))) for a, b in zip(looped, batched))
+    step_estimate = args.sensors * models["pas à pas"][1]
+    print()
+    print(f"{args.sensors} capteurs x 7 jours :")
+    print(f"  pas à pas, boucle par capteur (estimé) : {step_estimate:7.2f} s")
+    print(f"  direct, boucle par capteur             : {loop_time:7.2f} s")
+    print(f"  direct, predict_batch (un lot)         : {batch_time:7.2f} s")
+    print(f"  écart max boucle / lot                 : {gap:.2e} pts d'humidité")
+
+
+if __name__ == "__main__":
+    main()
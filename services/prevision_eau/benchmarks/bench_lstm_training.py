@@ -0,0 +1,114 @@
+"""Temps par époque et perte de validation : boucle LSTM échantillon par échantillon vs mini-lots.
+
+La boucle « historique » reproduit l'entraînement d'avant (liste de couples
+(fenêtre, cible), lot de 1, état caché remis à zéro à chaque pas, entrées
+(len, 1, -1)). Les deux boucles voient la même série normalisée et sont évaluées
+sur les mêmes fenêtres de validation (les 10 % les plus récentes).
+
+    cd services/prevision_eau
+    PYTHONPATH=../common python benchmarks/bench_lstm_training.py --legacy-epochs 3
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.model_lstm import TRAIN_WINDOW, LSTMModel, fit_lstm, sliding_windows  # noqa: E402
+
+
+def make_series(days, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = np.arange(days * 24)
+    humidity = 55 + 10 * np.sin(2 * np.pi * hours / 24) - hours / len(hours) * 15 + rng.normal(0, 2, len(hours))
+    # Même normalisation que train_lstm : [-1, 1]
+    scaled = 2 * (humidity - humidity.min()) / (humidity.max() - humidity.min()) - 1
+    return torch.FloatTensor(scaled)
+
+
+class LegacyLSTM(LSTMModel):
+    """Le modèle d'avant : LSTM (temps, lot, variables) avec un état caché en attribut."""
+
+    def __init__(self):
+        super().__init__()
+        self.lstm = nn.LSTM(1, self.hidden_layer_size)
+
+    def forward(self, input_seq):
+        hidden_cell = (torch.zeros(1, 1, self.hidden_layer_size), torch.zeros(1, 1, self.hidden_layer_size))
+        lstm_out, _ = self.lstm(input_seq.view(len(input_seq), 1, -1), hidden_cell)
+        return self.linear(lstm_out.view(len(input_seq), -1))[-1]
+
+
+def validation_loss(model, val_x, val_y, legacy):
+    model.eval()
+    with torch.inference_mode():
+        if legacy:
+            predictions = torch.stack([model(seq) for seq in val_x])
+        else:
+            predictions = model(val_x)
+    return nn.functional.mse_loss(predictions, val_y).item()
+
+
+def legacy_training(series, epochs, n_train):
+    torch.manual_seed(0)
+    inputs, labels = sliding_windows(series, TRAIN_WINDOW)
+    # La liste de couples (séquence, cible) construite par create_inout_sequences
+    train_inout_seq = [(inputs[i].clone(), labels[i].clone()) for i in range(n_train)]
+    model = LegacyLSTM()
+    loss_function = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+    times, losses = [], []
+    for _ in range(epochs):
+        model.train()
+        started = time.perf_counter()
+        for seq, label in train_inout_seq:
+            optimizer.zero_grad()
+            single_loss = loss_function(model(seq), label)
+            single_loss.backward()
+            optimizer.step()
+        times.append(time.perf_counter() - started)
+        losses.append(validation_loss(model, inputs[n_train:], labels[n_train:], legacy=True))
+    return times, losses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=60, help="jours de mesures horaires (60 j = 1 440 points)")
+    parser.add_argument("--legacy-epochs", type=int, default=3)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    series = make_series(args.days)
+    inputs, labels = sliding_windows(series, TRAIN_WINDOW)
+    n_train = len(inputs) - int(len(inputs) * 0.1)
+    print(f"{len(series)} points, {n_train} fenêtres d'entraînement, {len(inputs) - n_train} de validation, "
+          f"{torch.get_num_threads()} thread(s) torch")
+
+    legacy_times, legacy_losses = legacy_training(series, args.legacy_epochs, n_train)
+
+    started = time.perf_counter()
+    model, history = fit_lstm(series, epochs=args.epochs, batch_size=args.batch_size)
+    total = time.perf_counter() - started
+    batched_epoch = total / len(history)
+    batched_loss = validation_loss(model, inputs[n_train:], labels[n_train:], legacy=False)
+
+    legacy_epoch = float(np.mean(legacy_times))
+    print()
+    print(f"{'boucle':>18} | {'époques':>7} | {'s/époque':>8} | {'total s':>7} | {'perte validation':>16}")
+    print(f"{'échantillon x1':>18} | {len(legacy_times):>7} | {legacy_epoch:>8.3f} | {sum(legacy_times):>7.1f} | {legacy_losses[-1]:>16.5f}")
+    print(f"{f'mini-lots x{args.batch_size}':>18} | {len(history):>7} | {batched_epoch:>8.3f} | {total:>7.1f} | {batched_loss:>16.5f}")
+    print(f"époque x{legacy_epoch / batched_epoch:.0f} plus rapide ; 50 époques à l'ancienne ≈ {50 * legacy_epoch:.0f} s")
+    print("pertes de validation de la boucle historique par époque :", ", ".join(f"{loss:.5f}" for loss in legacy_losses))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from agro_common import metrics
+
 # --- CONFIGURATION DE LA CONNEXION ---
 # Explication des paramètres :
 # - admin:adminpassword -> Utilisateur et mot de passe définis dans docker-compose
@@ -16,6 +18,7 @@ SQLALCHEMY_DATABASE_URL = os.getenv(
 
 # Création du moteur SQLAlchemy pour PostgreSQL
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
+metrics.instrument_sqlalchemy(engine, pool="postgis")
 
 # Configuration de la session (utilisée par FastAPI)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -6,6 +6,7 @@ import random
 import httpx
 import logging
 
+from agro_common import metrics
 from app.database import engine, get_db
 from app import models
 
@@ -17,6 +18,7 @@ logger = logging.getLogger(__name__)
 models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="AgroTrace - Microservice Recommandation Irrigation")
+metrics.instrument_fastapi(app, "reco-irrigation")
 
 app.add_middleware(
     CORSMiddleware,
@@ -96,7 +98,7 @@ async def get_irrigation_status(parcelle_id: int, db: Session = Depends(get_db))
     reco_finale = "Analyse en cours..."
     
     try:
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient() as client, metrics.track("regles-agro", "analyser"):
             payload = {
                 "temperature": temp_simulee,
                 "humidite": hum_simulee,
@@ -9,12 +9,15 @@ import psycopg2
 from datetime import datetime
 from minio import Minio
 
+from agro_common import metrics
+
 try:
     from unet import UNet
 except ImportError:
     UNet = None
 
 app = FastAPI(title="Microservice VisionPlante", description="Analyse d'images UAV + Base de données réelle")
+metrics.instrument_fastapi(app, "vision-plante")
 
 DB_CONFIG = {
     "host": "agro_postgis",
@@ -31,7 +34,9 @@ def init_minio():
     global MINIO_CLIENT
     try:
         MINIO_CLIENT = Minio("minio:9000", access_key="minioadmin", secret_key="minioadmin", secure=False)
-        if not MINIO_CLIENT.bucket_exists(BUCKET_NAME):
+        with metrics.track("minio", "bucket_exists"):
+            exists = MINIO_CLIENT.bucket_exists(BUCKET_NAME)
+        if not exists:
             MINIO_CLIENT.make_bucket(BUCKET_NAME)
     except Exception:
         pass
@@ -66,10 +71,12 @@ async def get_vision_status(parcelle_id: int):
     statut = "Excellent"
     
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        with metrics.track("db", "connect"):
+            conn = psycopg2.connect(**DB_CONFIG)
         cur = conn.cursor()
-        cur.execute("SELECT sante_vegetale, ndvi FROM vision_results WHERE parcelle_id = %s", (parcelle_id,))
-        row = cur.fetchone()
+        with metrics.track("db", "SELECT"):
+            cur.execute("SELECT sante_vegetale, ndvi FROM vision_results WHERE parcelle_id = %s", (parcelle_id,))
+            row = cur.fetchone()
         if row:
             sante, ndvi = row[0], row[1]
         cur.close()
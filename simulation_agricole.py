@@ -1,9 +1,14 @@
-import json
+import os
+import sys
 import time
 import random
 from kafka import KafkaProducer
 from datetime import datetime
 
+# Codecs Kafka partagés avec l'API d'ingestion et le consumer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services', 'common'))
+from agro_common.codecs import TopicCodecs, parse_topic_codecs
+
 # --- CONFIGURATION ---
 KAFKA_BROKER = 'localhost:29092'
 TOPICS = {
@@ -12,6 +17,12 @@ TOPICS = {
     'lum': 'capteurs.luminosite'
 }
 
+# Même convention que l'API : KAFKA_DEFAULT_CODEC / KAFKA_TOPIC_CODECS
+CODECS = TopicCodecs(
+    parse_topic_codecs(os.getenv('KAFKA_TOPIC_CODECS', '')),
+    default=os.getenv('KAFKA_DEFAULT_CODEC', 'json'),
+)
+
 CAPTEURS = [
     {"id": "1", "nom": "Parcelle Nord"},
     {"id": "2", "nom": "Parcelle Sud"}
@@ -21,7 +32,6 @@ def get_producer():
     try:
         producer = KafkaProducer(
             bootstrap_servers=[KAFKA_BROKER],
-            value_serializer=lambda x: json.dumps(x).encode('utf-8'),
             retries=5
         )
         print(f"✅ Connecté à Kafka sur {KAFKA_BROKER}")
@@ -44,7 +54,7 @@ def simulate():
                 temp = round(random.uniform(20.0, 38.0), 2)
                 hum = round(random.uniform(25.0, 70.0), 2)
                 lum = round(random.uniform(5000, 50000), 1)
-                timestamp = datetime.now().isoformat()
+                timestamp = datetime.now()
 
                 # Construction des messages
                 messages = [
@@ -54,7 +64,8 @@ def simulate():
                 ]
 
                 for topic, data in messages:
-                    producer.send(topic, value=data)
+                    value, headers = CODECS.encode(topic, data)
+                    producer.send(topic, value=value, headers=headers)
 
                 status = "🔥 CHAUD" if temp > 35 else "🌤️ NORMAL"
                 print(f"📍 [{capteur['nom']}] {temp}°C ({status}) | Hum: {hum}%")